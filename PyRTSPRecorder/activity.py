@@ -0,0 +1,170 @@
+import os
+import re
+import math
+import sqlite3
+import logging
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from media_index import MediaIndex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FRAME_WIDTH = 64
+FRAME_HEIGHT = 36
+PIXEL_THRESHOLD = 25        # luma change that counts a pixel as changed
+ANALYZE_TIMEOUT = 120
+MAX_PENDING = 1000
+MAX_SPANS = 20
+PTS_TIME = re.compile(r'pts_time:\s*(-?[\d.]+)')
+
+
+def keyframe_command(path):
+    # Keyframes only, decoded straight to tiny gray frames; showinfo logs their timestamps
+    return [
+        'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'info', '-threads', '1',
+        '-skip_frame', 'nokey', '-i', path,
+        '-an', '-vsync', 'passthrough',
+        '-vf', f'scale={FRAME_WIDTH}:{FRAME_HEIGHT},format=gray,showinfo',
+        '-f', 'rawvideo', 'pipe:1'
+    ]
+
+
+def analyze_segment(path, duration=None):
+    # Runs in a pool process. Per second activity 0-100: share of pixels that changed between
+    # the keyframes around that second
+    result = subprocess.run(keyframe_command(path), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            timeout=ANALYZE_TIMEOUT)
+    times = [float(match) for line in result.stderr.decode(errors='replace').splitlines()
+             if 'showinfo' in line for match in PTS_TIME.findall(line)]
+    frame_size = FRAME_WIDTH * FRAME_HEIGHT
+    count = min(len(result.stdout) // frame_size, len(times))
+    if result.returncode != 0 and count < 2:
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}")
+    seconds = max(1, math.ceil(duration or (times[count - 1] if count else 0)))
+    if count < 2:
+        return bytes(seconds)
+
+    frames = numpy.frombuffer(result.stdout, dtype=numpy.uint8, count=count * frame_size)
+    frames = frames.reshape(count, FRAME_HEIGHT, FRAME_WIDTH).astype(numpy.int16)
+    changed = (numpy.abs(numpy.diff(frames, axis=0)) > PIXEL_THRESHOLD).mean(axis=(1, 2)) * 100
+    # Keyframe interval i runs from times[i] to times[i + 1], each second takes the one holding its middle
+    interval = numpy.searchsorted(numpy.array(times[1:count]), numpy.arange(seconds) + 0.5)
+    scores = changed[numpy.minimum(interval, len(changed) - 1)]
+    return numpy.rint(scores).astype(numpy.uint8).tobytes()
+
+
+def active_spans(scores, threshold):
+    # [start, end) second ranges with a score at or over the threshold
+    spans = []
+    for second, score in enumerate(scores):
+        if score < threshold:
+            continue
+        if spans and spans[-1][1] == second:
+            spans[-1][1] = second + 1
+        else:
+            spans.append([second, second + 1])
+    return spans
+
+
+class ActivityIndex:
+    """Per-second motion scores of recorded segments.
+
+    Closed segments are analyzed in a process pool: keyframes only, scaled
+    down to 64x36 gray and differenced with NumPy. Scores are stored in
+    SQLite next to the media index and, like it, keyed on path and only
+    valid while mtime and size match.
+    """
+
+    def __init__(self, db_path, workers=1, threshold=5):
+        self.db_path = os.path.abspath(db_path)
+        self.threshold = threshold
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS activity ("
+                " path TEXT PRIMARY KEY,"
+                " dir TEXT NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " scores BLOB NOT NULL,"
+                " peak INTEGER NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS activity_dir ON activity (dir)")
+            self.conn.commit()
+
+        # Analysis imports numpy and runs ffmpeg, keep it out of the recorder process
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self.executor = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context)
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        self.analyzed = 0
+        self.dropped = 0
+        logging.info(f"Activity index: {self.db_path}, {max(1, workers)} workers")
+
+    def request(self, path, duration=None):
+        path = os.path.abspath(path)
+        with self.pending_lock:
+            if path in self.pending:
+                return
+            if len(self.pending) >= MAX_PENDING:
+                self.dropped += 1
+                return
+            self.pending.add(path)
+        future = self.executor.submit(analyze_segment, path, duration)
+        future.add_done_callback(lambda done: self._store(path, done))
+
+    def _store(self, path, future):
+        try:
+            scores = future.result()
+            stat = os.stat(path)
+        except Exception as e:
+            logging.info(f"Activity index: cannot analyze {path}: {e}")
+            return
+        finally:
+            with self.pending_lock:
+                self.pending.discard(path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO activity (path, dir, mtime_ns, size, scores, peak) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, os.path.dirname(path), stat.st_mtime_ns, stat.st_size, scores, max(scores, default=0))
+            )
+            self.conn.commit()
+        self.analyzed += 1
+
+    def lookup_dir(self, directory):
+        # Whole folder in a single query; callers validate mtime/size per row
+        directory = os.path.abspath(directory)
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM activity WHERE dir = ?", (directory,)).fetchall()
+        return {row['path']: dict(row) for row in rows}
+
+    def summary(self, row, stat):
+        # Listing view of one row: peak, active seconds and where they are, None if stale
+        if not MediaIndex.is_current(row, stat):
+            return None
+        spans = active_spans(row['scores'], self.threshold)
+        return {
+            'peak': row['peak'],
+            'active_seconds': sum(end - start for start, end in spans),
+            'spans': spans[:MAX_SPANS]
+        }
+
+    def remove(self, path):
+        with self.lock:
+            self.conn.execute("DELETE FROM activity WHERE path = ?", (os.path.abspath(path),))
+            self.conn.commit()
+
+    def stats(self):
+        with self.pending_lock:
+            return {'pending': len(self.pending), 'analyzed': self.analyzed, 'dropped': self.dropped}
@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import logging
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from recorder_main import CameraRecorder, CameraGroupRecorder
+
+# RSS, CPU, context switches and threads per camera: one ffmpeg and thread per
+# camera against groups of cameras sharing one ffmpeg (ingest.group_size).
+# Cameras are simulated by a looped 720p H.264 file read in realtime. Linux
+# only (/proc), needs ffmpeg with libx264.
+#
+#   python3 bench/bench_ingest.py [cameras] [seconds] [group_size ...]
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+WARMUP_SECONDS = 5
+
+
+class LoopedFileRecorder(CameraRecorder):
+    def input_args(self):
+        return ["-re", "-stream_loop", "-1", "-i", self.rtsp_url]
+
+
+def make_sample(path):
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=25',
+        '-f', 'lavfi', '-i', 'sine=frequency=440',
+        '-t', '10', '-c:v', 'libx264', '-preset', 'veryfast', '-g', '50',
+        '-c:a', 'aac', path
+    ], check=True)
+
+
+def process_sample(pid):
+    # (cpu seconds, context switches, rss bytes, threads) of a process and all its threads
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    switches = 0
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/status") as f:
+                for line in f:
+                    if line.startswith(('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches')):
+                        switches += int(line.split()[1])
+        except OSError:
+            pass
+    rss = threads = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) * 1024
+            elif line.startswith('Threads:'):
+                threads = int(line.split()[1])
+    return cpu, switches, rss, threads
+
+
+def total(pids):
+    samples = [process_sample(pid) for pid in pids]
+    return [sum(values) for values in zip(*samples)]
+
+
+def run(sample, cameras, seconds, group_size):
+    with tempfile.TemporaryDirectory() as work_dir:
+        members = [LoopedFileRecorder(f"cam{index}", sample, os.path.join(work_dir, f"cam{index}"), 60)
+                   for index in range(cameras)]
+        if group_size <= 1:
+            supervisors = members
+        else:
+            supervisors = [CameraGroupRecorder(members[first:first + group_size])
+                           for first in range(0, cameras, group_size)]
+        for supervisor in supervisors:
+            supervisor.start()
+        time.sleep(WARMUP_SECONDS)
+        try:
+            pids = [supervisor.process.pid for supervisor in supervisors if supervisor.process]
+            before_ffmpeg, before_python = total(pids), process_sample(os.getpid())
+            started = time.monotonic()
+            time.sleep(seconds)
+            elapsed = time.monotonic() - started
+            after_ffmpeg, after_python = total(pids), process_sample(os.getpid())
+        finally:
+            for supervisor in supervisors:
+                supervisor.stop_recording()
+            for supervisor in supervisors:
+                supervisor.join()
+
+    cpu = (after_ffmpeg[0] - before_ffmpeg[0] + after_python[0] - before_python[0]) / elapsed
+    switches = (after_ffmpeg[1] - before_ffmpeg[1] + after_python[1] - before_python[1]) / elapsed
+    label = "per camera" if group_size <= 1 else f"group {group_size}"
+    print(f"{label:<12} {len(pids):>3} ffmpeg   "
+          f"RSS {after_ffmpeg[2] / cameras / 1024 / 1024:>6.1f} MB/cam   "
+          f"CPU {cpu * 100 / cameras:>5.1f} %/cam   "
+          f"ctx switches {switches / cameras:>7.0f} /s/cam   "
+          f"threads {(after_ffmpeg[3] + after_python[3]) / cameras:>5.1f} /cam")
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    cameras = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    group_sizes = [int(value) for value in sys.argv[3:]] or [1, 4, cameras]
+    with tempfile.TemporaryDirectory() as sample_dir:
+        sample = os.path.join(sample_dir, 'sample.mp4')
+        make_sample(sample)
+        print(f"{cameras} cameras, {seconds:.0f} s")
+        for group_size in group_sizes:
+            run(sample, cameras, seconds, group_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import socket
+import struct
+import logging
+import tempfile
+import threading
+import subprocess
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from recorder_main import CameraRecorder
+from live import LiveStream
+from videoServer import VideoServer
+from mp4 import iter_box_bytes, find_box
+
+# How long the oldest frame of each live fragment waits before it reaches a /live
+# viewer, for a few live.fragment_ms settings: fragment duration plus delivery
+# delay above the best case seen. The constant ingest delay, the camera's own
+# encoder and browser buffering come on top. The source is a realtime 25 fps
+# H.264 test stream with a 2 s GOP over TCP instead of a camera. Needs ffmpeg
+# with libx264.
+#
+#   python3 bench/bench_live_latency.py [seconds_per_setting]
+
+HTML_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'index.html')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestSourceRecorder(CameraRecorder):
+    def input_args(self):
+        return ["-i", self.rtsp_url]
+
+
+def start_source(port):
+    return subprocess.Popen([
+        'ffmpeg', '-v', 'error', '-re',
+        '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=25',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'zerolatency', '-g', '50',
+        '-f', 'mpegts', f'tcp://127.0.0.1:{port}?listen=1'
+    ])
+
+
+def fragment_times(url, seconds):
+    # (arrival, media start) per fragment
+    timescale = None
+    data = b''
+    times = []
+    with urllib.request.urlopen(url) as response:
+        started = time.monotonic()
+        while time.monotonic() - started < seconds:
+            data += response.read1(1024 * 1024)
+            arrival = time.monotonic()
+            offset = 0
+            for box_type, start, end in iter_box_bytes(data):
+                if box_type == 'moov':
+                    mdhd = find_box(data, ('trak', 'mdia', 'mdhd'), start, end)
+                    version = data[mdhd[0]]
+                    timescale = struct.unpack_from('>I', data, mdhd[0] + (20 if version else 12))[0]
+                elif box_type == 'moof':
+                    tfdt = find_box(data, ('traf', 'tfdt'), start, end)
+                    version = data[tfdt[0]]
+                    decode_time = struct.unpack_from('>Q' if version else '>I', data, tfdt[0] + 4)[0]
+                    times.append((arrival, decode_time / timescale))
+                offset = end
+            data = data[offset:]
+    return times
+
+
+def run(fragment_ms, seconds):
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        port = free_port()
+        source = start_source(port)
+        time.sleep(0.5)
+        live = LiveStream('bench', fragment_ms / 1000)
+        recorder = TestSourceRecorder('bench', f'tcp://127.0.0.1:{port}', os.path.join(work_dir, 'bench'), 60, live=live)
+        recorder.start()
+        server = VideoServer(html_template=HTML_TEMPLATE, port=free_port(), directory=work_dir, live={'bench': live})
+        threading.Thread(target=server.start, daemon=True).start()
+        time.sleep(2)
+        try:
+            times = fragment_times(f"http://127.0.0.1:{server.port}/live/bench", seconds)
+        finally:
+            recorder.stop_recording()
+            recorder.join()
+            source.kill()
+            source.wait()
+
+    # The first read carries the backlog from the newest keyframe, not live
+    times = [entry for entry in times if entry[0] != times[0][0]] if times else []
+    # A fragment can't arrive before its last frame was produced (~ next fragment's start),
+    # the earliest arrival relative to that is the constant part of the delay
+    pairs = list(zip(times, times[1:]))
+    if not pairs:
+        print(f"fragment_ms {fragment_ms:>5}   no fragments received")
+        return
+    best = min(arrival - next_media for (arrival, _), (_, next_media) in pairs)
+    delays = sorted(arrival - media - best for (arrival, media), _ in pairs)
+    p50 = delays[len(delays) // 2]
+    p95 = delays[int(len(delays) * 0.95)]
+    print(f"fragment_ms {fragment_ms:>5}   {len(times):>4} fragments   oldest frame age p50 {p50:>5.2f} s   p95 {p95:>5.2f} s")
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for fragment_ms in (0, 500, 200):
+        run(fragment_ms, seconds)
+
+
+if __name__ == '__main__':
+    main()
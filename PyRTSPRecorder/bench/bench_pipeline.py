@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import logging
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_ingest import LoopedFileRecorder, process_sample, total
+
+# ffmpeg CPU per camera for recording presets (audio / container / segment_align).
+# Cameras are simulated by a looped 720p H.264 file with AAC or G.711 audio read in
+# realtime, so audio copy only applies to the AAC source. File inputs still demux
+# the audio track with audio: none, a camera doesn't even set it up. Linux only
+# (/proc), needs ffmpeg with libx264.
+#
+#   python3 bench/bench_pipeline.py [cameras] [seconds]
+
+WARMUP_SECONDS = 5
+PRESETS = (
+    ('aac', 'mp4', 'keyframe'),     # previous fixed pipeline
+    ('copy', 'mp4', 'keyframe'),
+    ('none', 'mp4', 'keyframe'),
+    ('copy', 'fmp4', 'keyframe'),
+    ('copy', 'ts', 'keyframe'),
+    ('copy', 'mp4', 'clock'),
+)
+
+
+def make_sample(path, audio_codec):
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=25',
+        '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=8000',
+        '-t', '10', '-c:v', 'libx264', '-preset', 'veryfast', '-g', '50',
+        '-c:a', audio_codec, '-f', 'matroska', path
+    ], check=True)
+
+
+def run(sample, source, cameras, seconds, audio, container, segment_align):
+    with tempfile.TemporaryDirectory() as work_dir:
+        recorders = [LoopedFileRecorder(f"cam{index}", sample, os.path.join(work_dir, f"cam{index}"), 10,
+                                        audio=audio, container=container, segment_align=segment_align)
+                     for index in range(cameras)]
+        for recorder in recorders:
+            recorder.start()
+        time.sleep(WARMUP_SECONDS)
+        try:
+            pids = [recorder.process.pid for recorder in recorders if recorder.process]
+            before = total(pids)
+            started = time.monotonic()
+            time.sleep(seconds)
+            elapsed = time.monotonic() - started
+            after = total(pids)
+        finally:
+            for recorder in recorders:
+                recorder.stop_recording()
+            for recorder in recorders:
+                recorder.join()
+        segments = sum(len(os.listdir(os.path.join(work_dir, f"cam{index}"))) for index in range(cameras))
+
+    if len(pids) < cameras:
+        print(f"{source:<6} {audio:<5} {container:<5} {segment_align:<9} ffmpeg not running ({len(pids)}/{cameras})")
+        return
+    cpu = (after[0] - before[0]) / elapsed
+    print(f"{source:<6} {audio:<5} {container:<5} {segment_align:<9} "
+          f"CPU {cpu * 100 / cameras:>5.1f} %/cam   RSS {after[2] / cameras / 1024 / 1024:>6.1f} MB/cam   "
+          f"{segments} segments")
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    cameras = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    with tempfile.TemporaryDirectory() as sample_dir:
+        print(f"{cameras} cameras, {seconds:.0f} s")
+        for source, audio_codec in (('aac', 'aac'), ('g711', 'pcm_mulaw')):
+            sample = os.path.join(sample_dir, f'{source}.mkv')
+            make_sample(sample, audio_codec)
+            for audio, container, segment_align in PRESETS:
+                if audio == 'copy' and source != 'aac':
+                    continue
+                run(sample, source, cameras, seconds, audio, container, segment_align)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import socket
+import logging
+import tempfile
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from videoServer import VideoServer
+
+# Compare file delivery of the old 8 KB read/write loop, the memoryview
+# fallback and os.sendfile. Server CPU is measured in this process, the
+# client downloads from a separate process.
+#
+#   python3 bench/bench_sendfile.py [size_mb] [rounds]
+
+HTML_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'index.html')
+
+
+class LegacyLoopHandler(VideoServer.CustomHandler):
+    def send_file_range(self, source, offset, count):
+        source.seek(offset)
+        remaining = count
+        while remaining > 0:
+            data = source.read(min(8192, remaining))
+            if not data:
+                break
+            self.wfile.write(data)
+            remaining -= len(data)
+        return count - remaining
+
+
+class BufferedHandler(VideoServer.CustomHandler):
+    use_sendfile = False
+
+
+class SendfileHandler(VideoServer.CustomHandler):
+    use_sendfile = True
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def download(port, path, rounds, result):
+    total = 0
+    for _ in range(rounds):
+        with socket.create_connection(('127.0.0.1', port)) as conn:
+            conn.sendall(f"GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode())
+            while True:
+                data = conn.recv(1024 * 1024)
+                if not data:
+                    break
+                total += len(data)
+    result.value = total
+
+
+def run(handler_cls, directory, file_name, size, rounds):
+    server = VideoServer(html_template=HTML_TEMPLATE, port=free_port(), directory=directory)
+    server.CustomHandler = handler_cls
+    threading.Thread(target=server.start, daemon=True).start()
+    time.sleep(0.3)
+
+    result = multiprocessing.Value('q', 0)
+    client = multiprocessing.Process(target=download, args=(server.port, f"/videos/{file_name}?download=1", rounds, result))
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    client.start()
+    client.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    if result.value < size * rounds:
+        print(f"  {handler_cls.__name__}: short read {result.value} bytes")
+    mb = size * rounds / (1024 * 1024)
+    print(f"{handler_cls.__name__:<20} {mb / wall:>10.1f} MB/s {cpu:>10.2f} s CPU {cpu / mb * 1000:>10.2f} ms CPU/MB")
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        file_name = 'bench.mp4'
+        size = size_mb * 1024 * 1024
+        with open(os.path.join(directory, file_name), 'wb') as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(size_mb):
+                f.write(chunk)
+
+        print(f"{size_mb} MB x {rounds} downloads")
+        for handler_cls in (LegacyLoopHandler, BufferedHandler, SendfileHandler):
+            run(handler_cls, directory, file_name, size, rounds)
+
+
+if __name__ == "__main__":
+    main()
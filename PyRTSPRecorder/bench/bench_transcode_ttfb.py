@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from videoServer import VideoServer
+
+# Time to first video byte for an HEVC segment that is not cached yet,
+# full-file transcode vs fragmented MP4 streaming. Needs ffmpeg with libx265.
+#
+#   python3 bench/bench_transcode_ttfb.py [seconds_of_video]
+
+HTML_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'index.html')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def make_sample(path, seconds):
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=25',
+        '-f', 'lavfi', '-i', 'sine=frequency=440',
+        '-t', str(seconds),
+        '-c:v', 'libx265', '-preset', 'ultrafast', '-g', '50',
+        '-c:a', 'aac', path
+    ], check=True)
+
+
+def first_byte(url):
+    with urllib.request.urlopen(url) as response:
+        response.read(1)
+        first = time.perf_counter()
+        size = 1 + len(response.read())
+    return first, size
+
+
+def run(mode, directory, file_name):
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        server = VideoServer(html_template=HTML_TEMPLATE, port=free_port(), directory=directory, transcode_mode=mode)
+        threading.Thread(target=server.start, daemon=True).start()
+        time.sleep(0.3)
+
+        base = f"http://127.0.0.1:{server.port}"
+        video_url = f"{base}/videos/{quote(file_name)}"
+        status_url = f"{base}/status/{quote(file_name)}"
+
+        start = time.perf_counter()
+        try:
+            urllib.request.urlopen(video_url).read()
+        except urllib.error.HTTPError:
+            pass
+
+        while True:
+            status = json.loads(urllib.request.urlopen(status_url).read())
+            if status['status'] == 'completed':
+                play_url = video_url
+                break
+            if status.get('streamable'):
+                play_url = video_url + '?stream=1'
+                break
+            time.sleep(0.05)
+
+        first, size = first_byte(play_url)
+        done = time.perf_counter()
+        print(f"{mode:<8} ttfb {first - start:>7.2f} s   last byte {done - start:>7.2f} s   {size / 1024 / 1024:>7.1f} MB")
+
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = 'sample_hevc.mp4'
+        make_sample(os.path.join(directory, file_name), seconds)
+        print(f"{seconds} s HEVC 720p sample")
+        for mode in ('full', 'stream'):
+            run(mode, directory, file_name)
+
+
+if __name__ == "__main__":
+    main()
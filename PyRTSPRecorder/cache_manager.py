@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import hashlib
+import shutil
+import logging
+import threading
+
+MANIFEST_NAME = 'cache_manifest.json'
+CACHE_SUFFIX = '_h264.mp4'
+# Transcodes in progress (output, stream mode fragments, chunked mode work) live in this subdirectory,
+# whatever a crash or kill left there is removed in one step on start
+TEMP_DIR = 'transcode_tmp'
+
+
+def cache_file_name(original_path, file_stat):
+    file_hash = hashlib.md5(original_path.encode()).hexdigest()[:8]
+    time_hash = hashlib.md5(str(file_stat.st_mtime).encode()).hexdigest()[:8]
+    base_name = os.path.splitext(os.path.basename(original_path))[0]
+    return f"{base_name}_{file_hash}_{time_hash}{CACHE_SUFFIX}"
+
+
+class TranscodeCache:
+    """Size and age bounded index of the .cache_recorder transcodes.
+
+    The index lives in a JSON manifest inside the cache directory, so a
+    restart loads it instead of walking the directory. Entries are evicted
+    when their source segment is gone or was rewritten, when they are older
+    than max_age, and least recently used first while over max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=10 * 1024 ** 3, max_age=7 * 86400, sweep_interval=60):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.temp_dir = os.path.join(cache_dir, TEMP_DIR)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+
+        self.lock = threading.Lock()
+        self.entries = {}   # cache file name -> {source, size, created, last_access}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'budget': 0, 'age': 0, 'orphan': 0}
+        self.dirty = False
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+        threading.Thread(target=self._sweeper, daemon=True).start()
+
+    def _load(self):
+        # No transcode runs yet, anything temporary is from a previous run
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        try:
+            with open(self.manifest_path, 'r') as f:
+                self.entries = json.load(f)
+            logging.info(f"Transcode cache: {len(self.entries)} entries from manifest")
+        except (OSError, ValueError):
+            # First run or damaged manifest, rebuild once from the directory
+            self.entries = {}
+            now = time.time()
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(CACHE_SUFFIX) and entry.is_file():
+                        stat = entry.stat()
+                        # Source is unknown for these, they leave by age or budget
+                        self.entries[entry.name] = {
+                            'source': None,
+                            'size': stat.st_size,
+                            'created': stat.st_mtime,
+                            'last_access': now
+                        }
+            self.dirty = True
+            logging.info(f"Transcode cache: rebuilt index, {len(self.entries)} entries")
+        self.total_bytes = sum(entry['size'] for entry in self.entries.values())
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.entries)
+            self.dirty = False
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(data)
+        os.replace(temp_path, self.manifest_path)
+
+    def path_for(self, original_path):
+        original_path = os.path.abspath(original_path)
+        return os.path.join(self.cache_dir, cache_file_name(original_path, os.stat(original_path)))
+
+    def lookup(self, cache_path):
+        # True when a finished transcode is available, counts hit/miss
+        name = os.path.basename(cache_path)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and os.path.exists(cache_path):
+                entry['last_access'] = time.time()
+                self.hits += 1
+                self.dirty = True
+                return True
+            if entry is not None:
+                # Deleted behind our back
+                self._drop(name)
+            self.misses += 1
+            return False
+
+    def add(self, cache_path, source_path):
+        name = os.path.basename(cache_path)
+        size = os.path.getsize(cache_path)
+        now = time.time()
+        with self.lock:
+            if name in self.entries:
+                self.total_bytes -= self.entries[name]['size']
+            self.entries[name] = {
+                'source': os.path.abspath(source_path),
+                'size': size,
+                'created': now,
+                'last_access': now
+            }
+            self.total_bytes += size
+            self.dirty = True
+        self.enforce()
+        self.save()
+
+    def _drop(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry['size']
+        self.dirty = True
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.info(f"Transcode cache: cannot remove {name}: {e}")
+
+    def _is_orphan(self, name, entry):
+        source = entry.get('source')
+        if not source:
+            return False
+        try:
+            return cache_file_name(source, os.stat(source)) != name
+        except OSError:
+            return True
+
+    def enforce(self):
+        now = time.time()
+        with self.lock:
+            for name, entry in list(self.entries.items()):
+                if self._is_orphan(name, entry):
+                    self._drop(name)
+                    self.evictions['orphan'] += 1
+                elif self.max_age and now - entry['created'] > self.max_age:
+                    self._drop(name)
+                    self.evictions['age'] += 1
+
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                for name in sorted(self.entries, key=lambda n: self.entries[n]['last_access']):
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    self._drop(name)
+                    self.evictions['budget'] += 1
+
+    def _sweeper(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.enforce()
+                self.save()
+            except Exception as e:
+                logging.info(f"Transcode cache sweep failed: {e}")
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'size_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0,
+                'evictions': dict(self.evictions)
+            }
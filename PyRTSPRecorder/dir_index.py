@@ -0,0 +1,294 @@
+import os
+import errno
+import time
+import struct
+import logging
+import threading
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.mpg', '.mpeg', '.ts'}
+SORT_KEYS = ('name', 'size', 'mtime')
+
+# The segment being recorded gets its size and mtime refreshed at most this often
+MODIFY_REFRESH = 2
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    # Minimal ctypes binding, None from create() where inotify is unavailable
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+
+    @classmethod
+    def create(cls):
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def add_watch(self, path):
+        import ctypes
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def remove_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            yield wd, mask, os.fsdecode(name)
+
+
+class DirectoryListing:
+    def __init__(self, full_path, rel_path):
+        self.full_path = full_path
+        self.rel_path = rel_path
+        self.entries = {}       # name -> entry
+        self.sorted = {}        # (sort, reverse) -> list of entries
+        self.dir_mtime_ns = None
+        self.watch = None
+        self.modified = {}      # name -> last refresh on IN_MODIFY
+
+    def scan(self, extensions):
+        entries = {}
+        stat = os.stat(self.full_path)
+        with os.scandir(self.full_path) as it:
+            for entry in it:
+                item = make_entry(entry.name, entry.path, self.rel_path, extensions, entry)
+                if item:
+                    entries[entry.name] = item
+        self.entries = entries
+        self.sorted = {}
+        self.modified = {}
+        self.dir_mtime_ns = stat.st_mtime_ns
+
+    def refresh_name(self, name, extensions):
+        # Single entry changed, no rescan of the folder
+        path = os.path.join(self.full_path, name)
+        item = make_entry(name, path, self.rel_path, extensions)
+        previous = self.entries.get(name)
+        if item and previous and item['type'] == previous['type'] and \
+                item.get('size') == previous.get('size') and item.get('mtime') == previous.get('mtime'):
+            # Nothing the listing shows or sorts by changed, keep the sorted pages
+            return
+        if item:
+            self.entries[name] = item
+        else:
+            self.entries.pop(name, None)
+            self.modified.pop(name, None)
+        self.sorted = {}
+
+    def modify_due(self, name):
+        # Throttles IN_MODIFY, ffmpeg appends to the open segment many times a second
+        now = time.monotonic()
+        if now - self.modified.get(name, 0) < MODIFY_REFRESH:
+            return False
+        self.modified[name] = now
+        return True
+
+    def newest_file(self):
+        files = [item for item in self.entries.values() if item['type'] == 'file']
+        return max(files, key=lambda item: item['mtime'])['name'] if files else None
+
+
+def make_entry(name, path, rel_dir, extensions, dir_entry=None):
+    if name.startswith('.'):
+        return None
+    rel_path = os.path.join(rel_dir, name) if rel_dir else name
+    try:
+        if dir_entry is not None:
+            is_dir = dir_entry.is_dir()
+            is_file = not is_dir and dir_entry.is_file()
+            stat = dir_entry.stat() if is_file else None
+        else:
+            stat = os.stat(path)
+            is_dir = os.path.isdir(path)
+            is_file = not is_dir and os.path.isfile(path)
+    except OSError:
+        return None
+
+    if is_dir:
+        return {'type': 'directory', 'name': name, 'path': rel_path, 'full_path': path}
+    if is_file and os.path.splitext(name)[1].lower() in extensions:
+        return {
+            'type': 'file',
+            'name': name,
+            'path': rel_path,
+            'full_path': path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'stat': stat
+        }
+    return None
+
+
+class DirectoryIndex:
+    """Cached archive folder listings built with os.scandir.
+
+    Folders that were listed once are watched with inotify and updated one
+    entry at a time, the segment being written at most every MODIFY_REFRESH
+    seconds. Without inotify (or when out of watches) a folder is rescanned
+    only when its own mtime changed, and its newest file is stat'ed.
+    """
+
+    def __init__(self, base_directory, extensions=VIDEO_EXTENSIONS, max_dirs=256):
+        self.base_directory = os.path.abspath(base_directory)
+        self.extensions = extensions
+        self.max_dirs = max_dirs
+        self.lock = threading.Lock()
+        self.listings = {}      # rel path -> DirectoryListing
+        self.watches = {}       # wd -> rel path
+        self.inotify = Inotify.create()
+        if self.inotify:
+            threading.Thread(target=self._watch_loop, daemon=True).start()
+            logging.info("Directory index: inotify change tracking")
+        else:
+            logging.info("Directory index: polling change tracking")
+
+    def resolve(self, rel_dir):
+        # None for paths escaping the archive
+        rel_dir = os.path.normpath(rel_dir or '.').lstrip(os.sep)
+        rel_dir = '' if rel_dir == '.' else rel_dir
+        full_path = os.path.join(self.base_directory, rel_dir)
+        if os.path.commonpath([self.base_directory, os.path.abspath(full_path)]) != self.base_directory:
+            return None, None
+        return rel_dir, full_path
+
+    def _listing(self, rel_dir):
+        rel_dir, full_path = self.resolve(rel_dir)
+        if rel_dir is None:
+            return None
+
+        listing = self.listings.get(rel_dir)
+        if listing is not None and listing.watch is None:
+            # Polling fallback, one stat of the folder per access, and one of the newest file:
+            # appending to the segment being recorded doesn't change the folder mtime
+            try:
+                if os.stat(full_path).st_mtime_ns != listing.dir_mtime_ns:
+                    listing.scan(self.extensions)
+                else:
+                    newest = listing.newest_file()
+                    if newest:
+                        listing.refresh_name(newest, self.extensions)
+            except OSError:
+                self._forget(rel_dir)
+                return None
+        if listing is None:
+            listing = DirectoryListing(full_path, rel_dir)
+            try:
+                listing.scan(self.extensions)
+            except OSError as e:
+                logging.info(f"Error listing directory {full_path}: {e}")
+                return None
+            if len(self.listings) >= self.max_dirs:
+                self._forget(next(iter(self.listings)))
+            self.listings[rel_dir] = listing
+            self._add_watch(listing)
+        return listing
+
+    def _add_watch(self, listing):
+        if not self.inotify:
+            return
+        try:
+            listing.watch = self.inotify.add_watch(listing.full_path)
+            self.watches[listing.watch] = listing.rel_path
+            # Catch anything created between scan and watch
+            listing.scan(self.extensions)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                logging.warning("Directory index: out of inotify watches, polling this folder")
+            listing.watch = None
+
+    def _forget(self, rel_dir):
+        listing = self.listings.pop(rel_dir, None)
+        if listing and listing.watch is not None:
+            self.watches.pop(listing.watch, None)
+            self.inotify.remove_watch(listing.watch)
+
+    def _watch_loop(self):
+        while True:
+            try:
+                events = list(self.inotify.read_events())
+            except OSError as e:
+                logging.warning(f"Directory index: inotify read failed, polling from now on: {e}")
+                with self.lock:
+                    for listing in self.listings.values():
+                        listing.watch = None
+                    self.watches.clear()
+                    self.inotify = None
+                return
+
+            with self.lock:
+                for wd, mask, name in events:
+                    if mask & IN_Q_OVERFLOW:
+                        # Lost events, drop everything and rescan on demand
+                        for rel_dir in list(self.listings):
+                            self._forget(rel_dir)
+                        continue
+                    rel_dir = self.watches.get(wd)
+                    listing = self.listings.get(rel_dir)
+                    if listing is None:
+                        continue
+                    if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        self.watches.pop(wd, None)
+                        listing.watch = None
+                        self.listings.pop(rel_dir, None)
+                    elif name and (not mask & IN_MODIFY or listing.modify_due(name)):
+                        listing.refresh_name(name, self.extensions)
+
+    def listing(self, rel_dir=''):
+        """Folders first, then files, both by name (the archive page order)."""
+        with self.lock:
+            listing = self._listing(rel_dir)
+            if listing is None:
+                return []
+            items = sorted(listing.entries.values(), key=lambda item: item['name'])
+        return [item for item in items if item['type'] == 'directory'] + \
+               [item for item in items if item['type'] == 'file']
+
+    def page(self, rel_dir='', offset=0, limit=100, sort='name', reverse=False):
+        sort = sort if sort in SORT_KEYS else 'name'
+        with self.lock:
+            listing = self._listing(rel_dir)
+            if listing is None:
+                return {'total': 0, 'items': []}
+            items = listing.sorted.get((sort, reverse))
+            if items is None:
+                directories = sorted((item for item in listing.entries.values() if item['type'] == 'directory'),
+                                     key=lambda item: item['name'])
+                files = sorted((item for item in listing.entries.values() if item['type'] == 'file'),
+                               key=lambda item: (item.get(sort, 0), item['name']), reverse=reverse)
+                items = listing.sorted[(sort, reverse)] = directories + files
+        return {'total': len(items), 'items': items[offset:offset + limit]}
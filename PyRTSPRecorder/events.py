@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+from collections import deque
+
+SUBSCRIBER_QUEUE = 1000     # events a subscriber may fall behind before the oldest are dropped
+LOSSLESS = None             # max_queue for subscribers that must see every event, their queue is unbounded
+
+
+class SegmentClosed:
+    __slots__ = ('camera', 'path', 'start', 'duration', 'size', 'closed')
+
+    def __init__(self, camera, path, start, duration, size, closed=None):
+        self.camera = camera
+        self.path = path
+        self.start = start          # unix time, from the file name
+        self.duration = duration    # seconds, from ffmpeg's segment list
+        self.size = size
+        self.closed = closed or time.time()
+
+
+class Subscription(threading.Thread):
+    # One consumer with its own queue and thread
+    def __init__(self, name, callback, max_queue=SUBSCRIBER_QUEUE):
+        super().__init__(daemon=True)
+        self.name = f"events-{name}"
+        self.subscriber = name
+        self.callback = callback
+        self.max_queue = max(1, max_queue) if max_queue is not LOSSLESS else LOSSLESS
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.running = True
+        self.delivered = 0
+        self.dropped = 0
+
+    def put(self, event):
+        with self.condition:
+            if self.max_queue is not LOSSLESS and len(self.queue) >= self.max_queue:
+                self.queue.popleft()
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    logging.warning(f"Events: '{self.subscriber}' is behind, {self.dropped} events dropped")
+            self.queue.append(event)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                event = self.queue.popleft()
+            try:
+                self.callback(event)
+            except Exception as e:
+                logging.error(f"Events: '{self.subscriber}' failed on {event.path}: {e}")
+            self.delivered += 1
+
+    def close(self):
+        # Delivers what is queued, then ends
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {'queued': len(self.queue), 'delivered': self.delivered, 'dropped': self.dropped}
+
+
+class EventBus:
+    """In-process publish/subscribe of closed segments.
+
+    Recorders publish one SegmentClosed per segment ffmpeg finished; every
+    subscriber gets it on its own thread. publish() only appends to the
+    subscribers' queues and never waits for them, so a slow indexer can't
+    hold up ingest: past SUBSCRIBER_QUEUE events behind it loses the oldest
+    ones, counted in stats(). Subscribers whose state must match the disk
+    (segment index, retention) subscribe with max_queue=LOSSLESS instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = []
+
+    def subscribe(self, name, callback, max_queue=SUBSCRIBER_QUEUE):
+        subscription = Subscription(name, callback, max_queue)
+        subscription.start()
+        with self.lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.remove(subscription)
+        subscription.close()
+
+    def publish(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def close(self, timeout=5):
+        # On shutdown, lets subscribers finish the events of the last segments
+        with self.lock:
+            subscriptions, self.subscriptions = self.subscriptions, []
+        deadline = time.monotonic() + timeout
+        for subscription in subscriptions:
+            subscription.close()
+        for subscription in subscriptions:
+            subscription.join(max(0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        return {subscription.subscriber: subscription.stats() for subscription in subscriptions}
@@ -0,0 +1,43 @@
+import datetime
+
+MAX_EXPORT_SECONDS = 24 * 3600
+
+# format -> (mime type, ffmpeg muxer options); fragmented MP4 needs no seekable output
+EXPORT_FORMATS = {
+    'mp4': ('video/mp4', ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof']),
+    'ts': ('video/mp2t', ['-f', 'mpegts'])
+}
+
+
+def parse_time(value):
+    # Unix seconds or ISO 8601 local time ("2024-05-01T14:03:27"), ValueError otherwise
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def concat_list(segments, start, end):
+    # ffconcat script, inpoint/outpoint trim the first and last segment (snapped to keyframes by -c copy)
+    lines = ["ffconcat version 1.0"]
+    for position, segment in enumerate(segments):
+        lines.append("file '" + segment.path.replace("'", "'\\''") + "'")
+        if position == 0 and start > segment.start:
+            lines.append(f"inpoint {start - segment.start:.3f}")
+        if position == len(segments) - 1:
+            lines.append(f"outpoint {end - segment.start:.3f}")
+    return "\n".join(lines) + "\n"
+
+
+def export_command(export_format):
+    # Concat script on stdin, remuxed clip on stdout
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-protocol_whitelist', 'file,pipe',
+        '-i', 'pipe:0',
+        '-map', '0:v', '-map', '0:a?',
+        '-c', 'copy',
+        *EXPORT_FORMATS[export_format][1],
+        'pipe:1'
+    ]
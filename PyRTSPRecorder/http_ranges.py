@@ -0,0 +1,120 @@
+import email.utils
+
+# More ranges than this in one request are served as the full file
+MAX_RANGES = 16
+
+
+def make_etag(file_stat):
+    # Strong validator, changes whenever the file is replaced or rewritten
+    return f'"{file_stat.st_ino:x}-{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+
+
+def http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    return parsed.timestamp()
+
+
+def etag_list(header):
+    return [tag.strip() for tag in header.split(',') if tag.strip()]
+
+
+def weak_match(etag, header):
+    # If-None-Match uses the weak comparison
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for tag in etag_list(header):
+        if tag == '*':
+            return True
+        if (tag[2:] if tag.startswith('W/') else tag) == bare:
+            return True
+    return False
+
+
+def is_not_modified(headers, etag, mtime):
+    """True when a GET/HEAD can be answered with 304 Not Modified."""
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return weak_match(etag, if_none_match)
+
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since:
+        since = parse_http_date(if_modified_since)
+        return since is not None and int(mtime) <= since
+    return False
+
+
+def range_applies(headers, etag, mtime):
+    """Evaluate If-Range, False means the Range header must be ignored."""
+    if_range = headers.get('If-Range')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Strong comparison only, weak tags never match
+        return not if_range.startswith('W/') and if_range == etag
+
+    since = parse_http_date(if_range)
+    return since is not None and int(mtime) == since
+
+
+def parse_range(header, file_size):
+    """Parse a bytes Range header.
+
+    Returns None when the header should be ignored (not bytes, malformed or
+    too many ranges), an empty list when nothing is satisfiable (416) and
+    otherwise a sorted list of merged inclusive (start, end) pairs.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.strip().partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    parts = [part.strip() for part in spec.split(',') if part.strip()]
+    if not parts or len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.partition('-')
+        if not dash:
+            return None
+        first, last = first.strip(), last.strip()
+        try:
+            if not first:
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start = max(file_size - length, 0)
+                end = file_size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else max(start, file_size - 1)
+                if end < start:
+                    return None
+        except ValueError:
+            return None
+
+        if start < 0 or start >= file_size:
+            continue
+        ranges.append((start, min(end, file_size - 1)))
+
+    # Overlapping or adjacent ranges are merged
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
@@ -0,0 +1,167 @@
+import time
+import struct
+import logging
+import threading
+from collections import deque
+from mp4 import trex_sample_flags, fragment_is_sync, codec_string
+
+LIVE_FRAGMENTS = 64                 # fragments kept per camera
+LIVE_MAX_BYTES = 16 * 1024 * 1024   # and at most this many bytes of them
+READ_BUFFER_SIZE = 64 * 1024
+
+
+class Fragment:
+    __slots__ = ('sequence', 'received', 'sync', 'data')
+
+    def __init__(self, sequence, received, sync, data):
+        self.sequence = sequence
+        self.received = received
+        self.sync = sync
+        self.data = data
+
+
+class LiveStream:
+    """Live picture of one camera as fragmented MP4, fed by its recorder.
+
+    The recorder's ffmpeg writes a second, video-only output to a pipe; the
+    init segment and the last fragments are kept in a shared ring. Viewers
+    only hold a position in the ring, a viewer that falls behind it skips
+    ahead to the newest keyframe instead of buffering.
+    """
+
+    def __init__(self, name, fragment_duration=0.5, max_fragments=LIVE_FRAGMENTS, max_bytes=LIVE_MAX_BYTES):
+        self.name = name
+        self.fragment_duration = fragment_duration
+        self.max_fragments = max_fragments
+        self.max_bytes = max_bytes
+        self.condition = threading.Condition()
+        self.generation = 0         # one per ffmpeg run, each has its own init segment
+        self.init_segment = None
+        self.codec = None
+        self.trex_flags = {}
+        self.fragments = deque()
+        self.next_sequence = 0
+        self.buffered_bytes = 0
+        self.viewers = 0
+        self.skipped = 0
+        self.buffer = bytearray()   # bytes of the box being received
+        self.boxes = []             # complete boxes of the init segment or fragment being received
+        self.broken = False
+
+    def feed(self, stream):
+        # Reads one ffmpeg run's output until EOF
+        self.begin()
+        for data in iter(lambda: stream.read1(READ_BUFFER_SIZE), b''):
+            self.push(data)
+
+    def begin(self):
+        # New ffmpeg run, viewers of the previous one are ended
+        with self.condition:
+            self.generation += 1
+            self.init_segment = None
+            self.codec = None
+            self.fragments.clear()
+            self.buffered_bytes = 0
+            self.condition.notify_all()
+        self.buffer = bytearray()
+        self.boxes = []
+        self.broken = False
+
+    def push(self, data):
+        # Output as it comes off the pipe; never raises, the recording must not block on an unread pipe
+        if self.broken:
+            return
+        self.buffer += data
+        try:
+            while len(self.buffer) >= 8:
+                size, box_type = struct.unpack_from('>I4s', self.buffer)
+                header = 8
+                if size == 1:
+                    if len(self.buffer) < 16:
+                        return
+                    size = struct.unpack_from('>Q', self.buffer, 8)[0]
+                    header = 16
+                if size < header:
+                    raise ValueError(f"unsupported box size {size}")
+                if len(self.buffer) < size:
+                    return
+                self.boxes.append(bytes(self.buffer[:size]))
+                del self.buffer[:size]
+                if box_type == b'moov':
+                    self._set_init(b''.join(self.boxes))
+                    self.boxes = []
+                elif box_type == b'mdat':
+                    self._publish(b''.join(self.boxes))
+                    self.boxes = []
+        except Exception as e:
+            logging.error(f"Live '{self.name}': {e}")
+            self.broken = True
+            self.buffer = bytearray()
+            self.boxes = []
+
+    def _set_init(self, data):
+        with self.condition:
+            self.init_segment = data
+            self.trex_flags = trex_sample_flags(data)
+            self.codec = codec_string(data)
+            self.condition.notify_all()
+        logging.info(f"Live '{self.name}': streaming {self.codec}")
+
+    def _publish(self, data):
+        with self.condition:
+            if self.init_segment is None:
+                return
+            fragment = Fragment(self.next_sequence, time.monotonic(), fragment_is_sync(data, self.trex_flags), data)
+            self.next_sequence += 1
+            self.fragments.append(fragment)
+            self.buffered_bytes += len(data)
+            while len(self.fragments) > 1 and (len(self.fragments) > self.max_fragments or self.buffered_bytes > self.max_bytes):
+                self.buffered_bytes -= len(self.fragments.popleft().data)
+            self.condition.notify_all()
+
+    def attach(self):
+        with self.condition:
+            self.viewers += 1
+
+    def detach(self):
+        with self.condition:
+            self.viewers -= 1
+
+    def read(self, cursor, timeout):
+        # (cursor, chunks) for a viewer: a new one (cursor None) gets the init segment and the newest
+        # keyframe on; chunks is empty after timeout, cursor None when ffmpeg restarted under the viewer
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                if cursor is not None and cursor[0] != self.generation:
+                    return None, []
+                if self.init_segment is not None:
+                    last = cursor[1] if cursor else -1
+                    newer = [fragment for fragment in self.fragments if fragment.sequence > last]
+                    if newer and not (cursor and newer[0].sequence == last + 1):
+                        # New viewer, or fell out of the ring: resume at the newest keyframe
+                        sync = [position for position, fragment in enumerate(newer) if fragment.sync]
+                        newer = newer[sync[-1]:] if sync else []
+                    if newer:
+                        chunks = [fragment.data for fragment in newer]
+                        if cursor is None:
+                            chunks.insert(0, self.init_segment)
+                        else:
+                            self.skipped += newer[0].sequence - last - 1
+                        return (self.generation, newer[-1].sequence), chunks
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return cursor, []
+                self.condition.wait(remaining)
+
+    def stats(self):
+        with self.condition:
+            newest = self.fragments[-1] if self.fragments else None
+            return {
+                'codec': self.codec,
+                'viewers': self.viewers,
+                'fragments': len(self.fragments),
+                'buffered_bytes': self.buffered_bytes,
+                'skipped_fragments': self.skipped,
+                'last_fragment_age': time.monotonic() - newest.received if newest else None
+            }
@@ -0,0 +1,231 @@
+import os
+import json
+import queue
+import sqlite3
+import logging
+import subprocess
+import threading
+from collections import OrderedDict
+
+CODEC_NAMES = {
+    'hevc': 'H.265',
+    'h265': 'H.265',
+    'h264': 'H.264',
+    'vp9': 'VP9',
+    'vp8': 'VP8'
+}
+
+
+def codec_label(codec):
+    # Human readable codec name for the archive table
+    codec = (codec or '').lower()
+    return CODEC_NAMES.get(codec, codec.upper() if codec else 'Unknown')
+
+
+def probe_video(file_path, timeout=5):
+    # One ffprobe call for everything the archive needs to know about a file
+    result = subprocess.run([
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,width,height:format=duration,bit_rate',
+        '-of', 'json',
+        file_path
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
+
+    data = json.loads(result.stdout or '{}')
+    streams = data.get('streams') or [{}]
+    stream = streams[0]
+    fmt = data.get('format', {})
+
+    def to_number(value, cast):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        'codec': (stream.get('codec_name') or '').lower(),
+        'duration': to_number(fmt.get('duration'), float),
+        'width': to_number(stream.get('width'), int),
+        'height': to_number(stream.get('height'), int),
+        'bitrate': to_number(fmt.get('bit_rate'), int)
+    }
+
+
+class MediaIndex:
+    """Persistent codec/metadata index of the archive.
+
+    Rows are keyed by absolute path and are only valid while the file's
+    mtime and size still match, so a rewritten segment is probed again.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = os.path.abspath(db_path)
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS media ("
+                " path TEXT PRIMARY KEY,"
+                " dir TEXT NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " codec TEXT,"
+                " duration REAL,"
+                " width INTEGER,"
+                " height INTEGER,"
+                " bitrate INTEGER)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS media_dir ON media (dir)")
+            self.conn.commit()
+
+        self.probe_queue = queue.Queue()
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        self.worker = None
+        self.probes = 0
+
+        logging.info(f"Media index: {self.db_path}")
+
+    def lookup(self, path, stat=None):
+        path = os.path.abspath(path)
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return None
+
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM media WHERE path = ?", (path,)).fetchone()
+
+        if row is None or row['mtime_ns'] != stat.st_mtime_ns or row['size'] != stat.st_size:
+            return None
+        return dict(row)
+
+    def lookup_dir(self, directory):
+        # Whole folder in a single query; callers validate mtime/size per row
+        directory = os.path.abspath(directory)
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM media WHERE dir = ?", (directory,)).fetchall()
+        return {row['path']: dict(row) for row in rows}
+
+    @staticmethod
+    def is_current(row, stat):
+        return row is not None and row['mtime_ns'] == stat.st_mtime_ns and row['size'] == stat.st_size
+
+    def update(self, path):
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+            self.probes += 1
+            info = probe_video(path)
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            logging.info(f"Media index: cannot probe {path}: {e}")
+            return None
+
+        row = dict(info, path=path, dir=os.path.dirname(path), mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO media (path, dir, mtime_ns, size, codec, duration, width, height, bitrate) "
+                "VALUES (:path, :dir, :mtime_ns, :size, :codec, :duration, :width, :height, :bitrate)",
+                row
+            )
+            self.conn.commit()
+        return row
+
+    def get(self, path):
+        # Indexed metadata, probing synchronously on a miss
+        return self.lookup(path) or self.update(path)
+
+    def remove(self, path):
+        with self.lock:
+            self.conn.execute("DELETE FROM media WHERE path = ?", (os.path.abspath(path),))
+            self.conn.commit()
+
+    def request_probe(self, path):
+        # Queue a file for background indexing (closed segments, unindexed rows)
+        path = os.path.abspath(path)
+        with self.pending_lock:
+            if path in self.pending:
+                return
+            self.pending.add(path)
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._probe_worker, daemon=True)
+                self.worker.start()
+        self.probe_queue.put(path)
+
+    def _probe_worker(self):
+        while True:
+            path = self.probe_queue.get()
+            try:
+                if self.lookup(path) is None:
+                    self.update(path)
+            finally:
+                with self.pending_lock:
+                    self.pending.discard(path)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ProbeCache:
+    """Bounded in-memory LRU in front of the media index.
+
+    Keyed on (path, mtime, size) so HEAD/GET/Range requests for the same
+    segment share one probe result.
+    """
+
+    def __init__(self, media_index, max_entries=4096):
+        self.media_index = media_index
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            info = self.entries.get(key)
+            if info is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return info
+            self.misses += 1
+
+        # Probe outside the lock, concurrent misses on one file are rare and harmless
+        info = self.media_index.get(path)
+        if info is None:
+            return None
+
+        with self.lock:
+            self.entries[key] = info
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return info
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0,
+                'ffprobe_runs': self.media_index.probes
+            }
@@ -0,0 +1,245 @@
+import os
+import time
+import shutil
+import logging
+import threading
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def parse_bitrate(value):
+    # ffmpeg progress bitrate, e.g. "2048.3kbits/s" or "N/A"
+    if value.endswith('kbits/s'):
+        try:
+            return float(value[:-7]) * 1000
+        except ValueError:
+            return None
+    return None
+
+
+def format_value(value):
+    return str(value) if isinstance(value, int) else str(round(value, 3))
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class CameraMetrics:
+    """Counters of one camera, fed by the recorder thread, read by /metrics."""
+
+    def __init__(self, name, segment_time):
+        self.name = name
+        self.segment_time = segment_time
+        self.lock = threading.Lock()
+        self.up = False
+        self.restarts = 0
+        # ffmpeg -progress
+        self.frames = 0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.bitrate = None
+        self.dropped_frames = 0
+        self.duplicate_frames = 0
+        self.frames_base = 0        # totals of earlier ffmpeg runs
+        self.dropped_base = 0
+        self.duplicate_base = 0
+        self.last_progress = None
+        # segment closes
+        self.segments = 0
+        self.written_bytes = 0
+        self.last_segment_close = None
+        self.segment_interval = None
+        self.segment_bitrate = None
+
+    def started(self):
+        with self.lock:
+            self.up = True
+            self.last_segment_close = None
+            self.last_progress = None
+
+    def stopped(self):
+        with self.lock:
+            self.up = False
+            # ffmpeg counters restart at zero with the next run
+            self.frames_base += self.frames
+            self.dropped_base += self.dropped_frames
+            self.duplicate_base += self.duplicate_frames
+            self.frames = self.dropped_frames = self.duplicate_frames = 0
+
+    def restarted(self):
+        with self.lock:
+            self.restarts += 1
+            return self.restarts
+
+    def read_progress(self, stream):
+        # Blocks of key=value lines, each ended by progress=continue|end
+        block = {}
+        for line in stream:
+            key, _, value = line.strip().partition('=')
+            if key != 'progress':
+                block[key] = value
+                continue
+            try:
+                self.update_progress(block)
+            except ValueError as e:
+                logging.info(f"Camera '{self.name}': bad ffmpeg progress block: {e}")
+            block = {}
+
+    def update_progress(self, block):
+        with self.lock:
+            if block.get('frame'):
+                self.frames = int(block['frame'])
+            if block.get('fps'):
+                self.fps = float(block['fps'])
+            if block.get('speed', 'N/A').rstrip('x') not in ('N/A', ''):
+                self.speed = float(block['speed'].rstrip('x'))
+            if block.get('drop_frames'):
+                self.dropped_frames = int(block['drop_frames'])
+            if block.get('dup_frames'):
+                self.duplicate_frames = int(block['dup_frames'])
+            bitrate = parse_bitrate(block.get('bitrate', ''))
+            if bitrate is not None:
+                self.bitrate = bitrate
+            self.last_progress = time.time()
+
+    def segment_closed(self, size, duration, now=None):
+        now = now or time.time()
+        with self.lock:
+            self.segments += 1
+            self.written_bytes += size
+            if self.last_segment_close is not None:
+                self.segment_interval = now - self.last_segment_close
+            self.last_segment_close = now
+            if duration > 0:
+                self.segment_bitrate = size * 8 / duration
+
+    def snapshot(self):
+        with self.lock:
+            now = time.time()
+            # The segment muxer has no single output size, fall back to bytes per segment time
+            bitrate = self.bitrate if self.bitrate is not None else self.segment_bitrate
+            return {
+                'up': int(self.up),
+                'restarts_total': self.restarts,
+                'frames_total': self.frames_base + self.frames,
+                'dropped_frames_total': self.dropped_base + self.dropped_frames,
+                'duplicate_frames_total': self.duplicate_base + self.duplicate_frames,
+                'fps': self.fps,
+                'speed': self.speed,
+                'ingest_bitrate_bps': bitrate,
+                'segments_total': self.segments,
+                'written_bytes_total': self.written_bytes,
+                'segment_interval_seconds': self.segment_interval,
+                'segment_lateness_seconds': (self.segment_interval - self.segment_time
+                                             if self.segment_interval is not None else None),
+                'last_segment_age_seconds': (now - self.last_segment_close
+                                             if self.last_segment_close is not None else None),
+                'last_progress_age_seconds': (now - self.last_progress
+                                              if self.last_progress is not None else None)
+            }
+
+
+CAMERA_METRICS = (
+    ('up', 'gauge', 'ffmpeg process of the camera is running'),
+    ('restarts_total', 'counter', 'ffmpeg restarts after exit or stall'),
+    ('frames_total', 'counter', 'video frames written'),
+    ('dropped_frames_total', 'counter', 'frames dropped by ffmpeg'),
+    ('duplicate_frames_total', 'counter', 'frames duplicated by ffmpeg'),
+    ('fps', 'gauge', 'frames per second written, from ffmpeg -progress'),
+    ('speed', 'gauge', 'ingest speed relative to realtime, below 1 means falling behind'),
+    ('ingest_bitrate_bps', 'gauge', 'ingest bitrate in bits per second'),
+    ('segments_total', 'counter', 'segments closed'),
+    ('written_bytes_total', 'counter', 'bytes of closed segments, rate() gives disk write throughput'),
+    ('segment_interval_seconds', 'gauge', 'wall time between the last two segment closes'),
+    ('segment_lateness_seconds', 'gauge', 'last segment interval minus segment_duration'),
+    ('last_segment_age_seconds', 'gauge', 'seconds since the last segment closed'),
+    ('last_progress_age_seconds', 'gauge', 'seconds since the last ffmpeg progress report'),
+)
+
+LIVE_METRICS = (
+    ('viewers', 'recorder_live_viewers', 'gauge', 'browsers watching the live view'),
+    ('skipped_fragments', 'recorder_live_skipped_fragments_total', 'counter', 'fragments slow viewers skipped to catch up'),
+    ('last_fragment_age', 'recorder_live_last_fragment_age_seconds', 'gauge', 'seconds since the last live fragment arrived'),
+)
+
+EVENT_METRICS = (
+    ('queued', 'recorder_events_queued', 'gauge', 'segment close events waiting for a subscriber'),
+    ('delivered', 'recorder_events_delivered_total', 'counter', 'segment close events handled by a subscriber'),
+    ('dropped', 'recorder_events_dropped_total', 'counter', 'segment close events a subscriber lost by falling behind'),
+)
+
+
+class RecorderMetrics:
+    """Registry of per-camera metrics, rendered as Prometheus text."""
+
+    def __init__(self, output_folder, live=None, events=None):
+        self.output_folder = output_folder
+        self.live = live if live is not None else {}    # camera -> LiveStream, changed on config reload under lock
+        self.events = events
+        self.lock = threading.Lock()
+        self.cameras = {}
+
+    def camera(self, name, segment_time):
+        with self.lock:
+            metrics = self.cameras.get(name)
+            if metrics is None:
+                metrics = self.cameras[name] = CameraMetrics(name, segment_time)
+            metrics.segment_time = segment_time
+            return metrics
+
+    def segment_closed(self, event):
+        # Event bus subscriber
+        with self.lock:
+            metrics = self.cameras.get(event.camera)
+        if metrics is not None:
+            metrics.segment_closed(event.size, event.duration, event.closed)
+
+    def remove(self, name):
+        # Camera dropped from the config
+        with self.lock:
+            self.cameras.pop(name, None)
+
+    def render(self):
+        with self.lock:
+            cameras = sorted(self.cameras.items())
+            # A config reload changes live under this lock
+            streams = sorted(self.live.items())
+        snapshots = [(name, metrics.snapshot()) for name, metrics in cameras]
+
+        lines = []
+        for key, metric_type, help_text in CAMERA_METRICS:
+            metric = f"recorder_camera_{key}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for name, snapshot in snapshots:
+                value = snapshot[key]
+                if value is not None:
+                    lines.append(f'{metric}{{camera="{label_value(name)}"}} {format_value(value)}')
+
+        live = [(name, stream.stats()) for name, stream in streams]
+        for key, metric, metric_type, help_text in LIVE_METRICS:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for name, stats in live:
+                if stats[key] is not None:
+                    lines.append(f'{metric}{{camera="{label_value(name)}"}} {format_value(stats[key])}')
+
+        subscribers = sorted(self.events.stats().items()) if self.events else []
+        for key, metric, metric_type, help_text in EVENT_METRICS:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for name, stats in subscribers:
+                lines.append(f'{metric}{{subscriber="{label_value(name)}"}} {stats[key]}')
+
+        try:
+            usage = shutil.disk_usage(self.output_folder)
+        except OSError:
+            usage = None
+        if usage:
+            for key, value, help_text in (('free', usage.free, 'free bytes on the recordings filesystem'),
+                                          ('size', usage.total, 'size of the recordings filesystem')):
+                lines.append(f"# HELP recorder_disk_{key}_bytes {help_text}")
+                lines.append(f"# TYPE recorder_disk_{key}_bytes gauge")
+                lines.append(f'recorder_disk_{key}_bytes{{path="{label_value(os.path.abspath(self.output_folder))}"}} {value}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,176 @@
+import struct
+
+
+def iter_boxes(f, end):
+    # Top level MP4 boxes as (type, offset, size), stops at the first incomplete one
+    offset = 0
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(16)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header[:8])
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack('>Q', header[8:16])[0]
+        elif size == 0:
+            # Box runs to the end of the file, only valid for the last one
+            size = end - offset
+        if size < 8 or offset + size > end:
+            return
+        yield box_type.decode('latin-1'), offset, size
+        offset += size
+
+
+def first_fragment_ready(path):
+    # A fragmented MP4 is playable once moov and one complete moof+mdat are on disk
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            end = f.tell()
+            seen = set()
+            for box_type, _, _ in iter_boxes(f, end):
+                seen.add(box_type)
+                if box_type == 'mdat' and 'moov' in seen and 'moof' in seen:
+                    return True
+    except OSError:
+        pass
+    return False
+
+
+def fragmented_layout(path):
+    # (init segment, offset of the newest complete fragment, trailer written) of a fragmented MP4 as far as
+    # it is on disk; None for a regular MP4, whose moov only comes when the file is finished
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        end = f.tell()
+        init = None
+        moof = None
+        newest = None
+        finished = False
+        for box_type, offset, size in iter_boxes(f, end):
+            if box_type == 'moov':
+                f.seek(0)
+                init = f.read(offset + size)
+            elif init is None and box_type in ('mdat', 'moof'):
+                return None
+            elif box_type == 'moof':
+                moof = offset
+            elif box_type == 'mdat' and moof is not None:
+                newest = moof
+                moof = None
+            elif box_type == 'mfra':
+                finished = True
+    if init is None or not find_box(init, ('moov', 'mvex')):
+        return None
+    return init, newest, finished
+
+
+def iter_box_bytes(data, offset=0, end=None):
+    # Boxes inside an in-memory buffer as (type, offset of the payload, end)
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type.decode('latin-1'), offset + header, offset + size
+        offset += size
+
+
+def find_box(data, path, offset=0, end=None):
+    # Payload (offset, end) of the first box along a path like ('moov', 'trak', 'mdia'), None if missing
+    for box_type, start, box_end in iter_box_bytes(data, offset, end):
+        if box_type == path[0]:
+            return (start, box_end) if len(path) == 1 else find_box(data, path[1:], start, box_end)
+    return None
+
+
+def sample_is_sync(flags):
+    # sample_is_non_sync_sample bit of the ISO BMFF sample flags
+    return not (flags >> 16) & 1
+
+
+def trex_sample_flags(init):
+    # track_ID -> default_sample_flags from moov/mvex/trex of an init segment
+    defaults = {}
+    mvex = find_box(init, ('moov', 'mvex'))
+    if mvex:
+        for box_type, start, _ in iter_box_bytes(init, *mvex):
+            if box_type == 'trex':
+                track_id, _, _, _, flags = struct.unpack_from('>5I', init, start + 4)
+                defaults[track_id] = flags
+    return defaults
+
+
+def fragment_is_sync(fragment, trex_flags):
+    # True when every track of the moof starts on a sync sample, i.e. playback can start here
+    moof = find_box(fragment, ('moof',))
+    if not moof:
+        return False
+    for box_type, start, end in iter_box_bytes(fragment, *moof):
+        if box_type != 'traf':
+            continue
+        first_flags = None
+        for child, child_start, _ in iter_box_bytes(fragment, start, end):
+            flags = struct.unpack_from('>I', fragment, child_start)[0] & 0xFFFFFF
+            if child == 'tfhd':
+                track_id = struct.unpack_from('>I', fragment, child_start + 4)[0]
+                first_flags = trex_flags.get(track_id)
+                position = child_start + 8
+                position += 8 if flags & 0x01 else 0    # base_data_offset
+                position += 4 if flags & 0x02 else 0    # sample_description_index
+                position += 4 if flags & 0x08 else 0    # default_sample_duration
+                position += 4 if flags & 0x10 else 0    # default_sample_size
+                if flags & 0x20:
+                    first_flags = struct.unpack_from('>I', fragment, position)[0]
+            elif child == 'trun':
+                position = child_start + 8
+                position += 4 if flags & 0x001 else 0   # data_offset
+                if flags & 0x004:
+                    first_flags = struct.unpack_from('>I', fragment, position)[0]
+                elif flags & 0x400:
+                    position += 4 if flags & 0x100 else 0
+                    position += 4 if flags & 0x200 else 0
+                    first_flags = struct.unpack_from('>I', fragment, position)[0]
+                break
+        if first_flags is None or not sample_is_sync(first_flags):
+            return False
+    return True
+
+
+def codec_string(init):
+    # RFC 6381 codecs parameter of the first video track ("avc1.64001f"), None if unknown
+    stsd = find_box(init, ('moov', 'trak', 'mdia', 'minf', 'stbl', 'stsd'))
+    if not stsd:
+        return None
+    # stsd: version/flags, entry count, then sample entries; visual sample entries carry 78 bytes before their boxes
+    for entry, start, end in iter_box_bytes(init, stsd[0] + 8, stsd[1]):
+        config = find_box(init, ('avcC',), start + 78, end) or find_box(init, ('hvcC',), start + 78, end)
+        if entry in ('avc1', 'avc3') and config:
+            return f"{entry}.{init[config[0] + 1:config[0] + 4].hex()}"
+        if entry in ('hvc1', 'hev1') and config:
+            position = config[0]
+            profile = init[position + 1]
+            compatibility = struct.unpack_from('>I', init, position + 2)[0]
+            constraints = bytearray(init[position + 6:position + 12])
+            level = init[position + 12]
+            while constraints and not constraints[-1]:
+                constraints.pop()
+            parts = [
+                entry,
+                ('', 'A', 'B', 'C')[profile >> 6] + str(profile & 0x1F),
+                format(int(format(compatibility, '032b')[::-1], 2), 'X'),
+                ('H' if profile & 0x20 else 'L') + str(level)
+            ] + [format(byte, 'X') for byte in constraints]
+            return '.'.join(parts)
+        return entry
+    return None
@@ -1,10 +1,34 @@
 import os
+import re
 import time
 import yaml
+import signal
 import logging
+import selectors
 import subprocess
-from threading import Thread, current_thread
+from threading import Thread, Event, current_thread
 from videoServer import VideoServer
+from media_index import MediaIndex
+from metrics import CameraMetrics, RecorderMetrics
+from segment_index import SegmentIndex, segment_start
+from events import EventBus, SegmentClosed, LOSSLESS
+from retention import RetentionManager, limits_from_config
+from thumbnails import ThumbnailStore
+from live import LiveStream
+import activity
+
+CACHE_DIR = ".cache_recorder"
+RESTART_BACKOFF_MIN = 1     # seconds before the first restart, doubled per failure
+STABLE_RUN_SECONDS = 60     # a run this long resets the backoff
+SUPERVISE_INTERVAL = 5      # seconds between ffmpeg liveness/stall checks
+STOP_TIMEOUT = 10           # seconds for ffmpeg to finalize the open segment on stop
+PIPE_READ_SIZE = 64 * 1024
+GROUP_EJECT_FAILURES = 3    # failed group runs in a row blamed on one camera before it gets its own ffmpeg
+# Per camera recording pipeline, the first value is the default
+AUDIO_MODES = ("aac", "copy", "none")
+CONTAINERS = {"mp4": ".mp4", "fmp4": ".mp4", "ts": ".ts"}    # name -> segment extension
+SEGMENT_ALIGN = ("keyframe", "clock")
+RELOADABLE_WEB_SETTINGS = ("port", "user", "password_hash", "connection_timeout")
 
 def setup_global_logging(log_file):
     log_dir = os.path.dirname(log_file)
@@ -21,88 +45,677 @@ def setup_global_logging(log_file):
         ]
     )
 
-class CameraRecorder(Thread):
-    def __init__(self, name, rtsp_url, output_folder, segment_time):
+class FfmpegSupervisor(Thread):
+    # Restart loop with backoff around run_ffmpeg(), for a single camera or a group of them
+    def __init__(self, name, stall_timeout=60, backoff_max=60):
         super().__init__()
         self.name = name
+        self.stall_timeout = stall_timeout
+        self.backoff_max = backoff_max
+        self.running = False
+        self.stop_event = Event()
+        self.process = None
+
+    def run(self):
+        logging.info(f"Сamera '{self.name}' Thread ID: {current_thread().ident}")
+        self.running = True
+        backoff = RESTART_BACKOFF_MIN
+        try:
+            while self.running:
+                started = time.monotonic()
+                reason = self.run_ffmpeg()
+                if not self.running:
+                    break
+                if time.monotonic() - started >= STABLE_RUN_SECONDS:
+                    backoff = RESTART_BACKOFF_MIN
+                restarts = self.restarted()
+                logging.warning(f"Camera '{self.name}': ffmpeg {reason}, restart #{restarts} in {backoff} s")
+                if self.stop_event.wait(backoff):
+                    break
+                backoff = min(backoff * 2, self.backoff_max)
+        except Exception as e:
+            logging.error(f"Error from camera '{self.name}': {e}")
+        finally:
+            self.running = False
+            logging.info(f"Thread completed for camera '{self.name}' with ID: {current_thread().ident}")
+
+    def stop_ffmpeg(self, process, timeout=STOP_TIMEOUT):
+        # q makes ffmpeg write the trailer (moov) of the open segment, SIGINT does
+        # the same when it is blocked reading the camera, kill is the last resort
+        self.send_quit(process)
+        try:
+            process.wait(timeout / 2)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+        logging.warning(f"Camera '{self.name}': ffmpeg ignored q, sending SIGINT")
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout / 2)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+        logging.error(f"Camera '{self.name}': ffmpeg did not exit, killed, last segment may be truncated")
+        process.kill()
+        process.wait()
+
+    @staticmethod
+    def send_quit(process):
+        try:
+            process.stdin.write("q")
+            process.stdin.close()
+        except OSError:
+            pass
+
+    def stop_recording(self):
+        logging.info(f"Stopping recording for camera '{self.name}'")
+        self.running = False
+        self.stop_event.set()
+
+    def camera_names(self):
+        return [self.name]
+
+class CameraRecorder(FfmpegSupervisor):
+    def __init__(self, name, rtsp_url, output_folder, segment_time, events=None,
+                 stall_timeout=60, backoff_max=60, metrics=None, live=None,
+                 audio="aac", container="mp4", segment_align="keyframe"):
+        super().__init__(name, stall_timeout, backoff_max)
         self.rtsp_url = rtsp_url
         self.output_folder = output_folder
         self.segment_time = segment_time
-        self.running = False
+        self.events = events       # closed segments are published here
+        self.audio = audio
+        self.container = container
+        self.segment_align = segment_align
+        self.run_prefix = None
+        self.open_segment = None   # segment ffmpeg is writing, found lazily
+        self.metrics = metrics or CameraMetrics(name, segment_time)
+        self.live = live
         os.makedirs(self.output_folder, exist_ok=True)
 
-    def run(self):
-        unix_time = int(time.time())
-        output_template = os.path.join(
-            self.output_folder,
-            f"{unix_time}+%Y-%m-%d_%H-%M-%S.mp4"
-        )
+    def input_args(self):
+        # Without audio the camera's audio track isn't even set up
+        media = ["-allowed_media_types", "video"] if self.audio == "none" else []
+        return [
+            "-rtsp_transport", "tcp",  # use tcp
+            *media,
+            "-i", self.rtsp_url,       # rtsp type
+        ]
+
+    def pipeline_args(self):
+        # Codecs and container of the segment output; video is always stream copied
+        args = ["-c", "copy"]
+        if self.audio == "aac":
+            args += ["-c:a", "aac"]    # cameras often send G.711, which MP4 can't hold
+        elif self.audio == "none":
+            args += ["-an"]
+        if self.container == "ts":
+            args += ["-segment_format", "mpegts"]
+        elif self.container == "fmp4":
+            # Fragment per keyframe, a segment cut off by a crash or power loss stays playable
+            args += ["-segment_format", "mp4",
+                     "-segment_format_options", "movflags=+frag_keyframe+empty_moov+default_base_moof"]
+        if self.segment_align == "clock":
+            # Cuts at the first keyframe after each multiple of segment_time on the wall clock,
+            # segments of all cameras line up; without it they count from the ffmpeg start
+            args += ["-segment_atclocktime", "1"]
+        return args
+
+    def live_args(self, live_fd, input_index=0):
+        # Second output of the same ingest: video-only fragmented MP4 for the live view, no extra camera connection
+        args = [
+            "-map", f"{input_index}:v:0",
+            "-c:v", "copy",
+            "-f", "mp4",
+            "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        ]
+        if self.live.fragment_duration:
+            # Fragments also cut between keyframes, latency no longer waits for a whole GOP
+            args += ["-frag_duration", str(int(self.live.fragment_duration * 1000000))]
+        return args + ["-flush_packets", "1", f"pipe:{live_fd}"]
 
+    def build_command(self, unix_time, progress_fd, live_fd=None):
         # ffmpeg run command
-        ffmpeg_command = [
+        return [
             "ffmpeg",
             "-hide_banner",
             "-loglevel", "error",      # error logs ffmpeg
-            "-rtsp_transport", "tcp",  # use tcp
-            "-i", self.rtsp_url,       # rtsp type
-            "-c", "copy",              # no encoding
-            "-c:a", "aac",             # audio codec
+            "-progress", f"pipe:{progress_fd}",  # key=value stats for metrics
+            *self.input_args(),
+            *self.output_args(unix_time, "pipe:1", live_fd)
+        ]
+
+    def output_args(self, unix_time, segment_list, live_fd=None, input_index=None):
+        # Segment output (and live output) of this camera; input_index maps its streams when ffmpeg has several inputs
+        output_template = os.path.join(
+            self.output_folder,
+            f"{unix_time}+%Y-%m-%d_%H-%M-%S{CONTAINERS[self.container]}"
+        )
+        maps = []
+        if input_index is not None:
+            maps = ["-map", f"{input_index}:v:0"]
+            if self.audio != "none":
+                maps += ["-map", f"{input_index}:a?"]
+        return [
+            *maps,
+            *self.pipeline_args(),     # no video encoding
             "-f", "segment",           # segmentation
             "-segment_time", str(self.segment_time),  # segment duration
             "-strftime", "1",          # Time in filename
             "-reset_timestamps", "1",  # Reset timestamps for containers
+            "-segment_list", segment_list,  # Closed segments reported on a pipe
+            "-segment_list_type", "csv",   # filename,start,end per line
             "-metadata", f"description={self.name} {unix_time}",
             "-metadata", f"creation_time={unix_time}",
-            output_template
+            output_template,
+            *(self.live_args(live_fd, input_index or 0) if live_fd is not None else [])
         ]
 
-        logging.info(f"Сamera '{self.name}' Thread ID: {current_thread().ident}")
-        self.running = True
+    def restarted(self):
+        return self.metrics.restarted()
+
+    def run_ffmpeg(self):
+        # One ffmpeg run, returns why it ended
+        unix_time = int(time.time())
+        self.run_prefix = f"{unix_time}+"
+        self.open_segment = None
+        # stdout carries the segment list, progress gets its own pipe
+        progress_read, progress_write = os.pipe()
+        live_read, live_write = os.pipe() if self.live else (None, None)
+        pass_fds = (progress_write,) if live_write is None else (progress_write, live_write)
         try:
-            subprocess.run(ffmpeg_command, check=True)
-        except KeyboardInterrupt:
-            logging.warning(f"Recording for camera '{self.name}' stopped manually.")
-        except Exception as e:
-            logging.error(f"Error from camera '{self.name}': {e}")
+            # Own session: terminal Ctrl+C reaches only us, shutdown order is ours
+            process = subprocess.Popen(self.build_command(unix_time, progress_write, live_write), stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, text=True, start_new_session=True,
+                                       pass_fds=pass_fds)
+        except OSError as e:
+            os.close(progress_read)
+            if live_read is not None:
+                os.close(live_read)
+            return f"failed to start: {e}"
         finally:
-            self.running = False
-            logging.info(f"Thread completed for camera '{self.name}' with ID: {current_thread().ident}")
+            for fd in pass_fds:
+                os.close(fd)
+        self.process = process
+        self.metrics.started()
+        reader = Thread(target=self.read_segment_list, args=(process,), daemon=True)
+        reader.start()
+        Thread(target=self.read_progress, args=(progress_read,), daemon=True).start()
+        if live_read is not None:
+            Thread(target=self.read_live, args=(live_read,), daemon=True).start()
+        started = time.time()
+        try:
+            while process.poll() is None:
+                if self.stop_event.wait(SUPERVISE_INTERVAL):
+                    self.stop_ffmpeg(process)
+                    return "stopped"
+                last_write = max(started, self.open_segment_mtime() or 0)
+                if time.time() - last_write > self.stall_timeout:
+                    self.stop_ffmpeg(process)
+                    return f"stalled, no output for {int(time.time() - last_write)} s"
+            return f"exited with code {process.returncode}"
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            reader.join(timeout=5)
+            self.process = None
+            self.metrics.stopped()
+
+    def read_progress(self, fd):
+        with open(fd, "r") as stream:
+            self.metrics.read_progress(stream)
+
+    def read_live(self, fd):
+        with open(fd, "rb") as stream:
+            self.live.feed(stream)
+
+    def read_segment_list(self, process):
+        for line in process.stdout:
+            self.on_segment_closed(line)
+
+    def open_segment_mtime(self):
+        # One stat per check, the folder is listed only after a segment closed
+        for _ in range(2):
+            if self.open_segment is None:
+                self.open_segment = self.find_open_segment()
+                if self.open_segment is None:
+                    return None
+            try:
+                return os.stat(self.open_segment).st_mtime
+            except OSError:
+                self.open_segment = None
+        return None
+
+    def find_open_segment(self):
+        # Names of this run share the unix time prefix and sort chronologically
+        newest = None
+        with os.scandir(self.output_folder) as it:
+            for entry in it:
+                if entry.name.startswith(self.run_prefix) and (newest is None or entry.name > newest):
+                    newest = entry.name
+        return os.path.join(self.output_folder, newest) if newest else None
+
+    def on_segment_closed(self, line):
+        # segment_list csv entry: filename,start_time,end_time
+        fields = line.strip().split(",")
+        filename = fields[0]
+        if not filename:
+            return
+        segment_path = os.path.join(self.output_folder, filename)
+        self.open_segment = None
+        try:
+            duration = float(fields[2]) - float(fields[1])
+        except (IndexError, ValueError):
+            duration = 0
+        try:
+            size = os.path.getsize(segment_path)
+        except OSError:
+            return
+        if self.events:
+            self.events.publish(SegmentClosed(self.name, os.path.abspath(segment_path), segment_start(filename),
+                                              duration, size))
+
+class CameraGroupRecorder(FfmpegSupervisor):
+    """Several cameras recorded by one ffmpeg process and one thread.
+
+    Each camera keeps its CameraRecorder for naming, metrics and segment
+    handling; the group runs a single ffmpeg with one input and one segment
+    output per camera, and reads all segment lists and live outputs with a
+    selector. A camera that fails or stalls restarts the whole group; one
+    blamed for GROUP_EJECT_FAILURES runs in a row (by ffmpeg's errors or
+    the stall check) is moved to its own ffmpeg so the others can record.
+    """
+
+    def __init__(self, members, stall_timeout=60, backoff_max=60):
+        super().__init__("+".join(member.name for member in members), stall_timeout, backoff_max)
+        self.members = members
+        self.detached = []      # members recording in their own ffmpeg, stopped with the group
+        self.failures = {}      # member name -> failed runs in a row blamed on it
+        self.blamed = set()     # member names blamed in the current run
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            for member in self.detached:
+                member.stop_recording()
+            for member in self.detached:
+                member.join(STOP_TIMEOUT + 5)
+
+    def build_command(self, unix_time, list_fds, live_fds):
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+        for member in self.members:
+            command += member.input_args()
+        for index, member in enumerate(self.members):
+            command += member.output_args(unix_time, f"pipe:{list_fds[index]}", live_fds[index], index)
+        return command
+
+    def camera_names(self):
+        return [member.name for member in self.members + self.detached]
+
+    def restarted(self):
+        return max(member.metrics.restarted() for member in self.members)
 
     def stop_recording(self):
-        logging.info(f"Stopping recording for camera '{self.name}'")
-        self.running = False  # Update internal state if required
+        super().stop_recording()
+        for member in self.detached:
+            member.stop_recording()
+
+    def blame(self, line):
+        # ffmpeg names a failing input by index ([in#1 @ ...]) or by its URL
+        match = re.search(r"\bin#(\d+)", line)
+        if match and int(match.group(1)) < len(self.members):
+            self.blamed.add(self.members[int(match.group(1))].name)
+            return
+        for member in self.members:
+            if member.rtsp_url in line:
+                self.blamed.add(member.name)
+
+    def count_failures(self, reason):
+        # After a failed run: a camera blamed too often in a row leaves the group
+        if reason == "stopped" or not self.running:
+            return
+        if {member.name for member in self.members} <= self.blamed:
+            # Every camera at once is ffmpeg or the network, not one camera
+            return
+        for member in list(self.members):
+            if member.name not in self.blamed:
+                self.failures[member.name] = 0
+                continue
+            self.failures[member.name] = self.failures.get(member.name, 0) + 1
+            if self.failures[member.name] >= GROUP_EJECT_FAILURES and len(self.members) > 1:
+                self.detach(member)
+
+    def detach(self, member):
+        previous = self.name
+        self.members.remove(member)
+        self.failures.pop(member.name, None)
+        self.name = "+".join(camera.name for camera in self.members)
+        logging.warning(f"Camera '{member.name}' failed {GROUP_EJECT_FAILURES} runs of '{previous}' in a row, "
+                        f"recording it in its own ffmpeg, the group continues as '{self.name}'")
+        self.detached.append(member)
+        member.start()
+
+    def run_ffmpeg(self):
+        # One ffmpeg run for the group, returns why it ended
+        unix_time = int(time.time())
+        pipes = {}          # read end -> (member, 'list' | 'live')
+        list_fds = []
+        live_fds = []
+        for member in self.members:
+            member.run_prefix = f"{unix_time}+"
+            member.open_segment = None
+            list_read, list_write = os.pipe()
+            pipes[list_read] = (member, 'list')
+            list_fds.append(list_write)
+            if member.live:
+                live_read, live_write = os.pipe()
+                pipes[live_read] = (member, 'live')
+                live_fds.append(live_write)
+            else:
+                live_fds.append(None)
+        pass_fds = [fd for fd in list_fds + live_fds if fd is not None]
+        self.blamed = set()
+        try:
+            process = subprocess.Popen(self.build_command(unix_time, list_fds, live_fds), stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                       start_new_session=True, pass_fds=pass_fds)
+        except OSError as e:
+            for fd in pipes:
+                os.close(fd)
+            return f"failed to start: {e}"
+        finally:
+            for fd in pass_fds:
+                os.close(fd)
+        # stderr is read with the other pipes, errors tell which input failed
+        pipes[os.dup(process.stderr.fileno())] = (None, 'stderr')
+        process.stderr.close()
+        self.process = process
+        for member in self.members:
+            member.metrics.started()
+            if member.live:
+                member.live.begin()
+        try:
+            reason = self.supervise(process, pipes)
+            if self.blamed and not reason.startswith("stalled"):
+                reason += f", failing: {', '.join(sorted(self.blamed))}"
+            self.count_failures(reason)
+            return reason
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            self.process = None
+            for member in self.members:
+                member.metrics.stopped()
+
+    def supervise(self, process, pipes):
+        # Reads every pipe until ffmpeg closes them; a stop keeps reading so ffmpeg can finish its segments
+        selector = selectors.DefaultSelector()
+        lines = {}
+        for fd, target in pipes.items():
+            selector.register(fd, selectors.EVENT_READ, target)
+            lines[fd] = b""
+        started = time.time()
+        next_check = time.monotonic() + SUPERVISE_INTERVAL
+        reason = None
+        deadline = None     # for ffmpeg to exit after q, then after SIGINT
+        interrupted = False
+        try:
+            while selector.get_map():
+                for key, _ in selector.select(timeout=1):
+                    member, kind = key.data
+                    data = os.read(key.fd, PIPE_READ_SIZE)
+                    if not data:
+                        selector.unregister(key.fd)
+                        os.close(key.fd)
+                    elif kind == 'live':
+                        member.live.push(data)
+                    elif kind == 'stderr':
+                        *complete, lines[key.fd] = (lines[key.fd] + data).split(b"\n")
+                        for line in complete:
+                            line = line.decode(errors="replace").strip()
+                            if line:
+                                logging.warning(f"Camera '{self.name}': ffmpeg: {line}")
+                                self.blame(line)
+                    else:
+                        *complete, lines[key.fd] = (lines[key.fd] + data).split(b"\n")
+                        for line in complete:
+                            member.on_segment_closed(line.decode(errors="replace"))
+
+                if process.poll() is not None:
+                    continue
+                if reason is None:
+                    if self.stop_event.is_set():
+                        reason = "stopped"
+                    elif time.monotonic() >= next_check:
+                        next_check = time.monotonic() + SUPERVISE_INTERVAL
+                        stalled = [member.name for member in self.members
+                                   if time.time() - max(started, member.open_segment_mtime() or 0) > self.stall_timeout]
+                        self.blamed.update(stalled)
+                        if stalled:
+                            reason = f"stalled, no output from {', '.join(stalled)}"
+                    if reason is not None:
+                        self.send_quit(process)
+                        deadline = time.monotonic() + STOP_TIMEOUT / 2
+                elif time.monotonic() > deadline:
+                    if not interrupted:
+                        logging.warning(f"Camera '{self.name}': ffmpeg ignored q, sending SIGINT")
+                        process.send_signal(signal.SIGINT)
+                        interrupted = True
+                        deadline = time.monotonic() + STOP_TIMEOUT / 2
+                    else:
+                        logging.error(f"Camera '{self.name}': ffmpeg did not exit, killed, last segments may be truncated")
+                        process.kill()
+        finally:
+            for fd in list(selector.get_map()):
+                selector.unregister(fd)
+                os.close(fd)
+            selector.close()
+        try:
+            process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        return reason or f"exited with code {process.wait()}"
+
+def config_number(value, key, convert=float):
+    try:
+        number = convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{key}' is not a number: {value!r}") from None
+    if number < 0:
+        raise ValueError(f"'{key}' is negative: {value!r}")
+    return number
+
+def parse_settings(config):
+    # Everything the recorders are built from as plain values, checked before a running camera is touched;
+    # ValueError names the first bad key
+    if not isinstance(config, dict):
+        raise ValueError("config is not a mapping")
+    cameras = {}
+    camera_list = config.get("cameras")
+    if not isinstance(camera_list, list):
+        raise ValueError("'cameras' is not a list")
+    for camera in camera_list:
+        if not isinstance(camera, dict) or not camera.get("name") or not camera.get("rtsp_url"):
+            raise ValueError(f"camera without name or rtsp_url: {camera!r}")
+        if camera["name"] in cameras:
+            raise ValueError(f"camera '{camera['name']}' listed twice")
+        cameras[camera["name"]] = camera
+    ingest = config.get("ingest") or {}
+    live = config.get("live") or {}
+    recording = config.get("recording") or {}
+    if not isinstance(ingest, dict) or not isinstance(live, dict) or not isinstance(recording, dict):
+        raise ValueError("'ingest', 'live' and 'recording' must be mappings")
+    try:
+        retention_limits(config)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError(f"'retention': {e}") from None
+    web = config.get("web_server") or {}
+    config_number(web.get("port", 0), "web_server.port", int)
+    config_number(web.get("connection_timeout", 60), "web_server.connection_timeout")
+
+    segment_time = config.get("segment_duration", 60)
+    config_number(segment_time, "segment_duration")
+    return {
+        'segment_time': segment_time,   # passed to ffmpeg as written
+        'stall_timeout': config_number(config.get("stall_timeout", 60), "stall_timeout"),
+        'backoff_max': config_number(config.get("restart_backoff_max", 60), "restart_backoff_max"),
+        'group_size': max(config_number(ingest.get("group_size", 1), "ingest.group_size", int), 1),
+        'live_duration': config_number(live.get("fragment_ms", 500), "live.fragment_ms") / 1000
+                         if live.get("enabled", True) else None,
+        'recording': recording,
+        'cameras': cameras
+    }
 
 class MultiCameraRecorder:
-    def __init__(self, config_file):
+    def __init__(self, config_file, events=None, metrics=None, live=None):
         self.config_file = config_file
         self.config = self.load_config()
-        self.segment_time = self.config.get("segment_duration", 60)
+        self.output_folder = self.config.get("output_folder", "cam")
+        self.apply_settings(parse_settings(self.config))
+        self.events = events
+        self.metrics = metrics or RecorderMetrics(self.output_folder)
+        self.live = live if live is not None else {}    # shared with the webserver and metrics
         self.recorders = []
+        self.specs = {}     # camera name -> settings its running recorder was built from
 
     def load_config(self):
         with open(self.config_file, "r") as f:
             config = yaml.safe_load(f)
         return config
 
+    def apply_settings(self, settings):
+        self.segment_time = settings['segment_time']
+        self.stall_timeout = settings['stall_timeout']
+        self.backoff_max = settings['backoff_max']
+        self.group_size = settings['group_size']
+        self.live_duration = settings['live_duration']
+        self.recording = settings['recording']
+
+    def pipeline(self, camera):
+        # Camera keys override the recording: defaults, unknown values fall back to the default
+        settings = {}
+        for key, choices in (("audio", AUDIO_MODES), ("container", tuple(CONTAINERS)), ("segment_align", SEGMENT_ALIGN)):
+            value = str(camera.get(key, self.recording.get(key, choices[0]))).lower()
+            if value not in choices:
+                logging.warning(f"Camera '{camera['name']}': unknown {key} '{value}', using {choices[0]}")
+                value = choices[0]
+            settings[key] = value
+        return settings
+
+    def camera_spec(self, camera):
+        # A camera's recorder is restarted on reload when this changes; retention limits don't need it
+        grouped = self.group_size > 1 and not camera.get("own_process", False)
+        spec = {key: value for key, value in camera.items() if key != "retention"}
+        spec.update(segment_duration=self.segment_time, stall_timeout=self.stall_timeout,
+                    restart_backoff_max=self.backoff_max, group_size=self.group_size if grouped else 1,
+                    live=self.live_duration, recording=self.recording)
+        return spec
+
     def start_recording(self):
         logging.info(f"Starting recording for all cameras. Main Thread ID: {current_thread().ident}")
+        self.start_cameras(self.config.get("cameras", []))
 
-        for camera in self.config.get("cameras", []):
+    def start_cameras(self, cameras):
+        started = []
+        grouped = []
+        for camera in cameras:
             name = camera["name"]
             rtsp_url = camera["rtsp_url"]
-            output_folder = self.config.get("output_folder", "cam") + "/" + name
-            recorder = CameraRecorder(name, rtsp_url, output_folder, self.segment_time)
-            self.recorders.append(recorder)
+            output_folder = self.output_folder + "/" + name
+            recorder = CameraRecorder(name, rtsp_url, output_folder, self.segment_time, self.events,
+                                      stall_timeout=self.stall_timeout, backoff_max=self.backoff_max,
+                                      metrics=self.metrics.camera(name, self.segment_time),
+                                      live=self.live.get(name), **self.pipeline(camera))
+            self.specs[name] = self.camera_spec(camera)
+            if self.group_size > 1 and not camera.get("own_process", False):
+                grouped.append(recorder)
+            else:
+                started.append(recorder)
+
+        # One ffmpeg and one thread per group_size cameras
+        for first in range(0, len(grouped), max(self.group_size, 1)):
+            members = grouped[first:first + self.group_size]
+            if len(members) == 1:
+                started.append(members[0])
+            else:
+                started.append(CameraGroupRecorder(members, self.stall_timeout, self.backoff_max))
+        for recorder in started:
             recorder.start()
+        self.recorders.extend(started)
+        return started
+
+    def reload(self):
+        # Restarts only the recorders whose cameras changed, the others keep recording into their open segment
+        try:
+            config = self.load_config()
+            settings = parse_settings(config)
+        except Exception as e:
+            logging.error(f"Config reload failed, keeping the running config: {e}")
+            return None
+        self.apply_settings(settings)
+        cameras = settings['cameras']
+        specs = {name: self.camera_spec(camera) for name, camera in cameras.items()}
+        changed = [recorder for recorder in self.recorders
+                   if any(specs.get(name) != self.specs.get(name) for name in recorder.camera_names())]
+        self.stop_recorders(changed)
+        running = {name for recorder in self.recorders for name in recorder.camera_names()}
+
+        # Metrics render /metrics from live on the webserver threads, under the same lock
+        with self.metrics.lock:
+            for name in list(self.live):
+                if name not in cameras or self.live_duration is None:
+                    del self.live[name]
+            if self.live_duration is not None:
+                for name in cameras:
+                    self.live.setdefault(name, LiveStream(name, self.live_duration)).fragment_duration = self.live_duration
+        for name in set(self.metrics.cameras) - set(cameras):
+            self.metrics.remove(name)
+
+        started = self.start_cameras([camera for name, camera in cameras.items() if name not in running])
+        self.config = config
+        logging.info(f"Config reloaded: {len(changed)} recorders stopped, {len(started)} started, "
+                     f"{len(self.recorders) - len(started)} unchanged")
+        return config
 
     def stop_recording(self):
         logging.info("Stopping recording for all cameras.")
-        for recorder in self.recorders:
+        self.stop_recorders(list(self.recorders))
+
+    def stop_recorders(self, recorders):
+        # Signal all first so the cameras finalize their segments in parallel
+        for recorder in recorders:
             recorder.stop_recording()
+        for recorder in recorders:
+            recorder.join(STOP_TIMEOUT + 5)
+            if recorder.is_alive():
+                logging.error(f"Camera '{recorder.name}' did not stop in time")
+            self.recorders.remove(recorder)
+            for name in recorder.camera_names():
+                self.specs.pop(name, None)
 
 class WebServer(Thread):
-    def __init__(self, config):
-        super().__init__()
+    def __init__(self, config, media_index=None, metrics=None, segment_index=None, thumbnails=None, live=None,
+                 activity_index=None):
+        super().__init__(daemon=True)
+        self.config = config
+        self.media_index = media_index
+        self.metrics = metrics
+        self.segment_index = segment_index
+        self.thumbnails = thumbnails
+        self.live = live
+        self.activity_index = activity_index
+        self.server = None
+
+    def reload(self, config):
+        # Port, credentials and connection timeout apply without dropping open connections
+        settings = config.get("web_server") or {}
+        if self.server is None:
+            return
+        self.server.reconfigure(int(settings.get("port", self.server.port)), settings.get("user"),
+                                settings.get("password_hash"), float(settings.get("connection_timeout", 60)))
         self.config = config
 
     def run(self):
@@ -117,11 +730,25 @@ class WebServer(Thread):
             pass_hash = self.config.get("web_server").get("password_hash")
             page_path = self.config.get("web_server").get("html_page")
             dir_path = self.config.get("output_folder")
+            max_connections = self.config.get("web_server").get("max_connections", 32)
+            connection_timeout = self.config.get("web_server").get("connection_timeout", 60)
+            transcode_workers = self.config.get("web_server").get("transcode_workers", 1)
+            transcode_idle_timeout = self.config.get("web_server").get("transcode_idle_timeout", 30)
+            cache_max_mb = self.config.get("web_server").get("cache_max_mb", 10240)
+            cache_max_age_days = self.config.get("web_server").get("cache_max_age_days", 7)
+            transcode_mode = self.config.get("web_server").get("transcode_mode", "full")
             
-            server = VideoServer(html_template=page_path, port=int(port), directory=dir_path, username=user, password_hash=pass_hash)
+            server = VideoServer(html_template=page_path, port=int(port), directory=dir_path, username=user, password_hash=pass_hash, media_index=self.media_index,
+                                 max_connections=int(max_connections), connection_timeout=float(connection_timeout),
+                                 transcode_workers=int(transcode_workers), transcode_idle_timeout=float(transcode_idle_timeout),
+                                 cache_max_bytes=int(float(cache_max_mb) * 1024 * 1024), cache_max_age=float(cache_max_age_days) * 86400,
+                                 transcode_mode=transcode_mode, metrics=self.metrics,
+                                 segment_index=self.segment_index, thumbnails=self.thumbnails,
+                                 live=self.live, activity=self.activity_index)
             
             logging.info(f"Webserver thread ID: {current_thread().ident}. Port: {port}  User: {user}, Page: {page_path}")
             
+            self.server = server
             server.start()
         else:
             logging.warning("Webserver disabled")
@@ -132,6 +759,100 @@ class WebServer(Thread):
             
             
 
+def start_activity(config):
+    settings = config.get("activity") or {}
+    if not settings.get("enabled", False):
+        return None
+    if activity.numpy is None:
+        logging.warning("Activity analysis needs numpy (pip install numpy), disabled")
+        return None
+    return activity.ActivityIndex(os.path.join(CACHE_DIR, "activity.db"),
+                                  workers=int(settings.get("workers", 1)),
+                                  threshold=int(settings.get("threshold", 5)))
+
+def retention_limits(config):
+    max_age, max_bytes = limits_from_config(config.get("retention") or {})
+    camera_limits = {}
+    for camera in config.get("cameras", []):
+        if camera.get("retention"):
+            camera_limits[camera["name"]] = limits_from_config(camera["retention"])
+    return max_age, max_bytes, camera_limits
+
+def start_retention(config, segment_index, media_index, activity_index=None):
+    settings = config.get("retention") or {}
+    max_age, max_bytes, camera_limits = retention_limits(config)
+    if not max_age and not max_bytes and not any(any(limits) for limits in camera_limits.values()):
+        logging.info("Retention disabled, recordings are kept forever")
+        return None
+
+    retention = RetentionManager(segment_index, max_age, max_bytes, camera_limits, media_index,
+                                 activity_index=activity_index,
+                                 batch_size=int(settings.get("delete_batch", 20)),
+                                 batch_interval=float(settings.get("delete_interval", 1)))
+    retention.start()
+    logging.info(f"Retention: max age {max_age or '-'} s, max bytes {max_bytes or '-'}, {len(camera_limits)} camera limits")
+    return retention
+
+def start_thumbnails(config, media_index):
+    settings = config.get("thumbnails") or {}
+    if not settings.get("enabled", True):
+        logging.info("Thumbnails disabled")
+        return None
+    return ThumbnailStore(os.path.join(CACHE_DIR, "thumbnails"),
+                          workers=int(settings.get("workers", 1)),
+                          sprites=bool(settings.get("sprites", True)),
+                          max_bytes=int(float(settings.get("max_mb", 1024)) * 1024 * 1024),
+                          probe_cache=media_index)
+
+def start_live(config):
+    settings = config.get("live") or {}
+    if not settings.get("enabled", True):
+        logging.info("Live view disabled")
+        return {}
+    fragment_duration = float(settings.get("fragment_ms", 500)) / 1000
+    return {camera["name"]: LiveStream(camera["name"], fragment_duration) for camera in config.get("cameras", [])}
+
+def subscribe_segment_consumers(events, metrics, segment_index, media_index, thumbnails=None, activity_index=None,
+                                retention=None):
+    # Each one gets its own queue and thread, none of them can hold up a recorder
+    events.subscribe("metrics", metrics.segment_closed)
+    # A segment missing from the index would never be deleted by retention, these two get every event
+    events.subscribe("segment_index", lambda event: segment_index.add(event.camera, event.path, event.size,
+                                                                      event.duration), max_queue=LOSSLESS)
+    events.subscribe("media_index", lambda event: media_index.request_probe(event.path))
+    if thumbnails:
+        events.subscribe("thumbnails", lambda event: thumbnails.request(event.path, duration=event.duration))
+    if activity_index:
+        events.subscribe("activity", lambda event: activity_index.request(event.path, event.duration))
+    if retention:
+        events.subscribe("retention", retention.segment_closed, max_queue=LOSSLESS)
+
+def config_mtime(config_file):
+    try:
+        return os.stat(config_file).st_mtime_ns
+    except OSError:
+        return None
+
+def reload_config(recorder_manager, webserver, retention):
+    # SIGHUP or config.yml changed: cameras, webserver and retention limits are applied in place
+    previous = recorder_manager.config
+    config = recorder_manager.reload()
+    if config is None:
+        return
+    webserver.reload(config)
+    max_age, max_bytes, camera_limits = retention_limits(config)
+    if retention is not None:
+        retention.max_age, retention.max_bytes, retention.camera_limits = max_age, max_bytes, camera_limits
+    elif max_age or max_bytes or any(any(limits) for limits in camera_limits.values()):
+        logging.warning("Config reload: retention was disabled at start, restart the recorder to enable it")
+    for key in ("log_file", "output_folder", "thumbnails", "activity"):
+        if config.get(key) != previous.get(key):
+            logging.warning(f"Config reload: '{key}' changed, applied on the next restart of the recorder")
+    web, previous_web = config.get("web_server") or {}, previous.get("web_server") or {}
+    for key in set(web) | set(previous_web):
+        if key not in RELOADABLE_WEB_SETTINGS and web.get(key) != previous_web.get(key):
+            logging.warning(f"Config reload: 'web_server.{key}' changed, applied on the next restart of the recorder")
+
 def main():
     CONFIG_FILE = "config.yml"
     
@@ -145,18 +866,55 @@ def main():
 
     # Setup logging
     setup_global_logging(log_file)
-    recorder_manager = MultiCameraRecorder(CONFIG_FILE)
+    # Shared by recorders (fill on segment close) and webserver (archive listing)
+    media_index = MediaIndex(os.path.join(CACHE_DIR, "media_index.db"))
+    # Per second motion scores of closed segments, optional
+    activity_index = start_activity(config)
+    # Live view rings, fed by the recorders' ffmpeg
+    live = start_live(config)
+    # Recorders publish closed segments, everything below subscribes
+    events = EventBus()
+    # Filled by the recorders, served on the webserver port at /metrics
+    metrics = RecorderMetrics(config.get("output_folder", "cam"), live, events)
+    # Closed segments by camera and start time, built once in the background
+    segment_index = SegmentIndex(config.get("output_folder", "cam"))
+    Thread(target=segment_index.build, daemon=True).start()
+    # Listing thumbnails and hover sprites, generated as segments close
+    thumbnails = start_thumbnails(config, media_index)
+    recorder_manager = MultiCameraRecorder(CONFIG_FILE, events, metrics, live)
+    retention = start_retention(config, segment_index, media_index, activity_index)
+    subscribe_segment_consumers(events, metrics, segment_index, media_index, thumbnails, activity_index, retention)
+
+    # systemd stops the service with SIGTERM, reloads it with SIGHUP
+    stop_requested = Event()
+    reload_requested = Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload_requested.set())
 
     try:
         recorder_manager.start_recording()
-        webserver = WebServer(config)
+        webserver = WebServer(config, media_index, metrics, segment_index, thumbnails, live, activity_index)
         webserver.start()
 
-        while True:
-            time.sleep(1)
+        # Editors write in several steps, a change is reloaded once the file stayed the same for a second
+        loaded_mtime = changed_mtime = config_mtime(CONFIG_FILE)
+        while not stop_requested.wait(1):
+            mtime = config_mtime(CONFIG_FILE)
+            if reload_requested.is_set() or (mtime != loaded_mtime and mtime == changed_mtime):
+                reload_requested.clear()
+                loaded_mtime = mtime
+                logging.info("Reloading config")
+                try:
+                    reload_config(recorder_manager, webserver, retention)
+                except Exception:
+                    # A bad edit must never end supervision, SIGTERM still has to stop the cameras
+                    logging.exception("Config reload failed")
+            changed_mtime = mtime
+        logging.info("SIGTERM received, stopping recording.")
     except KeyboardInterrupt:
         logging.info("Stopping recording manually.")
-        recorder_manager.stop_recording()
+    recorder_manager.stop_recording()
+    events.close()
 
 if __name__ == "__main__":
     main()
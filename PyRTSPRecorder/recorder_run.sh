@@ -1,10 +1,9 @@
 #!/bin/bash
 
-CONFIG_FILE="config.yml"
 PID_FILE="recorder.pid"
 
-segment_duration=$(grep 'segment_duration:' "$CONFIG_FILE" | awk '{print $2}')
-output_folder=$(grep 'output_folder:' "$CONFIG_FILE" | awk '{print $2}' | tr -d "\"'")
+# Stalled or dropped cameras are restarted inside recorder_main.py,
+# this only brings back the Python process itself.
 
 start_process() {
     nohup python3 recorder_main.py > /dev/null 2>&1 &
@@ -12,31 +11,35 @@ start_process() {
 }
 
 stop_process() {
-    [ -f "$PID_FILE" ] && kill $(cat "$PID_FILE") 2>/dev/null && rm -f "$PID_FILE"
+    # SIGTERM lets the recorder finalize the open segments, wait until it is done
+    if [ -f "$PID_FILE" ]; then
+        pid=$(cat "$PID_FILE")
+        kill "$pid" 2>/dev/null
+        while kill -0 "$pid" 2>/dev/null; do
+            sleep 1
+        done
+        rm -f "$PID_FILE"
+    fi
+}
+
+reload_process() {
+    # SIGHUP re-reads config.yml, only changed cameras are restarted
+    if [ -f "$PID_FILE" ]; then
+        kill -HUP "$(cat "$PID_FILE")" 2>/dev/null
+    fi
 }
 
+trap 'stop_process; exit 0' TERM INT
+trap 'reload_process' HUP
 
 start_process
 
 while true; do
-    sleep 60
+    # Background sleep so the trap runs without waiting for it
+    sleep 60 &
+    wait $!
 
     if [ -f "$PID_FILE" ] && ! kill -0 $(cat "$PID_FILE") 2>/dev/null; then
         start_process
-        continue
-    fi
-
-    if [ -d "$output_folder" ]; then
-        latest=$(find "$output_folder" -type f -printf '%T@\n' 2>/dev/null | sort -rn | head -1)
-        if [ -n "$latest" ]; then
-            diff=$(echo "$(date +%s) - ${latest%.*}" | bc)
-            threshold=$((segment_duration + 120))
-
-            if [ "$diff" -gt "$threshold" ]; then
-                stop_process
-                sleep 2
-                start_process
-            fi
-        fi
     fi
 done
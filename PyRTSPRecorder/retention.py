@@ -0,0 +1,121 @@
+import os
+import time
+import heapq
+import bisect
+import logging
+import threading
+
+GB = 1024 ** 3
+DAY = 86400
+
+
+def limits_from_config(settings):
+    # (max_age seconds, max_bytes) from a retention: block, 0 or missing means no limit
+    settings = settings or {}
+    max_age = float(settings.get("max_age_days") or 0) * DAY
+    max_bytes = int(float(settings.get("max_gb") or 0) * GB)
+    return max_age or None, max_bytes or None
+
+
+class RetentionManager(threading.Thread):
+    """Deletes the oldest recorder segments once a camera or the whole
+    archive is over its age or size limit.
+
+    Candidates come from the SegmentIndex, deletions run in small batches
+    with a pause in between so they don't compete with the recorders' writes.
+    """
+
+    def __init__(self, segment_index, max_age=None, max_bytes=None, camera_limits=None, media_index=None,
+                 batch_size=20, batch_interval=1.0, check_interval=60, activity_index=None):
+        super().__init__(daemon=True)
+        self.segment_index = segment_index
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.camera_limits = camera_limits or {}   # camera -> (max_age, max_bytes)
+        self.media_index = media_index
+        self.activity_index = activity_index
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = batch_interval
+        self.check_interval = check_interval
+        self.removed = 0
+        self.freed_bytes = 0
+        self.wake = threading.Event()
+
+    def run(self):
+        self.segment_index.built.wait()
+        while True:
+            try:
+                self.enforce()
+            except Exception as e:
+                logging.error(f"Retention: {e}")
+            self.wake.wait(self.check_interval)
+            self.wake.clear()
+
+    def segment_closed(self, event):
+        # Size limits are checked as soon as a segment lands, age limits can wait for the next round
+        if self.max_bytes or any(max_bytes for _, max_bytes in self.camera_limits.values()):
+            self.wake.set()
+
+    def select(self, now=None):
+        # Oldest first, per camera the victims are always a prefix of its segments
+        now = now or time.time()
+        index = self.segment_index
+        with index.lock:
+            counts = {}
+            remaining = index.total_bytes
+            for name, camera in index.cameras.items():
+                max_age, max_bytes = self.camera_limits.get(name, (None, None))
+                count = bisect.bisect_left(camera.starts, now - max_age) if max_age else 0
+                if self.max_age:
+                    count = max(count, bisect.bisect_left(camera.starts, now - self.max_age))
+                size = camera.total_bytes - sum(segment.size for segment in camera.segments[:count])
+                while max_bytes and size > max_bytes and count < len(camera.segments):
+                    size -= camera.segments[count].size
+                    count += 1
+                counts[name] = count
+                remaining -= camera.total_bytes - size
+
+            if self.max_bytes and remaining > self.max_bytes:
+                # Globally oldest next, across cameras
+                heads = [(camera.starts[counts[name]], name) for name, camera in index.cameras.items()
+                         if counts[name] < len(camera.segments)]
+                heapq.heapify(heads)
+                while heads and remaining > self.max_bytes:
+                    _, name = heapq.heappop(heads)
+                    camera = index.cameras[name]
+                    remaining -= camera.segments[counts[name]].size
+                    counts[name] += 1
+                    if counts[name] < len(camera.segments):
+                        heapq.heappush(heads, (camera.starts[counts[name]], name))
+
+            victims = [segment for name, count in counts.items() for segment in index.cameras[name].segments[:count]]
+        victims.sort(key=lambda segment: segment.start)
+        return victims
+
+    def enforce(self):
+        victims = self.select()
+        if not victims:
+            return
+        removed = 0
+        freed = 0
+        for offset in range(0, len(victims), self.batch_size):
+            if offset:
+                time.sleep(self.batch_interval)
+            for segment in victims[offset:offset + self.batch_size]:
+                try:
+                    os.remove(segment.path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"Retention: cannot remove {segment.path}: {e}")
+                    continue
+                self.segment_index.remove(segment)
+                if self.media_index:
+                    self.media_index.remove(segment.path)
+                if self.activity_index:
+                    self.activity_index.remove(segment.path)
+                removed += 1
+                freed += segment.size
+        self.removed += removed
+        self.freed_bytes += freed
+        logging.info(f"Retention: removed {removed} segments, {freed / 1024 / 1024:.1f} MB")
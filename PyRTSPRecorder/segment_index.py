@@ -0,0 +1,225 @@
+import os
+import re
+import math
+import time
+import bisect
+import logging
+import threading
+from dir_index import VIDEO_EXTENSIONS
+
+# {unix}+%Y-%m-%d_%H-%M-%S.mp4 as written by CameraRecorder, the unix prefix is the ffmpeg run start
+SEGMENT_NAME = re.compile(r'^\d+\+(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.\w+$')
+MAX_SEGMENT_SECONDS = 6 * 3600
+
+
+def segment_start(name):
+    # Start time from a segment file name (local time, as ffmpeg -strftime wrote it), None for other files
+    match = SEGMENT_NAME.match(name)
+    if not match or os.path.splitext(name)[1].lower() not in VIDEO_EXTENSIONS:
+        return None
+    try:
+        return time.mktime(time.strptime(match.group(1), '%Y-%m-%d_%H-%M-%S'))
+    except ValueError:
+        return None
+
+
+class Segment:
+    __slots__ = ('camera', 'start', 'path', 'size', 'duration')
+
+    def __init__(self, camera, start, path, size, duration=None):
+        self.camera = camera
+        self.start = start
+        self.path = path
+        self.size = size
+        self.duration = duration
+
+
+class CameraSegments:
+    def __init__(self):
+        self.starts = []        # sorted, parallel to segments
+        self.segments = []
+        self.paths = {}         # path -> segment
+        self.total_bytes = 0
+
+    def add(self, segment):
+        # Bytes added; a known path (e.g. indexed while still open) gets its final size
+        known = self.paths.get(segment.path)
+        if known is not None:
+            delta = segment.size - known.size
+            known.size = segment.size
+            known.duration = segment.duration or known.duration
+            self.total_bytes += delta
+            return delta
+        # New segments arrive in order, insort is an append then
+        position = bisect.bisect_right(self.starts, segment.start)
+        self.starts.insert(position, segment.start)
+        self.segments.insert(position, segment)
+        self.paths[segment.path] = segment
+        self.total_bytes += segment.size
+        return segment.size
+
+    def end_of(self, position):
+        # Duration from the segment list, else where the next one starts
+        segment = self.segments[position]
+        if segment.duration:
+            return segment.start + segment.duration
+        if position + 1 < len(self.segments):
+            return self.starts[position + 1]
+        return math.inf
+
+    def remove(self, segment):
+        if self.paths.pop(segment.path, None) is None:
+            return False
+        position = bisect.bisect_left(self.starts, segment.start)
+        while self.segments[position].path != segment.path:
+            position += 1
+        del self.starts[position]
+        del self.segments[position]
+        self.total_bytes -= segment.size
+        return True
+
+
+class SegmentIndex:
+    """Closed recorder segments per camera, sorted by start time.
+
+    Built once from the camera folders under the recordings directory, then
+    kept current by the recorders as segments close, so consumers never walk
+    the tree again.
+    """
+
+    def __init__(self, base_directory):
+        self.base_directory = os.path.abspath(base_directory)
+        self.lock = threading.Lock()
+        self.cameras = {}       # camera name (folder) -> CameraSegments
+        self.total_bytes = 0
+        self.built = threading.Event()
+
+    def build(self):
+        started = time.time()
+        count = 0
+        try:
+            with os.scandir(self.base_directory) as it:
+                folders = [entry for entry in it if entry.is_dir() and not entry.name.startswith('.')]
+        except OSError as e:
+            logging.warning(f"Segment index: cannot list {self.base_directory}: {e}")
+            folders = []
+        for folder in folders:
+            segments = []
+            with os.scandir(folder.path) as it:
+                for entry in it:
+                    start = segment_start(entry.name)
+                    if start is None:
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    # Last write of a closed segment is its end, copied files may carry any mtime
+                    duration = stat.st_mtime - start
+                    duration = duration if 0 < duration < MAX_SEGMENT_SECONDS else None
+                    segments.append(Segment(folder.name, start, entry.path, stat.st_size, duration))
+            with self.lock:
+                # Segments that closed while scanning are in already, with their final size
+                known = self.cameras[folder.name].paths if folder.name in self.cameras else {}
+                for segment in segments:
+                    if segment.path not in known:
+                        self._add(segment)
+                        count += 1
+        self.built.set()
+        logging.info(f"Segment index: {count} segments of {len(folders)} cameras in {time.time() - started:.1f} s")
+
+    def _add(self, segment):
+        camera = self.cameras.get(segment.camera)
+        if camera is None:
+            camera = self.cameras[segment.camera] = CameraSegments()
+        self.total_bytes += camera.add(segment)
+
+    def add(self, camera, path, size=None, duration=None):
+        # Called when a segment closed
+        start = segment_start(os.path.basename(path))
+        if start is None:
+            return None
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return None
+        segment = Segment(camera, start, os.path.abspath(path), size, duration)
+        with self.lock:
+            self._add(segment)
+        return segment
+
+    def remove(self, segment):
+        with self.lock:
+            camera = self.cameras.get(segment.camera)
+            if camera is not None and camera.remove(segment):
+                self.total_bytes -= segment.size
+
+    def range(self, camera, start, end):
+        # Segments overlapping [start, end) in time order, O(log n) to find the ends
+        with self.lock:
+            segments = self.cameras.get(camera)
+            if segments is None:
+                return []
+            first = bisect.bisect_right(segments.starts, start) - 1
+            if first < 0 or segments.end_of(first) <= start:
+                first += 1
+            last = bisect.bisect_left(segments.starts, end)
+            return segments.segments[first:last]
+
+    def locate(self, camera, when):
+        # (segment, offset seconds) showing `when`, (None, None) in a gap
+        with self.lock:
+            segments = self.cameras.get(camera)
+            if segments is None:
+                return None, None
+            position = bisect.bisect_right(segments.starts, when) - 1
+            if position >= 0 and when < segments.end_of(position):
+                segment = segments.segments[position]
+                return segment, when - segment.start
+            return None, None
+
+    def next_start(self, camera, when):
+        # Start of the first segment after `when`, None past the end
+        with self.lock:
+            segments = self.cameras.get(camera)
+            if segments is None:
+                return None
+            position = bisect.bisect_right(segments.starts, when)
+            return segments.starts[position] if position < len(segments.starts) else None
+
+    def coverage(self, camera, start, end, gap=2.0):
+        # Recorded [start, end] spans within the window, back-to-back segments merged
+        spans = []
+        with self.lock:
+            segments = self.cameras.get(camera)
+            if segments is None:
+                return spans
+            first = max(bisect.bisect_right(segments.starts, start) - 1, 0)
+            last = bisect.bisect_left(segments.starts, end)
+            for position in range(first, last):
+                span_start = max(segments.starts[position], start)
+                span_end = min(segments.end_of(position), end)
+                if span_end <= span_start:
+                    continue
+                if spans and span_start - spans[-1][1] <= gap:
+                    spans[-1][1] = max(spans[-1][1], span_end)
+                else:
+                    spans.append([span_start, span_end])
+        return spans
+
+    def summary(self):
+        with self.lock:
+            cameras = []
+            for name, segments in sorted(self.cameras.items()):
+                if not segments.segments:
+                    continue
+                last = segments.end_of(len(segments.segments) - 1)
+                cameras.append({
+                    'name': name,
+                    'first': segments.starts[0],
+                    'last': last if last != math.inf else segments.starts[-1],
+                    'segments': len(segments.segments),
+                    'size': segments.total_bytes
+                })
+            return cameras
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules import each other by name, like recorder_main.py run from this directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
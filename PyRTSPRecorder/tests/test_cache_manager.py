@@ -0,0 +1,97 @@
+import os
+import json
+
+from cache_manager import TranscodeCache, MANIFEST_NAME, TEMP_DIR
+
+
+def write(path, size=10):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def test_unfinished_transcodes_removed_with_manifest(tmp_path):
+    write(tmp_path / 'a_11111111_22222222_h264.mp4', 100)
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps({
+        'a_11111111_22222222_h264.mp4': {'source': None, 'size': 100, 'created': 0, 'last_access': 0}
+    }))
+    temp = tmp_path / TEMP_DIR
+    temp.mkdir()
+    write(temp / 'b_11111111_22222222_h264.mp4.0a1b2c3d.part')
+    write(temp / 'c_11111111_22222222_h264.mp4.0a1b2c3d.part.frag')
+    chunks = temp / 'd_11111111_22222222_h264.mp4.0a1b2c3d.part.chunks'
+    chunks.mkdir()
+    write(chunks / 'src_00000.mp4')
+    write(tmp_path / 'notes.part')
+
+    cache = TranscodeCache(str(tmp_path), max_age=0)
+
+    assert sorted(os.listdir(tmp_path)) == ['a_11111111_22222222_h264.mp4', MANIFEST_NAME, 'notes.part', TEMP_DIR]
+    assert os.listdir(temp) == []
+    assert list(cache.entries) == ['a_11111111_22222222_h264.mp4']
+    assert cache.total_bytes == 100
+
+
+def test_unfinished_transcodes_removed_without_manifest(tmp_path):
+    write(tmp_path / 'a_11111111_22222222_h264.mp4', 100)
+    (tmp_path / TEMP_DIR).mkdir()
+    write(tmp_path / TEMP_DIR / 'a_11111111_22222222_h264.mp4.0a1b2c3d.part', 50)
+
+    cache = TranscodeCache(str(tmp_path), max_age=0)
+
+    assert os.listdir(tmp_path / TEMP_DIR) == []
+    assert list(cache.entries) == ['a_11111111_22222222_h264.mp4']
+    assert cache.total_bytes == 100
+
+
+def add_transcode(cache, tmp_path, name, size):
+    source = tmp_path / f'{name}.mp4'
+    source.write_bytes(b'source')
+    cache_path = cache.path_for(str(source))
+    write(cache_path, size)
+    cache.add(cache_path, str(source))
+    return source, cache_path
+
+
+def test_least_recently_used_evicted_over_budget(tmp_path):
+    cache = TranscodeCache(str(tmp_path / 'cache'), max_bytes=250)
+    _, first = add_transcode(cache, tmp_path, 'first', 100)
+    _, second = add_transcode(cache, tmp_path, 'second', 100)
+    cache.entries[os.path.basename(first)]['last_access'] += 10
+    cache.entries[os.path.basename(second)]['last_access'] -= 10
+
+    _, third = add_transcode(cache, tmp_path, 'third', 100)
+
+    assert cache.lookup(first) and cache.lookup(third)
+    assert not cache.lookup(second) and not os.path.exists(second)
+    assert cache.total_bytes == 200
+    assert cache.stats()['evictions']['budget'] == 1
+
+
+def test_transcode_of_rewritten_source_evicted(tmp_path):
+    cache = TranscodeCache(str(tmp_path / 'cache'))
+    source, cache_path = add_transcode(cache, tmp_path, 'a', 100)
+    os.utime(source, (1, 1))
+
+    cache.enforce()
+
+    assert not os.path.exists(cache_path)
+    assert cache.stats()['evictions']['orphan'] == 1
+
+
+def test_deleted_transcode_is_a_miss(tmp_path):
+    cache = TranscodeCache(str(tmp_path / 'cache'))
+    _, cache_path = add_transcode(cache, tmp_path, 'a', 100)
+    os.remove(cache_path)
+
+    assert not cache.lookup(cache_path)
+    assert cache.total_bytes == 0 and cache.stats()['misses'] == 1
+
+
+def test_manifest_survives_restart(tmp_path):
+    cache = TranscodeCache(str(tmp_path / 'cache'))
+    source, cache_path = add_transcode(cache, tmp_path, 'a', 100)
+
+    restarted = TranscodeCache(str(tmp_path / 'cache'))
+
+    assert restarted.entries[os.path.basename(cache_path)]['source'] == os.path.abspath(source)
+    assert restarted.lookup(cache_path)
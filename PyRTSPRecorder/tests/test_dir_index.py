@@ -0,0 +1,102 @@
+import os
+import time
+
+import pytest
+
+from dir_index import DirectoryIndex, Inotify
+
+
+def write(path, size=10):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def names(items):
+    return [item['name'] for item in items]
+
+
+def wait_for(check, timeout=3):
+    # inotify updates arrive on the watch thread, polling on the next access: both within a moment
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def tracking(request, monkeypatch):
+    if request.param == 'polling':
+        monkeypatch.setattr(Inotify, 'create', classmethod(lambda cls: None))
+        return request.param
+    inotify = Inotify.create()
+    if inotify is None:
+        pytest.skip('inotify unavailable')
+    os.close(inotify.fd)
+    return request.param
+
+
+def test_listing_folders_first_videos_only(tmp_path):
+    (tmp_path / 'Camera2').mkdir()
+    (tmp_path / 'Camera1').mkdir()
+    write(tmp_path / 'b.mp4')
+    write(tmp_path / 'a.TS')
+    write(tmp_path / 'notes.txt')
+    write(tmp_path / '.hidden.mp4')
+
+    index = DirectoryIndex(str(tmp_path))
+
+    assert names(index.listing()) == ['Camera1', 'Camera2', 'a.TS', 'b.mp4']
+
+
+def test_paths_outside_the_archive_are_empty(tmp_path):
+    archive = tmp_path / 'recordings'
+    archive.mkdir()
+    write(tmp_path / 'secret.mp4')
+
+    index = DirectoryIndex(str(archive))
+
+    assert index.listing('../') == []
+    assert index.page('../..') == {'total': 0, 'items': []}
+    assert index.listing('missing') == []
+
+
+def test_page_sorts_files_and_slices(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    for i, size in enumerate((30, 10, 20)):
+        write(tmp_path / f'{i}.mp4', size)
+
+    index = DirectoryIndex(str(tmp_path))
+
+    page = index.page(sort='size', reverse=True, offset=1, limit=2)
+    assert page['total'] == 4
+    assert names(page['items']) == ['0.mp4', '2.mp4']
+    assert names(index.page(sort='size')['items']) == ['sub', '1.mp4', '2.mp4', '0.mp4']
+    # Unknown sort keys fall back to name
+    assert names(index.page(sort='owner')['items']) == ['sub', '0.mp4', '1.mp4', '2.mp4']
+
+
+def test_created_and_deleted_files_show_up(tmp_path, tracking):
+    write(tmp_path / 'a.mp4')
+    index = DirectoryIndex(str(tmp_path))
+    assert names(index.listing()) == ['a.mp4']
+
+    write(tmp_path / 'b.mp4')
+    wait_for(lambda: names(index.listing()) == ['a.mp4', 'b.mp4'])
+
+    os.remove(tmp_path / 'a.mp4')
+    wait_for(lambda: names(index.listing()) == ['b.mp4'])
+
+
+def test_segment_being_written_grows(tmp_path, tracking):
+    write(tmp_path / 'a.mp4', 100)
+    os.utime(tmp_path / 'a.mp4', (0, 0))
+    write(tmp_path / 'b.mp4', 10)
+    index = DirectoryIndex(str(tmp_path))
+    assert names(index.page(sort='size')['items']) == ['b.mp4', 'a.mp4']
+
+    # Appending doesn't change the folder mtime, the newest file is still refreshed
+    with open(tmp_path / 'b.mp4', 'ab') as f:
+        f.write(b'x' * 1000)
+
+    wait_for(lambda: names(index.page(sort='size')['items']) == ['a.mp4', 'b.mp4'])
+    assert index.page(sort='size')['items'][1]['size'] == 1010
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from events import EventBus, SegmentClosed, LOSSLESS
+
+
+def closed(number):
+    return SegmentClosed('A', f'/rec/A/{number}.mp4', 1700000000 + number, 60, 100)
+
+
+def test_every_subscriber_gets_every_event():
+    bus = EventBus()
+    first, second = [], []
+    bus.subscribe('first', first.append)
+    bus.subscribe('second', lambda event: second.append(event.path))
+    for number in range(5):
+        bus.publish(closed(number))
+    bus.close()
+
+    assert [event.path for event in first] == second == [f'/rec/A/{number}.mp4' for number in range(5)]
+
+
+def test_slow_subscriber_drops_oldest_without_blocking_publish():
+    bus = EventBus()
+    release = threading.Event()
+    delivered = []
+
+    def slow(event):
+        release.wait()
+        delivered.append(event.path)
+
+    bus.subscribe('slow', slow, max_queue=3)
+    bus.publish(closed(0))
+    time.sleep(0.1)     # taken off the queue, the callback waits
+    started = time.monotonic()
+    for number in range(1, 11):
+        bus.publish(closed(number))
+    assert time.monotonic() - started < 1
+
+    assert bus.stats()['slow'] == {'queued': 3, 'delivered': 0, 'dropped': 7}
+    release.set()
+    bus.close()
+    assert delivered == ['/rec/A/0.mp4', '/rec/A/8.mp4', '/rec/A/9.mp4', '/rec/A/10.mp4']
+
+
+def test_failing_subscriber_keeps_receiving():
+    bus = EventBus()
+    seen = []
+
+    def failing(event):
+        seen.append(event.path)
+        raise ValueError('broken indexer')
+
+    bus.subscribe('failing', failing)
+    bus.publish(closed(0))
+    bus.publish(closed(1))
+    bus.close()
+
+    assert seen == ['/rec/A/0.mp4', '/rec/A/1.mp4']
+
+
+def test_unsubscribed_gets_nothing_more():
+    bus = EventBus()
+    seen = []
+    subscription = bus.subscribe('gone', seen.append)
+    bus.unsubscribe(subscription)
+    bus.publish(closed(0))
+    bus.close()
+
+    assert seen == [] and bus.stats() == {}
+
+
+def test_lossless_subscriber_keeps_every_event():
+    bus = EventBus()
+    release = threading.Event()
+    delivered = []
+    bus.subscribe('index', lambda event: release.wait() and delivered.append(event.path), max_queue=LOSSLESS)
+    for number in range(2000):
+        bus.publish(closed(number))
+
+    assert bus.stats()['index']['dropped'] == 0
+    release.set()
+    bus.close()
+    assert len(delivered) == 2000
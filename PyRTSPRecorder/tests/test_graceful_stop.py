@@ -0,0 +1,37 @@
+import sys
+import signal
+import subprocess
+
+from recorder_main import FfmpegSupervisor
+
+# Stand-ins for ffmpeg: quits on q, only on SIGINT, or on nothing at all
+QUITS_ON_Q = "import sys; print('ready', flush=True); sys.stdin.read(1); print('finalized')"
+QUITS_ON_SIGINT = ("import time\ntry:\n    print('ready', flush=True)\n    time.sleep(30)\n"
+                   "except KeyboardInterrupt:\n    print('finalized')")
+IGNORES_ALL = "import signal, time; signal.signal(signal.SIGINT, signal.SIG_IGN); print('ready', flush=True); time.sleep(30)"
+
+
+def start(script):
+    process = subprocess.Popen([sys.executable, '-c', script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               universal_newlines=True)
+    assert process.stdout.readline() == 'ready\n'
+    return process
+
+
+def test_q_finalizes():
+    process = start(QUITS_ON_Q)
+    FfmpegSupervisor('cam').stop_ffmpeg(process, timeout=4)
+    assert process.returncode == 0
+    assert process.stdout.read() == 'finalized\n'
+
+
+def test_sigint_when_q_is_ignored():
+    process = start(QUITS_ON_SIGINT)
+    FfmpegSupervisor('cam').stop_ffmpeg(process, timeout=1)
+    assert process.stdout.read() == 'finalized\n'
+
+
+def test_kill_as_last_resort():
+    process = start(IGNORES_ALL)
+    FfmpegSupervisor('cam').stop_ffmpeg(process, timeout=1)
+    assert process.returncode == -signal.SIGKILL
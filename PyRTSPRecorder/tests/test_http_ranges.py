@@ -0,0 +1,74 @@
+import os
+
+from http_ranges import make_etag, http_date, is_not_modified, range_applies, parse_range, MAX_RANGES
+
+MTIME = 1700000000
+
+
+class Stat:
+    st_ino = 0x1234
+    st_mtime_ns = MTIME * 10 ** 9
+    st_size = 1000
+
+
+ETAG = make_etag(Stat)
+
+
+def test_parse_range_single_and_open_ended():
+    assert parse_range('bytes=0-99', 1000) == [(0, 99)]
+    assert parse_range('bytes=900-', 1000) == [(900, 999)]
+    assert parse_range('bytes=900-5000', 1000) == [(900, 999)]
+
+
+def test_parse_range_suffix():
+    assert parse_range('bytes=-100', 1000) == [(900, 999)]
+    assert parse_range('bytes=-5000', 1000) == [(0, 999)]
+
+
+def test_parse_range_merges_overlapping_and_adjacent():
+    assert parse_range('bytes=500-599, 0-99, 100-199, 550-650', 1000) == [(0, 199), (500, 650)]
+
+
+def test_parse_range_unsatisfiable_is_empty():
+    assert parse_range('bytes=1000-1100', 1000) == []
+    assert parse_range('bytes=-0', 1000) == []
+
+
+def test_parse_range_ignored():
+    assert parse_range(None, 1000) is None
+    assert parse_range('items=0-1', 1000) is None
+    assert parse_range('bytes=abc-def', 1000) is None
+    assert parse_range('bytes=200-100', 1000) is None
+    assert parse_range('bytes=' + ','.join(['0-1'] * (MAX_RANGES + 1)), 1000) is None
+
+
+def test_not_modified_by_etag():
+    assert is_not_modified({'If-None-Match': ETAG}, ETAG, MTIME)
+    assert is_not_modified({'If-None-Match': f'"other", W/{ETAG}'}, ETAG, MTIME)
+    assert is_not_modified({'If-None-Match': '*'}, ETAG, MTIME)
+    # If-Modified-Since doesn't count once If-None-Match is there
+    assert not is_not_modified({'If-None-Match': '"other"', 'If-Modified-Since': http_date(MTIME)}, ETAG, MTIME)
+
+
+def test_not_modified_by_date():
+    assert is_not_modified({'If-Modified-Since': http_date(MTIME)}, ETAG, MTIME + 0.5)
+    assert not is_not_modified({'If-Modified-Since': http_date(MTIME - 1)}, ETAG, MTIME)
+    assert not is_not_modified({'If-Modified-Since': 'yesterday'}, ETAG, MTIME)
+    assert not is_not_modified({}, ETAG, MTIME)
+
+
+def test_if_range():
+    assert range_applies({}, ETAG, MTIME)
+    assert range_applies({'If-Range': ETAG}, ETAG, MTIME)
+    assert not range_applies({'If-Range': f'W/{ETAG}'}, ETAG, MTIME)
+    assert not range_applies({'If-Range': '"other"'}, ETAG, MTIME)
+    assert range_applies({'If-Range': http_date(MTIME)}, ETAG, MTIME)
+    assert not range_applies({'If-Range': http_date(MTIME - 60)}, ETAG, MTIME)
+
+
+def test_etag_changes_with_file(tmp_path):
+    path = tmp_path / 'a.mp4'
+    path.write_bytes(b'x' * 10)
+    before = make_etag(os.stat(path))
+    path.write_bytes(b'x' * 20)
+    assert make_etag(os.stat(path)) != before
@@ -0,0 +1,104 @@
+import struct
+import threading
+import time
+
+from live import LiveStream
+from test_mp4 import init_segment, fragment, SYNC, NON_SYNC
+
+
+def stream(*flags, **kwargs):
+    # LiveStream after one ffmpeg run sent the init segment and a fragment per flags value
+    live = LiveStream('cam', **kwargs)
+    live.begin()
+    live.push(init_segment())
+    for sequence, sample_flags in enumerate(flags):
+        live.push(fragment(sequence, sample_flags))
+    return live
+
+
+def test_no_picture_before_init_segment():
+    live = LiveStream('cam')
+    live.begin()
+    live.push(fragment(0, SYNC))
+
+    assert live.read(None, 0.05) == (None, [])
+    assert live.stats()['fragments'] == 0
+
+
+def test_new_viewer_starts_at_newest_keyframe():
+    live = stream(SYNC, NON_SYNC, SYNC, NON_SYNC)
+
+    cursor, chunks = live.read(None, 0)
+
+    assert cursor == (1, 3)
+    assert chunks == [init_segment(), fragment(2, SYNC), fragment(3, NON_SYNC)]
+    assert live.codec == 'avc1.64001f'
+
+
+def test_viewer_follows_fragment_by_fragment():
+    live = stream(SYNC, NON_SYNC)
+    cursor, _ = live.read(None, 0)
+
+    assert live.read(cursor, 0.05) == (cursor, [])
+    live.push(fragment(2, NON_SYNC))
+    live.push(fragment(3, NON_SYNC))
+
+    assert live.read(cursor, 0) == ((1, 3), [fragment(2, NON_SYNC), fragment(3, NON_SYNC)])
+    assert live.stats()['skipped_fragments'] == 0
+
+
+def test_slow_viewer_skips_to_newest_keyframe():
+    live = stream(SYNC, NON_SYNC, max_fragments=4)
+    cursor, _ = live.read(None, 0)
+    for sequence, flags in enumerate((NON_SYNC, SYNC, NON_SYNC, NON_SYNC, SYNC, NON_SYNC), start=2):
+        live.push(fragment(sequence, flags))
+
+    # Fragments 2 to 3 left the ring, 4 and 5 are skipped too
+    cursor, chunks = live.read(cursor, 0)
+
+    assert cursor == (1, 7)
+    assert chunks == [fragment(6, SYNC), fragment(7, NON_SYNC)]
+    assert live.stats()['skipped_fragments'] == 4
+
+
+def test_viewer_ends_when_ffmpeg_restarts():
+    live = stream(SYNC)
+    cursor, _ = live.read(None, 0)
+
+    live.begin()
+
+    assert live.read(cursor, 1) == (None, [])
+
+
+def test_waiting_viewer_wakes_on_new_fragment():
+    live = stream(SYNC)
+    cursor, _ = live.read(None, 0)
+    threading.Timer(0.1, live.push, args=(fragment(1, NON_SYNC),)).start()
+
+    started = time.monotonic()
+    assert live.read(cursor, 5) == ((1, 1), [fragment(1, NON_SYNC)])
+    assert time.monotonic() - started < 2
+
+
+def test_boxes_split_across_pipe_reads():
+    live = LiveStream('cam')
+    live.begin()
+    data = init_segment() + fragment(0, SYNC)
+    for position in range(0, len(data), 7):
+        live.push(data[position:position + 7])
+
+    assert live.read(None, 0)[1] == [init_segment(), fragment(0, SYNC)]
+
+
+def test_corrupt_output_stops_parsing_until_next_run():
+    live = stream(SYNC)
+    live.push(struct.pack('>I4s', 4, b'moof'))
+    live.push(fragment(1, SYNC))
+    assert live.broken and live.stats()['fragments'] == 1
+
+    live.begin()
+    live.push(init_segment() + fragment(0, SYNC))
+
+    assert not live.broken
+    # Sequence numbers continue across runs, the generation tells them apart
+    assert live.read(None, 0)[0] == (2, 1)
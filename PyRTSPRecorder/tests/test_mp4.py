@@ -0,0 +1,88 @@
+import struct
+
+from mp4 import first_fragment_ready, fragmented_layout, trex_sample_flags, fragment_is_sync, codec_string, find_box
+
+NON_SYNC = 0x01010000
+SYNC = 0x02000000
+
+
+def box(box_type, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), box_type.encode()) + payload
+
+
+def full_box(box_type, flags, payload):
+    return box(box_type, struct.pack('>I', flags) + payload)
+
+
+def init_segment(entry='avc1', config='avcC'):
+    # ftyp + moov with one video track and trex defaults marking samples non-sync
+    sample_entry = box(entry, bytes(78) + box(config, bytes([1, 0x64, 0x00, 0x1f])))
+    stsd = full_box('stsd', 0, struct.pack('>I', 1) + sample_entry)
+    trak = box('trak', box('tkhd', bytes(84)) + box('mdia', box('minf', box('stbl', stsd))))
+    trex = full_box('trex', 0, struct.pack('>5I', 1, 1, 0, 0, NON_SYNC))
+    return box('ftyp', b'isom' + bytes(4)) + box('moov', box('mvhd', bytes(100)) + trak + box('mvex', trex))
+
+
+def fragment(sequence, first_sample_flags=None):
+    # moof + mdat; first_sample_flags None leaves the first sample to the trex default
+    tfhd = full_box('tfhd', 0x020000, struct.pack('>I', 1))
+    if first_sample_flags is None:
+        trun = full_box('trun', 0x001, struct.pack('>Ii', 1, 0))
+    else:
+        trun = full_box('trun', 0x001 | 0x004, struct.pack('>IiI', 1, 0, first_sample_flags))
+    moof = box('moof', full_box('mfhd', 0, struct.pack('>I', sequence)) + box('traf', tfhd + trun))
+    return moof + box('mdat', bytes(100))
+
+
+def test_first_fragment_ready(tmp_path):
+    path = tmp_path / 'stream.mp4'
+    data = init_segment() + fragment(1, SYNC)
+    path.write_bytes(data[:-10])
+    assert not first_fragment_ready(str(path))
+    path.write_bytes(data)
+    assert first_fragment_ready(str(path))
+    assert not first_fragment_ready(str(tmp_path / 'missing.mp4'))
+
+
+def test_fragment_is_sync():
+    flags = trex_sample_flags(init_segment())
+    assert flags == {1: NON_SYNC}
+    assert fragment_is_sync(fragment(1, SYNC), flags)
+    assert not fragment_is_sync(fragment(2, NON_SYNC), flags)
+    # No first-sample flags in the trun: the trex default decides
+    assert not fragment_is_sync(fragment(3), flags)
+    assert fragment_is_sync(fragment(3), {1: SYNC})
+    assert not fragment_is_sync(box('mdat', bytes(10)), flags)
+
+
+def test_codec_string():
+    assert codec_string(init_segment()) == 'avc1.64001f'
+    assert codec_string(box('moov', box('mvhd', bytes(100)))) is None
+
+
+def test_find_box():
+    init = init_segment()
+    start, end = find_box(init, ('moov', 'mvex', 'trex'))
+    assert end - start == 24
+    assert find_box(init, ('moov', 'udta')) is None
+
+
+def test_fragmented_layout_of_growing_file(tmp_path):
+    path = tmp_path / 'segment.mp4'
+    init = init_segment()
+    first, second = fragment(1, SYNC), fragment(2, NON_SYNC)
+    path.write_bytes(init + first + second + fragment(3, SYNC)[:20])
+
+    assert fragmented_layout(str(path)) == (init, len(init) + len(first), False)
+
+
+def test_fragmented_layout_finished_and_regular(tmp_path):
+    path = tmp_path / 'segment.mp4'
+    path.write_bytes(init_segment() + fragment(1, SYNC) + box('mfra', full_box('mfro', 0, struct.pack('>I', 24))))
+    assert fragmented_layout(str(path))[2]
+
+    # Regular MP4: mdat before moov, or a moov without mvex
+    path.write_bytes(box('ftyp', bytes(8)) + box('mdat', bytes(100)) + box('moov', box('mvhd', bytes(100))))
+    assert fragmented_layout(str(path)) is None
+    path.write_bytes(box('ftyp', bytes(8)) + box('moov', box('mvhd', bytes(100))) + box('mdat', bytes(100)))
+    assert fragmented_layout(str(path)) is None
@@ -0,0 +1,89 @@
+import yaml
+
+from recorder_main import MultiCameraRecorder
+
+# Without ffmpeg on PATH the recorders stay up in their restart backoff, which is all reload looks at
+
+
+def write_config(path, output_folder, cameras, **settings):
+    config = {'segment_duration': 30, 'output_folder': str(output_folder), 'live': {'enabled': False},
+              'cameras': [{'name': name, 'rtsp_url': url} for name, url in cameras]}
+    config.update(settings)
+    path.write_text(yaml.safe_dump(config))
+
+
+def start(tmp_path, cameras, **settings):
+    config_file = tmp_path / 'config.yml'
+    write_config(config_file, tmp_path / 'recordings', cameras, **settings)
+    manager = MultiCameraRecorder(str(config_file))
+    manager.start_recording()
+    return manager, config_file
+
+
+def by_camera(manager):
+    return {name: recorder for recorder in manager.recorders for name in recorder.camera_names()}
+
+
+def test_only_changed_cameras_restart(tmp_path):
+    manager, config_file = start(tmp_path, [('a', 'rtsp://a'), ('b', 'rtsp://b'), ('c', 'rtsp://c')])
+    try:
+        before = by_camera(manager)
+        write_config(config_file, tmp_path / 'recordings', [('a', 'rtsp://a'), ('b', 'rtsp://b2'), ('d', 'rtsp://d')])
+
+        assert manager.reload() is not None
+
+        after = by_camera(manager)
+        assert sorted(after) == ['a', 'b', 'd']
+        assert after['a'] is before['a'] and after['a'].is_alive()
+        assert after['b'] is not before['b'] and after['b'].rtsp_url == 'rtsp://b2'
+        assert not before['b'].is_alive() and not before['c'].is_alive()
+        assert after['d'].is_alive()
+    finally:
+        manager.stop_recording()
+
+
+def test_global_setting_restarts_every_camera(tmp_path):
+    manager, config_file = start(tmp_path, [('a', 'rtsp://a'), ('b', 'rtsp://b')])
+    try:
+        before = by_camera(manager)
+        write_config(config_file, tmp_path / 'recordings', [('a', 'rtsp://a'), ('b', 'rtsp://b')], stall_timeout=120)
+
+        manager.reload()
+
+        after = by_camera(manager)
+        assert all(after[name] is not before[name] and after[name].stall_timeout == 120 for name in ('a', 'b'))
+    finally:
+        manager.stop_recording()
+
+
+def test_bad_config_keeps_running_recorders_and_config(tmp_path):
+    manager, config_file = start(tmp_path, [('a', 'rtsp://a'), ('b', 'rtsp://b')])
+    try:
+        before = by_camera(manager)
+        config = manager.config
+        # One valid camera change next to an invalid value: nothing of it applies
+        write_config(config_file, tmp_path / 'recordings', [('a', 'rtsp://a2'), ('b', 'rtsp://b')],
+                     stall_timeout='soon')
+
+        assert manager.reload() is None
+
+        assert by_camera(manager) == before
+        assert all(recorder.is_alive() for recorder in before.values())
+        assert manager.config is config
+        assert manager.stall_timeout == 60
+        assert manager.specs['a']['rtsp_url'] == 'rtsp://a'
+    finally:
+        manager.stop_recording()
+
+
+def test_unparsable_config_is_ignored(tmp_path):
+    manager, config_file = start(tmp_path, [('a', 'rtsp://a')])
+    try:
+        before = by_camera(manager)
+        config_file.write_text('cameras: [name: a\n')
+
+        assert manager.reload() is None
+
+        assert by_camera(manager) == before and before['a'].is_alive()
+    finally:
+        manager.stop_recording()
@@ -0,0 +1,60 @@
+import os
+
+from retention import RetentionManager, limits_from_config, DAY, GB
+from segment_index import SegmentIndex
+from test_segment_index import BASE, record
+
+
+def archive(tmp_path, cameras):
+    # cameras: name -> segment start offsets, 100 bytes each
+    index = SegmentIndex(str(tmp_path))
+    for name, offsets in cameras.items():
+        for offset in offsets:
+            index.add(name, record(str(tmp_path / name), BASE + offset))
+    index.built.set()
+    return index
+
+
+def starts(victims):
+    return [(segment.camera, segment.start - BASE) for segment in victims]
+
+
+def test_limits_from_config():
+    assert limits_from_config({'max_age_days': 2, 'max_gb': 1.5}) == (2 * DAY, int(1.5 * GB))
+    assert limits_from_config({'max_age_days': 0}) == (None, None)
+    assert limits_from_config(None) == (None, None)
+
+
+def test_global_age(tmp_path):
+    index = archive(tmp_path, {'A': [0, 60, 120], 'B': [30, 90]})
+    retention = RetentionManager(index, max_age=100)
+
+    assert starts(retention.select(now=BASE + 180)) == [('A', 0), ('B', 30), ('A', 60)]
+
+
+def test_global_size_removes_oldest_across_cameras(tmp_path):
+    index = archive(tmp_path, {'A': [0, 60, 120], 'B': [30, 90]})
+    retention = RetentionManager(index, max_bytes=250)
+
+    assert starts(retention.select(now=BASE + 180)) == [('A', 0), ('B', 30), ('A', 60)]
+
+
+def test_camera_limits(tmp_path):
+    index = archive(tmp_path, {'A': [0, 60, 120], 'B': [30, 90]})
+    retention = RetentionManager(index, camera_limits={'A': (None, 150), 'B': (100, None)})
+
+    assert starts(retention.select(now=BASE + 180)) == [('A', 0), ('B', 30), ('A', 60)]
+    retention.camera_limits = {'B': (None, 1000)}
+    assert retention.select(now=BASE + 180) == []
+
+
+def test_enforce_deletes_files_and_index_entries(tmp_path):
+    index = archive(tmp_path, {'A': [0, 60, 120]})
+    retention = RetentionManager(index, max_bytes=150, batch_size=1, batch_interval=0)
+    oldest = [segment.path for segment in index.cameras['A'].segments[:2]]
+
+    retention.enforce()
+
+    assert not any(os.path.exists(path) for path in oldest)
+    assert index.total_bytes == 100
+    assert retention.removed == 2 and retention.freed_bytes == 200
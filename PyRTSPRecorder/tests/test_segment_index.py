@@ -0,0 +1,71 @@
+import os
+import time
+
+from segment_index import SegmentIndex, segment_start
+
+BASE = 1700000000
+
+
+def segment_name(start):
+    return f"{BASE}+{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(start))}.mp4"
+
+
+def record(folder, start, duration=60, size=100):
+    # Closed segment: its last write is its end
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, segment_name(start))
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    os.utime(path, (start + duration, start + duration))
+    return path
+
+
+def test_segment_start():
+    assert segment_start(segment_name(BASE + 30)) == BASE + 30
+    assert segment_start(segment_name(BASE).replace('.mp4', '.ts')) == BASE
+    assert segment_start('notes.mp4') is None
+    assert segment_start(segment_name(BASE).replace('.mp4', '.jpg')) is None
+
+
+def test_build_and_lookups(tmp_path):
+    for offset in (0, 60, 300):
+        record(str(tmp_path / 'A'), BASE + offset)
+    record(str(tmp_path / 'B'), BASE)
+    index = SegmentIndex(str(tmp_path))
+    index.build()
+
+    assert index.total_bytes == 400
+    assert [segment.start for segment in index.range('A', BASE + 30, BASE + 301)] == [BASE, BASE + 60, BASE + 300]
+    assert [segment.start for segment in index.range('A', BASE + 60, BASE + 120)] == [BASE + 60]
+
+    segment, offset = index.locate('A', BASE + 75)
+    assert segment.start == BASE + 60 and offset == 15
+    assert index.locate('A', BASE + 200) == (None, None)
+    assert index.next_start('A', BASE + 200) == BASE + 300
+    assert index.next_start('A', BASE + 300) is None
+
+    assert index.coverage('A', BASE, BASE + 400) == [[BASE, BASE + 120], [BASE + 300, BASE + 360]]
+    assert [camera['name'] for camera in index.summary()] == ['A', 'B']
+
+
+def test_closed_segment_updates_known_path(tmp_path):
+    path = record(str(tmp_path / 'A'), BASE, size=10)
+    index = SegmentIndex(str(tmp_path))
+    index.build()
+
+    index.add('A', path, size=500, duration=60)
+
+    assert index.total_bytes == 500
+    assert index.cameras['A'].segments[0].size == 500
+
+
+def test_remove(tmp_path):
+    index = SegmentIndex(str(tmp_path))
+    first = index.add('A', record(str(tmp_path / 'A'), BASE))
+    index.add('A', record(str(tmp_path / 'A'), BASE + 60))
+
+    index.remove(first)
+    index.remove(first)
+
+    assert index.total_bytes == 100
+    assert index.cameras['A'].starts == [BASE + 60]
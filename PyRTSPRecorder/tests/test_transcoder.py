@@ -0,0 +1,81 @@
+import os
+import time
+
+from cache_manager import TranscodeCache
+from transcoder import TranscodeScheduler, PRIORITY_SPECULATIVE
+
+
+class WritingScheduler(TranscodeScheduler):
+    # Writes the output instead of running ffmpeg
+    def convert_video(self, job):
+        with open(job.temp_path, 'wb') as f:
+            f.write(b'x' * 100)
+        return True
+
+
+def wait_for(scheduler, file_path, state, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if scheduler.status(file_path).get('state') == state:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_completed_job_requeued_after_eviction(tmp_path):
+    source = tmp_path / 'source.mp4'
+    source.write_bytes(b'source')
+    cache = TranscodeCache(str(tmp_path / 'cache'), max_bytes=50)
+    scheduler = WritingScheduler(None, on_complete=cache.add)
+    output = cache.path_for(str(source))
+
+    scheduler.submit('source.mp4', str(source), output)
+    assert wait_for(scheduler, 'source.mp4', 'completed')
+    # 100 bytes over a 50 byte budget, evicted as soon as it was added
+    assert not cache.lookup(output)
+
+    assert scheduler.submit('source.mp4', str(source), output)['state'] in ('queued', 'running')
+    assert wait_for(scheduler, 'source.mp4', 'completed')
+
+
+def test_completed_job_with_output_not_requeued(tmp_path):
+    scheduler = WritingScheduler(None)
+    output = str(tmp_path / 'out.mp4')
+    scheduler.submit('a', 'in', output)
+    assert wait_for(scheduler, 'a', 'completed')
+
+    assert scheduler.submit('a', 'in', output)['state'] == 'completed'
+    assert scheduler.stats()['completed'] == 1
+
+
+def test_worker_survives_failing_on_complete(tmp_path):
+    def on_complete(output_path, input_path):
+        if output_path.endswith('a.mp4'):
+            raise OSError(28, 'No space left on device')
+
+    scheduler = WritingScheduler(None, on_complete=on_complete)
+    scheduler.submit('a', 'in', str(tmp_path / 'a.mp4'))
+    assert wait_for(scheduler, 'a', 'failed')
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+    # The only worker is still there
+    scheduler.submit('b', 'in', str(tmp_path / 'b.mp4'))
+    assert wait_for(scheduler, 'b', 'completed')
+
+
+def test_interactive_job_runs_before_speculative(tmp_path):
+    order = []
+
+    class RecordingScheduler(WritingScheduler):
+        def convert_video(self, job):
+            order.append(job.file_path)
+            time.sleep(0.05)
+            return super().convert_video(job)
+
+    scheduler = RecordingScheduler(None)
+    scheduler.submit('first', 'in', str(tmp_path / 'first.mp4'))
+    scheduler.submit('speculative', 'in', str(tmp_path / 'speculative.mp4'), PRIORITY_SPECULATIVE)
+    scheduler.submit('watched', 'in', str(tmp_path / 'watched.mp4'))
+    assert wait_for(scheduler, 'speculative', 'completed')
+
+    assert order == ['first', 'watched', 'speculative']
@@ -0,0 +1,235 @@
+import os
+import heapq
+import hashlib
+import logging
+import threading
+import itertools
+import subprocess
+from collections import OrderedDict
+
+PRIORITY_VIEW = 0       # someone is looking at the page
+PRIORITY_INGEST = 10    # segment just closed
+THUMB_WIDTH = 320
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 2
+SPRITE_TILE_WIDTH = 160
+SAMPLE_BYTES = 64 * 1024
+KEY_CACHE_SIZE = 8192
+FAILED_KEPT = 1000
+KINDS = ('thumb', 'sprite')
+
+
+def content_key(path, stat):
+    # Size plus the first and last 64 KB: cheap, and unique for recorder segments
+    digest = hashlib.sha256(str(stat.st_size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        if stat.st_size > SAMPLE_BYTES:
+            f.seek(max(SAMPLE_BYTES, stat.st_size - SAMPLE_BYTES))
+            digest.update(f.read(SAMPLE_BYTES))
+    return digest.hexdigest()[:32]
+
+
+def thumbnail_command(source, output):
+    # First keyframe only, nothing else is decoded
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-threads', '1',
+        '-skip_frame', 'nokey', '-i', source,
+        '-frames:v', '1', '-vf', f'scale={THUMB_WIDTH}:-2',
+        '-c:v', 'mjpeg', '-q:v', '5', '-f', 'image2', '-update', '1', '-y', output
+    ]
+
+
+def sprite_command(source, output, duration):
+    # Keyframes spread over the segment, tiled into one image
+    tiles = SPRITE_COLUMNS * SPRITE_ROWS
+    step = duration / tiles if duration else 3
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-threads', '1',
+        '-skip_frame', 'nokey', '-i', source,
+        '-vf', f"select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{step:.3f})',"
+               f"scale={SPRITE_TILE_WIDTH}:-2,tile={SPRITE_COLUMNS}x{SPRITE_ROWS}",
+        '-frames:v', '1', '-c:v', 'mjpeg', '-q:v', '5', '-f', 'image2', '-update', '1', '-y', output
+    ]
+
+
+class ThumbnailStore:
+    """Keyframe thumbnails and seek sprite sheets of segments.
+
+    Images are generated by a small pool of single-threaded ffmpeg workers,
+    closed segments first in line behind whatever a viewer is waiting for.
+    They are stored under a key derived from the segment content, so a moved
+    or renamed file keeps its images, and evicted oldest first over max_bytes.
+    """
+
+    def __init__(self, cache_dir, workers=1, sprites=True, max_bytes=1024 ** 3, max_queue=1000, probe_cache=None):
+        self.cache_dir = cache_dir
+        self.sprites = sprites
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.probe_cache = probe_cache
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.keys = OrderedDict()       # (path, mtime_ns, size) -> content key
+        self.queue = []                 # heap of (priority, seq, path, duration)
+        self.sequence = itertools.count()
+        self.pending = {}               # queued path -> priority of its live heap entry
+        self.running = set()
+        self.failed = OrderedDict()     # keys ffmpeg could not read
+        self.files = OrderedDict()      # image name -> size, least recently used first
+        self.total_bytes = 0
+        self.generated = 0
+        self.dropped = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _load(self):
+        found = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.part'):
+                    os.remove(entry.path)
+                elif entry.name.endswith('.jpg'):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self.files[name] = size
+            self.total_bytes += size
+        logging.info(f"Thumbnails: {len(self.files)} images in {self.cache_dir}")
+
+    def image_path(self, key, kind):
+        return os.path.join(self.cache_dir, key[:2], f"{key}_{kind}.jpg")
+
+    def key_for(self, path):
+        stat = os.stat(path)
+        identity = (path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            key = self.keys.get(identity)
+            if key is not None:
+                self.keys.move_to_end(identity)
+                return key
+        key = content_key(path, stat)
+        with self.lock:
+            self.keys[identity] = key
+            if len(self.keys) > KEY_CACHE_SIZE:
+                self.keys.popitem(last=False)
+        return key
+
+    def request(self, path, priority=PRIORITY_INGEST, duration=None):
+        path = os.path.abspath(path)
+        with self.lock:
+            queued = self.pending.get(path)
+            if path in self.running or (queued is not None and queued <= priority):
+                return
+            if queued is None and len(self.pending) >= self.max_queue and priority >= PRIORITY_INGEST:
+                # Backlog, a viewer will ask again for what they need
+                self.dropped += 1
+                return
+            # A viewer asking for a queued segment moves it up, the old entry goes stale
+            self.pending[path] = priority
+            heapq.heappush(self.queue, (priority, next(self.sequence), path, duration))
+            self.wakeup.notify()
+
+    def lookup(self, path, kind):
+        # ('ready', image) | ('pending', None) | ('missing', None), never waits for ffmpeg
+        if kind not in KINDS or (kind == 'sprite' and not self.sprites):
+            return 'missing', None
+        try:
+            key = self.key_for(path)
+        except OSError:
+            return 'missing', None
+        image = self.image_path(key, kind)
+        name = os.path.basename(image)
+        with self.lock:
+            if name in self.files:
+                self.files.move_to_end(name)
+                return 'ready', image
+            if key in self.failed:
+                return 'missing', None
+        self.request(path, PRIORITY_VIEW)
+        return 'pending', None
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                while True:
+                    while not self.queue:
+                        self.wakeup.wait()
+                    priority, _, path, duration = heapq.heappop(self.queue)
+                    if self.pending.get(path) == priority:
+                        break
+                del self.pending[path]
+                self.running.add(path)
+            try:
+                self._generate(path, duration)
+            except Exception as e:
+                logging.info(f"Thumbnails: {path}: {e}")
+            finally:
+                with self.lock:
+                    self.running.discard(path)
+
+    def _generate(self, path, duration):
+        try:
+            key = self.key_for(path)
+        except OSError:
+            return
+        os.makedirs(os.path.join(self.cache_dir, key[:2]), exist_ok=True)
+        if self.sprites and not duration and self.probe_cache:
+            info = self.probe_cache.get(path)
+            duration = info.get('duration') if info else None
+
+        jobs = [('thumb', thumbnail_command)]
+        if self.sprites:
+            jobs.append(('sprite', lambda source, output: sprite_command(source, output, duration)))
+        for kind, command in jobs:
+            image = self.image_path(key, kind)
+            name = os.path.basename(image)
+            with self.lock:
+                if name in self.files:
+                    continue
+            temp_path = image + '.part'
+            result = subprocess.run(command(path, temp_path), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if result.returncode != 0 or not os.path.exists(temp_path):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                with self.lock:
+                    self.failed[key] = True
+                    if len(self.failed) > FAILED_KEPT:
+                        self.failed.popitem(last=False)
+                logging.info(f"Thumbnails: ffmpeg failed for {path}: {result.stderr.decode(errors='replace').strip()[-200:]}")
+                return
+            os.replace(temp_path, image)
+            self._add(name, os.path.getsize(image))
+        self.generated += 1
+
+    def _add(self, name, size):
+        evicted = []
+        with self.lock:
+            self.files[name] = size
+            self.total_bytes += size
+            while self.max_bytes and self.total_bytes > self.max_bytes and len(self.files) > 1:
+                old_name, old_size = self.files.popitem(last=False)
+                self.total_bytes -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, old_name[:2], old_name))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'images': len(self.files),
+                'size_bytes': self.total_bytes,
+                'queued': len(self.pending),
+                'generated': self.generated,
+                'dropped': self.dropped,
+                'failed': len(self.failed)
+            }
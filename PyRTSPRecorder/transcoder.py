@@ -0,0 +1,399 @@
+import os
+import time
+import uuid
+import shutil
+import heapq
+import logging
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from mp4 import first_fragment_ready
+from cache_manager import TEMP_DIR
+
+# Lower value runs first
+PRIORITY_INTERACTIVE = 0   # file someone is watching right now
+PRIORITY_SPECULATIVE = 10  # HEAD checks and other prefetch
+
+FINISHED_JOBS_KEPT = 1000
+
+# full:    encode the whole file, then serve it
+# stream:  encode fragmented MP4 that viewers can play while it is written
+# chunked: split long files at keyframes and encode the pieces in parallel
+TRANSCODE_MODES = ('full', 'stream', 'chunked')
+
+CHUNK_SECONDS = 30
+
+
+class TranscodeJob:
+    def __init__(self, key, file_path, input_path, output_path, priority):
+        self.key = key
+        self.file_path = file_path
+        self.input_path = input_path
+        self.output_path = output_path
+        # Encoded in the cache's temp directory and renamed when done, so a partial
+        # transcode is never served and a cancelled job can't clobber its successor
+        self.temp_path = os.path.join(os.path.dirname(output_path), TEMP_DIR,
+                                      f"{os.path.basename(output_path)}.{uuid.uuid4().hex[:8]}.part")
+        # Fragmented MP4 growing on disk in stream mode
+        self.stream_path = self.temp_path + '.frag'
+        self.stream_mode = False
+        self.priority = priority
+        self.state = 'queued'
+        self.progress = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.last_seen = self.submitted
+        self.processes = set()
+
+    def wait_time(self):
+        return (self.started or time.time()) - self.submitted
+
+
+class TranscodeScheduler:
+    """HEVC to H.264 transcodes on a fixed number of worker threads.
+
+    Jobs are deduplicated by cache key, the file being watched jumps ahead of
+    speculative jobs and a job nobody asked about for idle_timeout seconds
+    is cancelled, killing ffmpeg if it is already running.
+    """
+
+    def __init__(self, probe_cache, max_workers=1, idle_timeout=30, on_complete=None, mode='full', chunk_workers=None):
+        self.probe_cache = probe_cache
+        # Chunked mode runs this many single-threaded encoders per job
+        self.chunk_workers = chunk_workers or os.cpu_count() or 1
+        self.on_complete = on_complete
+        self.mode = mode if mode in TRANSCODE_MODES else 'full'
+        self.max_workers = max(1, int(max_workers))
+        self.idle_timeout = idle_timeout
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.queue = []
+        self.sequence = itertools.count()
+        self.jobs = {}          # cache key -> job
+        self.by_file = {}       # request file path -> cache key
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.started = 0
+
+        for _ in range(self.max_workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+        threading.Thread(target=self._reaper, daemon=True).start()
+
+    def submit(self, file_path, input_path, output_path, priority=PRIORITY_INTERACTIVE):
+        key = output_path
+        with self.lock:
+            job = self.jobs.get(key)
+            # A completed job whose cache file was evicted or deleted is encoded again
+            if job is None or job.state in ('failed', 'cancelled') or \
+                    (job.state == 'completed' and not os.path.exists(job.output_path)):
+                job = TranscodeJob(key, file_path, input_path, output_path, priority)
+                job.stream_mode = self.mode == 'stream'
+                self.jobs[key] = job
+                heapq.heappush(self.queue, (priority, next(self.sequence), job))
+                self.wakeup.notify()
+                logging.info(f"Transcode queued: {file_path} (priority {priority}, depth {self.queue_depth()})")
+            elif job.state == 'queued' and priority < job.priority:
+                # Re-push with the better priority, the stale heap entry is skipped later
+                job.priority = priority
+                heapq.heappush(self.queue, (priority, next(self.sequence), job))
+            job.last_seen = time.time()
+            self.by_file[file_path] = key
+            return self._describe(job)
+
+    def status(self, file_path):
+        # Polling counts as someone still waiting for the result
+        with self.lock:
+            job = self.jobs.get(self.by_file.get(file_path))
+            if job is None:
+                return {}
+            job.last_seen = time.time()
+            return self._describe(job)
+
+    def streaming_job(self, file_path):
+        # Running stream mode job whose first fragment is playable, else None
+        with self.lock:
+            job = self.jobs.get(self.by_file.get(file_path))
+            if job is None or not job.stream_mode or job.state != 'running':
+                return None
+            job.last_seen = time.time()
+        return job if first_fragment_ready(job.stream_path) else None
+
+    def touch(self, job):
+        with self.lock:
+            job.last_seen = time.time()
+
+    def is_active(self, job):
+        with self.lock:
+            return job.state in ('queued', 'running')
+
+    def queue_depth(self):
+        return sum(1 for job in self.jobs.values() if job.state == 'queued')
+
+    def stats(self):
+        with self.lock:
+            running = [job for job in self.jobs.values() if job.state == 'running']
+            queued = [job for job in self.jobs.values() if job.state == 'queued']
+            return {
+                'workers': self.max_workers,
+                'running': len(running),
+                'queue_depth': len(queued),
+                'oldest_wait': round(max((job.wait_time() for job in queued), default=0), 1),
+                'avg_wait': round(self.total_wait / self.started, 1) if self.started else 0,
+                'completed': self.completed,
+                'failed': self.failed,
+                'cancelled': self.cancelled
+            }
+
+    def _describe(self, job):
+        info = {
+            'state': job.state,
+            'converting': job.state in ('queued', 'running'),
+            'completed': job.state == 'completed',
+            'progress': 100 if job.state == 'completed' else job.progress,
+            'wait_time': round(job.wait_time(), 1)
+        }
+        if job.stream_mode and job.state == 'running':
+            info['streamable'] = first_fragment_ready(job.stream_path)
+        if job.state == 'queued':
+            ahead = [other for other in self.jobs.values() if other.state == 'queued' and
+                     (other.priority, other.submitted) < (job.priority, job.submitted)]
+            info['queue_position'] = len(ahead) + 1
+        return info
+
+    def _next_job(self):
+        with self.lock:
+            while True:
+                while self.queue:
+                    priority, _, job = heapq.heappop(self.queue)
+                    if job.state == 'queued' and priority == job.priority:
+                        job.state = 'running'
+                        job.started = time.time()
+                        self.total_wait += job.wait_time()
+                        self.started += 1
+                        return job
+                self.wakeup.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            try:
+                os.makedirs(os.path.dirname(job.temp_path), exist_ok=True)
+                ok = self.convert_video(job)
+            except Exception as e:
+                logging.info(f"Error during conversion: {e}")
+                ok = False
+            self._finish(job, ok)
+
+    def _finish(self, job, ok):
+        with self.lock:
+            cancelled = job.state == 'cancelled'
+        try:
+            self._store_output(job, ok and not cancelled)
+        except Exception as e:
+            # Full disk or a failing cache manifest: the job fails instead of killing the worker
+            logging.error(f"Transcode of {job.file_path} could not be stored: {e}")
+            ok = False
+        finally:
+            with self.lock:
+                job.finished = time.time()
+                job.processes.clear()
+                if job.state == 'cancelled':
+                    pass
+                elif ok:
+                    job.state = 'completed'
+                    job.progress = 100
+                    self.completed += 1
+                else:
+                    job.state = 'failed'
+                    self.failed += 1
+                self._prune()
+
+    def _store_output(self, job, keep):
+        try:
+            if keep:
+                # Cache file appears before the job is reported completed
+                os.replace(job.temp_path, job.output_path)
+                if self.on_complete:
+                    self.on_complete(job.output_path, job.input_path)
+        finally:
+            # Viewers still streaming the fragmented file keep their open handle
+            for path in (job.temp_path, job.stream_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        if len(finished) <= FINISHED_JOBS_KEPT:
+            return
+        finished.sort(key=lambda job: job.finished)
+        for job in finished[:len(finished) - FINISHED_JOBS_KEPT]:
+            del self.jobs[job.key]
+            if self.by_file.get(job.file_path) == job.key:
+                del self.by_file[job.file_path]
+
+    def _reaper(self):
+        while True:
+            time.sleep(1)
+            now = time.time()
+            with self.lock:
+                for job in self.jobs.values():
+                    if job.state in ('queued', 'running') and now - job.last_seen > self.idle_timeout:
+                        logging.info(f"Transcode cancelled, nobody waiting: {job.file_path}")
+                        job.state = 'cancelled'
+                        self.cancelled += 1
+                        for process in job.processes:
+                            if process.poll() is None:
+                                process.kill()
+
+    def convert_video(self, job):
+        info = self.probe_cache.get(job.input_path) or {}
+        total_duration = info.get('duration') or 0
+
+        # Only the container is unplayable (MPEG-TS recordings), copy the video
+        remux = bool(info) and info.get('codec') not in ('hevc', 'h265')
+
+        if self.mode == 'chunked' and total_duration >= 2 * CHUNK_SECONDS and not remux:
+            return self.convert_chunked(job, total_duration)
+
+        if job.stream_mode:
+            # Keyframe every 2s so fragments, and so playback, start early
+            container = [] if remux else ['-force_key_frames', 'expr:gte(t,n_forced*2)']
+            container += [
+                '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+                '-f', 'mp4',
+                '-y', job.stream_path
+            ]
+        else:
+            container = [
+                '-movflags', '+faststart',  # Encoding profile optimize
+                '-f', 'mp4',                # Container, temp name has no extension
+                '-y',                       # Re-write file
+                job.temp_path
+            ]
+
+        # FFmpeg command
+        if remux:
+            video = ['-c:v', 'copy']
+        else:
+            video = [
+                '-c:v', 'libx264',      # H.264 codec
+                '-preset', 'fast',      # Fast encoding profile
+                '-crf', '23',           # Quality
+            ]
+        cmd = [
+            'ffmpeg', '-i', job.input_path,
+            *video,
+            '-c:a', 'aac',              # AAC codec
+            '-b:a', '128k',             # Audio bitrate
+        ] + container
+
+        ok = self.run_ffmpeg(job, cmd, total_duration)
+
+        if ok and job.stream_mode:
+            # Cached copy is remuxed to a regular seekable MP4, no re-encode
+            ok = self.run_ffmpeg(job, [
+                'ffmpeg', '-i', job.stream_path,
+                '-c', 'copy',
+                '-movflags', '+faststart',
+                '-f', 'mp4',
+                '-y', job.temp_path
+            ])
+
+        if not ok and job.state != 'cancelled':
+            logging.info(f"✗ Conversion failed: {job.file_path}")
+        return ok
+
+    def convert_chunked(self, job, total_duration):
+        work_dir = job.temp_path + '.chunks'
+        os.makedirs(work_dir, exist_ok=True)
+        try:
+            # Split without re-encoding, stream copy cuts on keyframes only
+            ok = self.run_ffmpeg(job, [
+                'ffmpeg', '-i', job.input_path,
+                '-map', '0:v:0', '-c', 'copy',
+                '-f', 'segment',
+                '-segment_time', str(CHUNK_SECONDS),
+                '-reset_timestamps', '1',
+                '-y', os.path.join(work_dir, 'src_%05d.mp4')
+            ])
+            sources = sorted(name for name in os.listdir(work_dir) if name.startswith('src_'))
+            if not ok or not sources:
+                return False
+
+            # Per-chunk encoded seconds roll up into the job percentage
+            done = [0.0] * len(sources)
+
+            def encode(index):
+                def on_time(seconds):
+                    done[index] = seconds
+                    job.progress = min(int(sum(done) / total_duration * 100), 99)
+
+                return self.run_ffmpeg(job, [
+                    'ffmpeg', '-i', os.path.join(work_dir, sources[index]),
+                    '-c:v', 'libx264',
+                    '-preset', 'fast',
+                    '-crf', '23',
+                    '-threads', '1',    # parallelism comes from the chunks
+                    '-an',
+                    '-f', 'mp4',
+                    '-y', os.path.join(work_dir, f"enc_{index:05d}.mp4")
+                ], on_time=on_time)
+
+            with ThreadPoolExecutor(max_workers=min(self.chunk_workers, len(sources))) as pool:
+                if not all(pool.map(encode, range(len(sources)))):
+                    return False
+
+            list_path = os.path.join(work_dir, 'chunks.txt')
+            with open(list_path, 'w') as f:
+                for index in range(len(sources)):
+                    f.write(f"file 'enc_{index:05d}.mp4'\n")
+
+            # Lossless join, audio is encoded once from the source to avoid gaps at chunk edges
+            return self.run_ffmpeg(job, [
+                'ffmpeg', '-f', 'concat', '-safe', '0', '-i', list_path,
+                '-i', job.input_path,
+                '-map', '0:v:0', '-map', '1:a:0?',
+                '-c:v', 'copy',
+                '-c:a', 'aac', '-b:a', '128k',
+                '-movflags', '+faststart',
+                '-f', 'mp4',
+                '-y', job.temp_path
+            ])
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def run_ffmpeg(self, job, cmd, total_duration=0, on_time=None):
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        with self.lock:
+            job.processes.add(process)
+            if job.state == 'cancelled':
+                process.kill()
+
+        # Watching progress
+        for line in process.stderr:
+            if 'time=' in line and (total_duration > 0 or on_time):
+                try:
+                    time_str = line.split('time=')[1].split()[0]
+                    h, m, s = time_str.split(':')
+                    current_time = int(h) * 3600 + int(m) * 60 + float(s)
+                    if on_time:
+                        on_time(current_time)
+                    else:
+                        job.progress = min(int((current_time / total_duration) * 100), 99)
+                except:
+                    pass
+
+        process.wait()
+        with self.lock:
+            job.processes.discard(process)
+        return process.returncode == 0 and job.state != 'cancelled'
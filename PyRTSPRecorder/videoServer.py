@@ -1,23 +1,158 @@
 import os
+import socket
+import select
 import subprocess
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from functools import partial
-from urllib.parse import unquote, quote
+from urllib.parse import unquote, quote, urlsplit, parse_qs
 import mimetypes
 import hashlib
 import base64
 import logging
+import time
+import uuid
+import json
+import re
+from http_ranges import make_etag, http_date, is_not_modified, range_applies, parse_range
+from media_index import MediaIndex, ProbeCache, codec_label
+from cache_manager import TranscodeCache
+from dir_index import DirectoryIndex
+from metrics import METRICS_CONTENT_TYPE
+from segment_index import SegmentIndex
+from exporter import EXPORT_FORMATS, MAX_EXPORT_SECONDS, parse_time, concat_list, export_command
+from transcoder import TranscodeScheduler, PRIORITY_INTERACTIVE, PRIORITY_SPECULATIVE
+from mp4 import fragmented_layout, codec_string
+
+# Reusable per-thread buffer for platforms without sendfile
+COPY_BUFFER_SIZE = 1024 * 1024
+copy_buffers = threading.local()
+
+# Archive table rows per page
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+PAGE_CHUNK_SIZE = 16 * 1024
+
+# A live viewer is dropped after this long without a fragment
+LIVE_WAIT = 10
+
+# Containers browsers can't play, served through the transcoder
+REMUX_EXTENSIONS = {'.ts'}
+
+# A fragmented MP4 segment without trailer that was written to this recently is still being recorded
+GROWING_IDLE = 30
+GROWING_POLL = 0.5
+SAMPLE_ENTRY_CODECS = {'avc1': 'h264', 'avc3': 'h264', 'hvc1': 'hevc', 'hev1': 'hevc'}
+
+
+# Longest the accept loop waits for a free connection slot before answering 503
+CONNECTION_SLOT_WAIT = 1
+SATURATED_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 5\r\n"
+                      b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+
+
+class BoundedThreadingHTTPServer(ThreadingHTTPServer):
+    # One thread per connection, at most max_connections at once.
+    # Further clients briefly wait in the listen backlog, then get a 503, so long-lived
+    # responses (live viewers, tails, transcode streams) can't stall the accept loop.
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, server_address, handler, max_connections=32):
+        self.max_connections = max_connections
+        self.connection_slots = threading.BoundedSemaphore(max_connections)
+        super().__init__(server_address, handler)
+
+    def process_request(self, request, client_address):
+        if not self.connection_slots.acquire(timeout=CONNECTION_SLOT_WAIT):
+            logging.warning(f"All {self.max_connections} connections busy, 503 to {client_address[0]}")
+            try:
+                request.settimeout(CONNECTION_SLOT_WAIT)
+                request.sendall(SATURATED_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.connection_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.connection_slots.release()
+
+
+class PageTemplate:
+    # index.html split once at its {{PLACEHOLDERS}}, reloaded only when the file changes
+    PLACEHOLDER = re.compile(r"\{\{([A-Z_]+)\}\}")
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.lock = threading.Lock()
+        self.mtime_ns = None
+        self.parts = []
+
+    def compiled(self):
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        with self.lock:
+            if mtime_ns != self.mtime_ns:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    pieces = self.PLACEHOLDER.split(f.read())
+                # Alternating literal text and placeholder names
+                self.parts = [(pieces[i], pieces[i + 1] if i + 1 < len(pieces) else None)
+                              for i in range(0, len(pieces), 2)]
+                self.mtime_ns = mtime_ns
+                logging.info(f"Template loaded: {self.path}")
+            return self.parts
+
+    @staticmethod
+    def render(parts, values):
+        for literal, name in parts:
+            yield literal
+            if name is None:
+                continue
+            value = values.get(name, '')
+            if isinstance(value, str):
+                yield value
+            else:
+                yield from value
+
 
 class VideoServer:
-    def __init__(self, html_template, port, directory, username=None, password_hash=None):
+    def __init__(self, html_template, port, directory, username=None, password_hash=None, media_index=None, probe_cache_size=4096,
+                 max_connections=32, connection_timeout=60, transcode_workers=1, transcode_idle_timeout=30,
+                 cache_max_bytes=10 * 1024 ** 3, cache_max_age=7 * 86400, transcode_mode='full',
+                 metrics=None, segment_index=None, thumbnails=None, live=None, activity=None):
         self.html_template = os.path.abspath(html_template)
+        self.page_template = PageTemplate(self.html_template)
         self.port = port
+        self.max_connections = max_connections
+        self.connection_timeout = connection_timeout
+        self.server = None
         self.directory = os.path.abspath(directory)
         self.cache_dir = os.path.join('.cache_recorder')
         self.username = username
         self.password_hash = password_hash
         os.makedirs(self.cache_dir, exist_ok=True)
+        self.media_index = media_index or MediaIndex(os.path.join(self.cache_dir, 'media_index.db'))
+        self.probe_cache = ProbeCache(self.media_index, probe_cache_size)
+        self.dir_index = DirectoryIndex(self.directory)
+        self.metrics = metrics
+        if segment_index is None:
+            # Standalone server, nobody feeds closed segments, build from disk once
+            segment_index = SegmentIndex(self.directory)
+            threading.Thread(target=segment_index.build, daemon=True).start()
+        self.segment_index = segment_index
+        self.thumbnails = thumbnails
+        self.live = live if live is not None else {}
+        self.activity = activity
+        self.transcode_cache = TranscodeCache(self.cache_dir, cache_max_bytes, cache_max_age)
+        self.transcoder = TranscodeScheduler(self.probe_cache, transcode_workers, transcode_idle_timeout,
+                                             on_complete=self.transcode_cache.add, mode=transcode_mode)
         logging.info(f"Serving directory: {self.directory}")
         logging.info(f"Cache directory: {self.cache_dir}")
 
@@ -35,33 +170,108 @@ class VideoServer:
         except (subprocess.CalledProcessError, FileNotFoundError):
             return False
 
-    def start(self):
-        handler = partial(
+    def make_handler(self):
+        return partial(
             self.CustomHandler, 
-            self.html_template, 
+            self.page_template,
             self.directory, 
             self.cache_dir,
             self.username,
-            self.password_hash
+            self.password_hash,
+            self.media_index,
+            self.probe_cache,
+            self.transcoder,
+            self.transcode_cache,
+            self.dir_index,
+            self.connection_timeout,
+            self.metrics,
+            self.segment_index,
+            self.thumbnails,
+            self.live,
+            self.activity
         )
-        server = HTTPServer(('', self.port), handler)
+
+    def start(self):
+        try:
+            self.server = BoundedThreadingHTTPServer(('', self.port), self.make_handler(), self.max_connections)
+        except OSError as e:
+            # Recording goes on without the webserver, a config reload tries to listen again
+            logging.error(f"Webserver cannot listen on port {self.port}: {e}")
+            return
         logging.info(f"Starting server on port {self.port}. http://localhost:{self.port}")
+        logging.info(f"Max connections: {self.max_connections}. Connection timeout: {self.connection_timeout}s")
+        self.serve()
+
+    def serve(self):
         try:
-            server.serve_forever()
+            while True:
+                server = self.server
+                server.serve_forever()
+                server.server_close()
+                # reconfigure() swaps in a listener on the new port before shutting this one down
+                if self.server is server:
+                    break
         except KeyboardInterrupt:
             logging.info("\nServer stopped")
-            server.server_close()
+            self.server.server_close()
 
-    class CustomHandler(BaseHTTPRequestHandler):
-        conversion_status = {}
-        conversion_lock = threading.Lock()
+    def reconfigure(self, port, username, password_hash, connection_timeout):
+        # Config reload: new requests see the new settings, open connections (live viewers, downloads)
+        # keep running on the handler and listener they were accepted with
+        self.username = username
+        self.password_hash = password_hash
+        self.connection_timeout = connection_timeout
+        if self.server is None:
+            # start() could not listen, try again (on the new port if it changed)
+            try:
+                self.server = BoundedThreadingHTTPServer(('', port), self.make_handler(), self.max_connections)
+            except OSError as e:
+                logging.warning(f"Webserver still cannot listen on port {port}: {e}")
+                return
+            self.port = port
+            threading.Thread(target=self.serve, name="webserver", daemon=True).start()
+            logging.info(f"Webserver started on port {self.port}. http://localhost:{self.port}")
+            return
+        if port == self.port:
+            self.server.RequestHandlerClass = self.make_handler()
+            logging.info(f"Webserver settings updated on port {self.port}")
+            return
+        try:
+            server = BoundedThreadingHTTPServer(('', port), self.make_handler(), self.max_connections)
+        except OSError as e:
+            logging.error(f"Webserver cannot listen on port {port}, staying on {self.port}: {e}")
+            self.server.RequestHandlerClass = self.make_handler()
+            return
+        previous, self.server, self.port = self.server, server, port
+        # start() closes it once serve_forever returns, the caller (recorder main loop) never waits on HTTP
+        threading.Thread(target=previous.shutdown, name="webserver-shutdown", daemon=True).start()
+        logging.info(f"Webserver moved to port {self.port}. http://localhost:{self.port}")
 
-        def __init__(self, html_template, directory, cache_dir, username, password_hash, *args, **kwargs):
-            self.html_template = html_template
+    class CustomHandler(BaseHTTPRequestHandler):
+        # Keep-alive lets a player reuse one connection for its Range requests
+        protocol_version = 'HTTP/1.1'
+        use_sendfile = hasattr(os, 'sendfile')
+
+        def __init__(self, page_template, directory, cache_dir, username, password_hash, media_index, probe_cache,
+                     transcoder, transcode_cache, dir_index, connection_timeout, metrics, segment_index,
+                     thumbnails, live, activity, *args, **kwargs):
+            self.page_template = page_template
             self.base_directory = directory
             self.cache_dir = cache_dir
             self.auth_username = username
             self.auth_password_hash = password_hash
+            self.media_index = media_index
+            self.probe_cache = probe_cache
+            self.transcoder = transcoder
+            self.transcode_cache = transcode_cache
+            self.dir_index = dir_index
+            self.metrics = metrics
+            self.segment_index = segment_index
+            self.thumbnails = thumbnails
+            self.live = live
+            self.activity = activity
+            # Applied to the socket in setup(), covers idle keep-alive and stalled clients
+            self.timeout = connection_timeout
             super().__init__(*args, **kwargs)
 
         def check_authentication(self):
@@ -94,11 +304,13 @@ class VideoServer:
 
         # Request auth
         def require_authentication(self):
+            body = b'<html><body><h1>401 Unauthorized</h1><p>Access denied. Please provide valid credentials.</p></body></html>'
             self.send_response(401)
             self.send_header('WWW-Authenticate', 'Basic realm="RTSP ARCHIVE"')
             self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(b'<html><body><h1>401 Unauthorized</h1><p>Access denied. Please provide valid credentials.</p></body></html>')
+            self.wfile.write(body)
 
         def do_HEAD(self):
             if not self.check_authentication():
@@ -121,112 +333,253 @@ class VideoServer:
                 if '?dir=' in self.path:
                     current_dir = unquote(self.path.split('?dir=')[1])
 
-                self.send_response(200)
-                self.send_header("Content-Type", "text/html; charset=utf-8")
-                self.end_headers()
-                self.wfile.write(self._render_main_page(current_dir).encode('utf-8'))
+                self.send_main_page(current_dir)
             elif self.path.startswith('/videos/'):
                 file_path = unquote(self.path[8:].split('?')[0])
                 if '?download=1' in self.path:
                     self.send_download_file(file_path)
                 else:
-                    self.send_video_file(file_path)
+                    self.send_video_file(file_path, stream='stream=1' in self.path, from_newest='live=1' in self.path)
             elif self.path.startswith('/status/'):
                 file_path = unquote(self.path[8:])
                 self.send_conversion_status(file_path)
+            elif self.path.startswith('/api/list'):
+                self.send_listing(urlsplit(self.path).query)
+            elif self.path == '/api/cameras':
+                self.send_json_response(200, {'cameras': self.segment_index.summary()})
+            elif self.path.startswith('/api/timeline?'):
+                self.send_timeline(urlsplit(self.path).query)
+            elif self.path.startswith('/api/seek?'):
+                self.send_seek(urlsplit(self.path).query)
+            elif self.path.startswith('/thumbs/') or self.path.startswith('/sprites/'):
+                route, _, file_path = self.path[1:].partition('/')
+                self.send_thumbnail(unquote(file_path.split('?')[0]), 'thumb' if route == 'thumbs' else 'sprite')
+            elif self.path == '/api/live':
+                self.send_json_response(200, {'cameras': {name: stream.stats() for name, stream in sorted(self.live.items())}})
+            elif self.path.startswith('/live/'):
+                self.send_live(unquote(self.path[6:].split('?')[0]))
+            elif self.path == '/metrics':
+                self.send_metrics()
+            elif self.path.startswith('/export?'):
+                self.send_export(urlsplit(self.path).query)
             else:
                 self.send_error(404, "File Not Found")
 
-        def get_all_video_files(self, start_dir=''):
-            full_path = os.path.join(self.base_directory, start_dir) if start_dir else self.base_directory
-            items = []
-            video_extensions = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.mpg', '.mpeg'}
-
+        def _recording_for(self, items):
+            # Segment still being recorded as fragmented MP4: path -> {codec, size}. A folder holds one
+            # camera, so only its newest file can be open; the index keeps its mtime current, so older
+            # rows cost no syscalls and a folder nobody writes to costs none at all
+            files = [item for item in items if item['type'] == 'file']
+            if not files:
+                return {}
+            newest = max(files, key=lambda item: item['mtime'])
+            if time.time() - newest['mtime'] > GROWING_IDLE:
+                return {}
             try:
-                entries = sorted(os.listdir(full_path))
-                for entry in entries:
-                    if entry.startswith('.'):
-                        continue
-                    entry_full_path = os.path.join(full_path, entry)
-                    entry_rel_path = os.path.join(start_dir, entry) if start_dir else entry
-
-                    if os.path.isdir(entry_full_path):
-                        items.append({
-                            'type': 'directory',
-                            'name': entry,
-                            'path': entry_rel_path,
-                            'full_path': entry_full_path
-                        })
-                    elif os.path.isfile(entry_full_path):
-                        ext = os.path.splitext(entry)[1].lower()
-                        if ext in video_extensions:
-                            items.append({
-                                'type': 'file',
-                                'name': entry,
-                                'path': entry_rel_path,
-                                'full_path': entry_full_path,
-                                'size': os.path.getsize(entry_full_path)
-                            })
+                stat = os.stat(newest['full_path'])
+            except OSError:
+                return {}
+            layout = self.growing_layout(newest['full_path'], stat)
+            if not layout:
+                return {}
+            return {newest['path']: {'codec': self.init_codec(layout[0]), 'size': stat.st_size}}
+
+        def _codecs_for(self, current_dir, items, recording=None):
+            # Codecs for the whole folder from one index query, no ffprobe per row
+            full_dir = os.path.join(self.base_directory, current_dir) if current_dir else self.base_directory
+            indexed = self.media_index.lookup_dir(full_dir)
+            codecs = {}
+            for item in items:
+                if item['type'] != 'file':
+                    continue
+                if recording and item['path'] in recording:
+                    # Probed once it is closed
+                    codecs[item['path']] = recording[item['path']]['codec']
+                    continue
+                row = indexed.get(os.path.abspath(item['full_path']))
+                if MediaIndex.is_current(row, item['stat']):
+                    codecs[item['path']] = codec_label(row['codec'])
+                else:
+                    # Not indexed yet, probe in background for the next page load
+                    self.media_index.request_probe(item['full_path'])
+                    codecs[item['path']] = 'Unknown'
+            return codecs
+
+        def _activity_for(self, current_dir, items):
+            # Activity summaries for the folder from one index query, None where not analyzed
+            if self.activity is None:
+                return {}
+            full_dir = os.path.join(self.base_directory, current_dir) if current_dir else self.base_directory
+            indexed = self.activity.lookup_dir(full_dir)
+            return {
+                item['path']: self.activity.summary(indexed.get(os.path.abspath(item['full_path'])), item['stat'])
+                for item in items if item['type'] == 'file'
+            }
+
+        def _activity_page(self, current_dir, offset, limit, sort, reverse, min_activity):
+            # Filtering and sorting on activity need the whole folder's scores, not just one page
+            items = self.dir_index.listing(current_dir)
+            activity = self._activity_for(current_dir, items)
+            directories = [item for item in items if item['type'] == 'directory']
+            files = [item for item in items if item['type'] == 'file'
+                     and (not min_activity or (activity.get(item['path']) or {}).get('peak', 0) >= min_activity)]
+            if sort == 'activity':
+                def activity_key(item):
+                    summary = activity.get(item['path']) or {}
+                    return summary.get('active_seconds', -1), summary.get('peak', -1), item['name']
+                files.sort(key=activity_key, reverse=reverse)
+            else:
+                files.sort(key=lambda item: (item.get(sort, 0), item['name']), reverse=reverse)
+            items = directories + files
+            return {'total': len(items), 'items': items[offset:offset + limit]}, activity
+
+        @staticmethod
+        def _render_activity(activity):
+            if activity is None:
+                return ""
+            jumps = "".join(
+                f"<a class='activity-jump' onclick='jumpToActivity(event, this, {start})'>{start // 60}:{start % 60:02d}</a>"
+                for start, _ in activity['spans'][:3]
+            )
+            return (
+                f"<span class='activity-bar' title='{activity['active_seconds']} s active, peak {activity['peak']}%'>"
+                f"<span style='width: {activity['peak']}%'></span></span>{jumps}"
+            )
+
+        def _render_row(self, item, codec, activity=None, recording=None):
+            if item['type'] == 'directory':
+                dir_url = f"/?dir={quote(item['path'])}"
+                return (
+                    f"<tr class='directory-row' onclick=\"window.location.href='{dir_url}'\" style='cursor: pointer;'>"
+                    f"<td><span class='folder-icon'>📁</span> <strong>{item['name']}</strong></td>"
+                    f"<td colspan='4'><em>Folder</em></td>"
+                    f"</tr>"
+                )
 
+            file_url = f"/videos/{quote(item['path'])}"
+            download_url = f"/videos/{quote(item['path'])}?download=1"
+            size_mb = (recording or item)['size'] / (1024 * 1024)
+            codec_badge = f'<span class="codec-badge codec-{codec.lower().replace(".", "")}">{codec}</span>'
+            # A segment still being recorded plays from its newest fragment on
+            play_url = f"{file_url}?live=1" if recording else file_url
+            rec_badge = "<span class='rec-badge'>● REC</span> " if recording else ""
+            return (
+                f"<tr id='row-{quote(item['path'])}' onclick=\"playVideo('{play_url}', '{item['name']}', '{item['path']}', this)\" style='cursor: pointer;'>"
+                f"<td><span class='thumb' data-path='{quote(item['path'])}'><img src='/thumbs/{quote(item['path'])}' loading='lazy' alt='' onerror='retryThumb(this)'></span>"
+                f"<span class='play-btn'>▶ {rec_badge}{item['name']}</span></td>"
+                f"<td>{size_mb:.1f} MB</td>"
+                f"<td>{codec_badge}</td>"
+                f"<td>{self._render_activity(activity)}</td>"
+                f"<td style='text-align: center;' onclick='event.stopPropagation();'><a href='{download_url}' class='download-link'>&#128190;</a></td>"
+                f"</tr>"
+            )
+
+        def send_main_page(self, current_dir=''):
+            try:
+                parts = self.page_template.compiled()
             except Exception as e:
-                logging.info(f"Error listing directory {full_path}: {e}")
-            return items
-
-        def _render_main_page(self, current_dir=''):
-            items = self.get_all_video_files(current_dir)
-            breadcrumbs = self._generate_breadcrumbs(current_dir)
-            video_table_rows = ""
+                logging.info(f"Error reading template: {e}")
+                body = f"<html><body><h1>Error loading template</h1><p>{e}</p></body></html>".encode('utf-8')
+                self.send_response(500)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
 
+            # Page goes out in chunks as rows are produced
+            self.start_chunked(200, "text/html; charset=utf-8")
+            pending = []
+            pending_size = 0
+            for piece in self._render_main_page(parts, current_dir):
+                data = piece.encode('utf-8')
+                pending.append(data)
+                pending_size += len(data)
+                if pending_size >= PAGE_CHUNK_SIZE:
+                    self.write_chunk(b"".join(pending))
+                    pending = []
+                    pending_size = 0
+            self.write_chunk(b"".join(pending))
+            self.end_chunked()
+
+        def _render_main_page(self, parts, current_dir=''):
+            # First page only, the table fetches the rest from /api/list while scrolling
+            page = self.dir_index.page(current_dir, 0, PAGE_SIZE)
+            items = page['items']
+
+            listing_state = json.dumps({
+                'dir': current_dir,
+                'loaded': len(items),
+                'total': page['total'],
+                'page_size': PAGE_SIZE,
+                'activity_threshold': self.activity.threshold if self.activity else None
+            })
+
+            return PageTemplate.render(parts, {
+                'BREADCRUMBS': self._generate_breadcrumbs(current_dir),
+                'VIDEO_TABLE_ROWS': self._iter_rows(current_dir, items),
+                'LISTING_STATE': listing_state.replace("</", "<\\/")
+            })
+
+        def _iter_rows(self, current_dir, items):
             if current_dir:
                 parent_dir = os.path.dirname(current_dir)
                 parent_url = f"/?dir={quote(parent_dir)}" if parent_dir else "/"
-                video_table_rows += (
-                    f"<tr class='directory-row' onclick=\"window.location.href='{parent_url}'\" style='cursor: pointer;'>"
+                yield (
+                    f"<tr class='directory-row parent-row' onclick=\"window.location.href='{parent_url}'\" style='cursor: pointer;'>"
                     f"<td><span class='folder-icon'>📁</span> <strong>..</strong> (Parent Directory)</td>"
-                    f"<td colspan='3'></td>"
+                    f"<td colspan='4'></td>"
                     f"</tr>"
                 )
 
             # Build file tree
+            recording = self._recording_for(items)
+            codecs = self._codecs_for(current_dir, items, recording)
+            activity = self._activity_for(current_dir, items)
             for item in items:
-                if item['type'] == 'directory':
-                    dir_url = f"/?dir={quote(item['path'])}"
-                    video_table_rows += (
-                        f"<tr class='directory-row' onclick=\"window.location.href='{dir_url}'\" style='cursor: pointer;'>"
-                        f"<td><span class='folder-icon'>📁</span> <strong>{item['name']}</strong></td>"
-                        f"<td colspan='3'><em>Folder</em></td>"
-                        f"</tr>"
-                    )
-
-            for item in items:
-                if item['type'] == 'file':
-                    file_url = f"/videos/{quote(item['path'])}"
-                    download_url = f"/videos/{quote(item['path'])}?download=1"
-                    size_mb = item['size'] / (1024 * 1024)
-
-                    # Detect codec
-                    codec = self.get_video_codec(item['full_path'])
-                    codec_badge = f'<span class="codec-badge codec-{codec.lower().replace(".", "")}">{codec}</span>'
-                    video_table_rows += (
-                        f"<tr id='row-{quote(item['path'])}' onclick=\"playVideo('{file_url}', '{item['name']}', '{item['path']}', this)\" style='cursor: pointer;'>"
-                        f"<td><span class='play-btn'>▶ {item['name']}</span></td>"
-                        f"<td>{size_mb:.1f} MB</td>"
-                        f"<td>{codec_badge}</td>"
-                        f"<td style='text-align: center;' onclick='event.stopPropagation();'><a href='{download_url}' class='download-link'>&#128190;</a></td>"
-                        f"</tr>"
-                    )
-
+                yield self._render_row(item, codecs.get(item['path']), activity.get(item['path']),
+                                       recording.get(item['path']))
+
+        def send_listing(self, query):
+            # JSON page of a folder: /api/list?dir=&offset=&limit=&sort=name|size|mtime|activity&order=asc|desc
+            # &min_activity= keeps files whose peak activity reaches it
+            params = parse_qs(query)
+            current_dir = params.get('dir', [''])[0]
             try:
-                with open(self.html_template, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
-            except Exception as e:
-                logging.info(f"Error reading template: {e}")
-                return f"<html><body><h1>Error loading template</h1><p>{e}</p></body></html>"
-
-            html_content = html_content.replace("{{BREADCRUMBS}}", breadcrumbs)
-            html_content = html_content.replace("{{VIDEO_TABLE_ROWS}}", video_table_rows)
+                offset = max(int(params.get('offset', ['0'])[0]), 0)
+                limit = min(max(int(params.get('limit', [str(PAGE_SIZE)])[0]), 1), MAX_PAGE_SIZE)
+                min_activity = int(params.get('min_activity', ['0'])[0])
+            except ValueError:
+                self.send_error(400, "Bad offset, limit or min_activity")
+                return
+            sort = params.get('sort', ['name'])[0]
+            reverse = params.get('order', ['asc'])[0] == 'desc'
 
-            return html_content
+            if self.activity is not None and (sort == 'activity' or min_activity):
+                page, activity = self._activity_page(current_dir, offset, limit, sort, reverse, min_activity)
+            else:
+                page = self.dir_index.page(current_dir, offset, limit, sort, reverse)
+                activity = self._activity_for(current_dir, page['items'])
+            recording = self._recording_for(page['items'])
+            codecs = self._codecs_for(current_dir, page['items'], recording)
+            self.send_json_response(200, {
+                'dir': current_dir,
+                'offset': offset,
+                'total': page['total'],
+                'items': [
+                    {
+                        'type': item['type'],
+                        'name': item['name'],
+                        'path': item['path'],
+                        'size': recording[item['path']]['size'] if item['path'] in recording else item.get('size'),
+                        'mtime': item.get('mtime'),
+                        'codec': codecs.get(item['path']),
+                        'activity': activity.get(item['path']),
+                        'recording': item['path'] in recording
+                    }
+                    for item in page['items']
+                ]
+            })
 
         def _generate_breadcrumbs(self, current_dir):
             if not current_dir:
@@ -239,50 +592,38 @@ class VideoServer:
                 breadcrumbs += f' / <a href="/?dir={quote(path_accumulator)}">{part}</a>'
             return breadcrumbs
 
-        def get_video_codec(self, file_path):
-
+        @staticmethod
+        def growing_layout(file_path, stat=None):
+            # fragmented_layout() of a segment the recorder is still writing (recording container: fmp4), else None
             try:
-                result = subprocess.run([
-                    'ffprobe', '-v', 'error',
-                    '-select_streams', 'v:0',
-                    '-show_entries', 'stream=codec_name',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    file_path
-                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=5)
-
-                codec = result.stdout.strip().lower()
-                codec_map = {
-                    'hevc': 'H.265',
-                    'h265': 'H.265',
-                    'h264': 'H.264',
-                    'vp9': 'VP9',
-                    'vp8': 'VP8'
-                }
-                return codec_map.get(codec, codec.upper() if codec else 'Unknown')
-            except:
-                return 'Unknown'
+                stat = stat or os.stat(file_path)
+                if time.time() - stat.st_mtime > GROWING_IDLE:
+                    return None
+                layout = fragmented_layout(file_path)
+            except OSError:
+                return None
+            if layout is None or layout[2]:
+                return None
+            return layout
+
+        @staticmethod
+        def init_codec(init):
+            # Codec label from the init segment, a growing file can't be probed for good
+            entry = (codec_string(init) or '')[:4]
+            return codec_label(SAMPLE_ENTRY_CODECS.get(entry, entry))
 
         def needs_conversion(self, file_path):
+            # H.265 is re-encoded, MPEG-TS segments (recording container: ts) remuxed to MP4
+            if os.path.splitext(file_path)[1].lower() in REMUX_EXTENSIONS:
+                return True
             try:
-                result = subprocess.run([
-                    'ffprobe', '-v', 'error',
-                    '-select_streams', 'v:0',
-                    '-show_entries', 'stream=codec_name',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    file_path
-                ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=5)
-
-                codec = result.stdout.strip().lower()
-                return codec in ['hevc', 'h265']
+                info = self.probe_cache.get(file_path)
+                return bool(info) and info['codec'] in ['hevc', 'h265']
             except:
                 return False
 
         def get_cache_path(self, original_path):
-            file_hash = hashlib.md5(original_path.encode()).hexdigest()[:8]
-            file_stat = os.stat(original_path)
-            time_hash = hashlib.md5(str(file_stat.st_mtime).encode()).hexdigest()[:8]
-            base_name = os.path.splitext(os.path.basename(original_path))[0]
-            return os.path.join(self.cache_dir, f"{base_name}_{file_hash}_{time_hash}_h264.mp4")
+            return self.transcode_cache.path_for(original_path)
 
         def check_video_status(self, file_path):
             try:
@@ -290,51 +631,29 @@ class VideoServer:
                 if not os.path.exists(original_path):
                     self.send_error(404, "File not found")
                     return
-                if self.needs_conversion(original_path):
+                if self.growing_layout(original_path):
+                    # Length unknown until the recorder closes it
+                    self.start_chunked(200, "video/mp4", {"Cache-Control": "no-store"})
+                elif self.needs_conversion(original_path):
                     cache_path = self.get_cache_path(original_path)
                     
                     # If file already in cache
-                    if os.path.exists(cache_path):
-                        self.send_response(200)
-                        self.send_header("Content-Type", "video/mp4")
-                        self.send_header("Content-Length", str(os.path.getsize(cache_path)))
-                        self.end_headers()
+                    if self.transcode_cache.lookup(cache_path):
+                        self.send_file(cache_path, "video/mp4", head_only=True)
                     else:
-                        # Encoding status
-                        with self.conversion_lock:
-                            status = self.conversion_status.get(file_path, {})
-
-                            if status.get('converting'):
-                                # Send message of encoding
-                                self.send_response(202)
-                                self.send_header("Content-Type", "application/json")
-                                self.end_headers()
-                            else:
-                                self.conversion_status[file_path] = {
-                                    'converting': True,
-                                    'progress': 0
-                                }
-
-                                # Start ffmpeg thread
-                                threading.Thread(
-                                    target=self.convert_video,
-                                    args=(original_path, cache_path, file_path),
-                                    daemon=True
-                                ).start()
-
-                                self.send_response(202)  
-                                self.send_header("Content-Type", "application/json")
-                                self.end_headers()
+                        # Speculative, a click on the row will jump the queue
+                        self.transcoder.submit(file_path, original_path, cache_path, PRIORITY_SPECULATIVE)
+                        self.send_response(202)
+                        self.send_header("Content-Type", "application/json")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
                 else:
-                    self.send_response(200)
-                    self.send_header("Content-Type", "video/mp4")
-                    self.send_header("Content-Length", str(os.path.getsize(original_path)))
-                    self.end_headers()
+                    self.send_file(original_path, "video/mp4", head_only=True)
 
             except Exception as e:
                 self.send_error(500, "Internal Server Error")
 
-        def send_video_file(self, file_path):
+        def send_video_file(self, file_path, stream=False, from_newest=False):
             try:
                 original_path = os.path.join(self.base_directory, file_path)
 
@@ -342,199 +661,419 @@ class VideoServer:
                     self.send_error(404, "File not found")
                     return
 
+                layout = self.growing_layout(original_path)
+                if layout:
+                    self.send_growing_file(original_path, layout, from_newest)
+                    return
+
                 if self.needs_conversion(original_path):
                     cache_path = self.get_cache_path(original_path)
 
-                    if os.path.exists(cache_path):
+                    if self.transcode_cache.lookup(cache_path):
                         video_file_path = cache_path
                     else:
-                        with self.conversion_lock:
-                            status = self.conversion_status.get(file_path, {})
-
-                            if status.get('converting'):
-                                self.send_json_response(202, {
-                                    'status': 'converting',
-                                    'progress': status.get('progress', 0),
-                                    'message': 'Video is being converted. Please wait...'
-                                })
-                                return
-                            else:
-                                self.conversion_status[file_path] = {
-                                    'converting': True,
-                                    'progress': 0
-                                }
-
-                        threading.Thread(
-                            target=self.convert_video,
-                            args=(original_path, cache_path, file_path),
-                            daemon=True
-                        ).start()
-
+                        job = self.transcoder.streaming_job(file_path) if stream else None
+                        if job:
+                            self.send_transcode_stream(job, cache_path)
+                            return
+
+                        status = self.transcoder.submit(file_path, original_path, cache_path, PRIORITY_INTERACTIVE)
+                        message = 'Video is being converted. Please wait...'
+                        if status.get('queue_position'):
+                            message = f"Waiting for a free encoder, position {status['queue_position']} in queue..."
                         self.send_json_response(202, {
                             'status': 'converting',
-                            'progress': 0,
-                            'message': 'Starting video conversion...'
+                            'progress': status.get('progress', 0),
+                            'queue_position': status.get('queue_position', 0),
+                            'streamable': status.get('streamable', False),
+                            'message': message
                         })
                         return
                 else:
                     video_file_path = original_path
 
-                # Send file
-                file_size = os.path.getsize(video_file_path)
-                mime_type = 'video/mp4'
-                range_header = self.headers.get('Range')
-
-                if range_header:
-                    self.handle_range_request(video_file_path, file_size, mime_type, range_header)
-                else:
-                    self.send_response(200)
-                    self.send_header("Content-Type", mime_type)
-                    self.send_header("Content-Length", str(file_size))
-                    self.send_header("Accept-Ranges", "bytes")
-                    self.end_headers()
-
-                    with open(video_file_path, 'rb') as f:
-                        self.copyfile(f, self.wfile)
+                # Send original or transcoded file
+                self.send_file(video_file_path, 'video/mp4')
 
             except Exception as e:
+                # Body may be partially written, the connection can't be reused
+                self.close_connection = True
                 logging.info(f"Error sending video: {e}")
                 import traceback
                 traceback.print_exc()
 
-        def convert_video(self, input_path, output_path, file_path):
+        def send_growing_file(self, file_path, layout, from_newest=False):
+            # Segment still being recorded: what is on disk, then fragments as ffmpeg appends them, until
+            # it writes the trailer (mfra) or stops writing. from_newest starts at the newest fragment, near live
+            init, newest, _ = layout
+            with open(file_path, 'rb') as source:
+                self.start_chunked(200, 'video/mp4', {"Cache-Control": "no-store"})
+                if from_newest and newest is not None:
+                    self.write_chunk(init)
+                    source.seek(newest)
+                buffer = self.copy_buffer()
+                last_data = time.monotonic()
+                while True:
+                    n = source.readinto(buffer)
+                    if n:
+                        self.write_chunk(buffer[:n])
+                        last_data = time.monotonic()
+                        continue
+                    position = source.tell()
+                    if position >= 16 and os.pread(source.fileno(), 16, position - 16)[:8] == b'\x00\x00\x00\x10mfro':
+                        break
+                    if time.monotonic() - last_data > GROWING_IDLE:
+                        break
+                    time.sleep(GROWING_POLL)
+                self.end_chunked()
+
+        def send_transcode_stream(self, job, cache_path):
+            # Tail the fragmented MP4 while ffmpeg is still writing it
             try:
-                duration_cmd = [
-                    'ffprobe', '-v', 'error',
-                    '-show_entries', 'format=duration',
-                    '-of', 'default=noprint_wrappers=1:nokey=1',
-                    input_path
-                ]
-                duration_result = subprocess.run(duration_cmd, stdout=subprocess.PIPE, text=True)
-                try:
-                    total_duration = float(duration_result.stdout.strip())
-                except:
-                    total_duration = 0
-
-                # FFmpeg command
-                cmd = [
-                    'ffmpeg', '-i', input_path,
-                    '-c:v', 'libx264',          # H.264 codec
-                    '-preset', 'fast',          # Fast encoding profile
-                    '-crf', '23',               # Quality
-                    '-c:a', 'aac',              # AAC codec
-                    '-b:a', '128k',             # Audio bitrate
-                    '-movflags', '+faststart',  # Encoding profile optimize
-                    '-y',                       # Re-write file
-                    output_path
-                ]
+                source = open(job.stream_path, 'rb')
+            except FileNotFoundError:
+                # Finished between the status check and now
+                if self.transcode_cache.lookup(cache_path):
+                    self.send_file(cache_path, 'video/mp4')
+                else:
+                    self.send_error(404, "Transcode not available")
+                return
 
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True
-                )
+            with source:
+                self.start_chunked(200, 'video/mp4', {"Cache-Control": "no-store"})
+                buffer = self.copy_buffer()
+                finishing = False
+                while True:
+                    n = source.readinto(buffer)
+                    if n:
+                        self.write_chunk(buffer[:n])
+                        self.transcoder.touch(job)
+                        continue
+                    if finishing:
+                        break
+                    if not self.transcoder.is_active(job):
+                        # One more pass picks up whatever ffmpeg wrote last
+                        finishing = True
+                        continue
+                    if self.client_gone():
+                        self.close_connection = True
+                        return
+                    # A viewer waiting through a slow encoder start or the final remux still counts
+                    self.transcoder.touch(job)
+                    time.sleep(0.2)
+                self.end_chunked()
 
-                # Watching progress
-                for line in process.stderr:
-                    if 'time=' in line and total_duration > 0:
-                        try:
-                            time_str = line.split('time=')[1].split()[0]
-                            h, m, s = time_str.split(':')
-                            current_time = int(h) * 3600 + int(m) * 60 + float(s)
-                            progress = min(int((current_time / total_duration) * 100), 99)
-
-                            with self.conversion_lock:
-                                if file_path in self.conversion_status:
-                                    self.conversion_status[file_path]['progress'] = progress
-                        except:
-                            pass
+        def client_gone(self):
+            # Peer closed its side: the socket is readable with nothing to read
+            try:
+                readable, _, _ = select.select([self.connection], [], [], 0)
+                return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+            except OSError:
+                return True
 
-                process.wait()
+        def start_chunked(self, code, content_type, headers=None):
+            # Body of unknown length, chunked for HTTP/1.1, close-delimited otherwise
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.chunked = self.request_version == 'HTTP/1.1'
+            if self.chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            else:
+                self.close_connection = True
+            self.end_headers()
 
-                if process.returncode == 0:
-                    with self.conversion_lock:
-                        self.conversion_status[file_path] = {
-                            'converting': False,
-                            'progress': 100,
-                            'completed': True
-                        }
-                else:
-                    logging.info(f"✗ Conversion failed: {file_path}")
-                    if os.path.exists(output_path):
-                        os.remove(output_path)
-                    with self.conversion_lock:
-                        if file_path in self.conversion_status:
-                            del self.conversion_status[file_path]
+        def write_chunk(self, data):
+            if not data:
+                return
+            if self.chunked:
+                self.wfile.write(f"{len(data):X}\r\n".encode())
+                self.wfile.write(data)
+                self.wfile.write(b"\r\n")
+            else:
+                self.wfile.write(data)
 
-            except Exception as e:
-                logging.info(f"Error during conversion: {e}")
-                import traceback
-                traceback.print_exc()
-                with self.conversion_lock:
-                    if file_path in self.conversion_status:
-                        del self.conversion_status[file_path]
+        def end_chunked(self):
+            if self.chunked:
+                self.wfile.write(b"0\r\n\r\n")
 
         def send_conversion_status(self, file_path):
-            with self.conversion_lock:
-                status = self.conversion_status.get(file_path, {})
+            status = self.transcoder.status(file_path)
             if status.get('completed'):
-                self.send_json_response(200, {
-                    'status': 'completed',
-                    'progress': 100
-                })
+                response = {'status': 'completed', 'progress': 100}
             elif status.get('converting'):
-                self.send_json_response(200, {
+                response = {
                     'status': 'converting',
-                    'progress': status.get('progress', 0)
-                })
+                    'state': status['state'],
+                    'progress': status.get('progress', 0),
+                    'queue_position': status.get('queue_position', 0),
+                    'streamable': status.get('streamable', False),
+                    'wait_time': status['wait_time']
+                }
+            else:
+                response = {'status': 'ready', 'progress': 0}
+            response['transcoder'] = self.transcoder.stats()
+            response['transcode_cache'] = self.transcode_cache.stats()
+            response['probe_cache'] = self.probe_cache.stats()
+            self.send_json_response(200, response)
+
+        def send_thumbnail(self, file_path, kind):
+            # Never waits for ffmpeg, 202 while the image is generated in the background
+            rel_path, full_path = self.dir_index.resolve(file_path)
+            if self.thumbnails is None or rel_path is None or not os.path.isfile(full_path):
+                self.send_error(404, "Thumbnail not available")
+                return
+            state, image_path = self.thumbnails.lookup(full_path, kind)
+            if state == 'ready':
+                # Segments don't change once closed, neither do their images
+                self.send_file(image_path, 'image/jpeg', extra_headers={"Cache-Control": "public, max-age=31536000, immutable"})
+            elif state == 'pending':
+                self.send_response(202)
+                self.send_header("Retry-After", "2")
+                self.send_header("Cache-Control", "no-store")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
             else:
-                self.send_json_response(200, {
-                    'status': 'ready',
-                    'progress': 0
+                self.send_error(404, "Thumbnail not available")
+
+        def send_timeline(self, query):
+            # Recorded spans of one camera for the timeline bar
+            params = parse_qs(query)
+            camera = params.get('camera', [''])[0]
+            try:
+                start = parse_time(params['start'][0])
+                end = parse_time(params['end'][0])
+            except (KeyError, ValueError):
+                self.send_json_response(400, {'error': 'start and end required, unix seconds or ISO 8601'})
+                return
+            if not 0 < end - start <= MAX_EXPORT_SECONDS * 7:
+                self.send_json_response(400, {'error': 'Invalid time range'})
+                return
+            spans = self.segment_index.coverage(camera, start, end)
+            self.send_json_response(200, {'camera': camera, 'start': start, 'end': end, 'spans': spans})
+
+        def send_seek(self, query):
+            # Segment and offset a camera was recording at time t
+            params = parse_qs(query)
+            camera = params.get('camera', [''])[0]
+            try:
+                when = parse_time(params['t'][0])
+            except (KeyError, ValueError):
+                self.send_json_response(400, {'error': 't required, unix seconds or ISO 8601'})
+                return
+
+            segment, offset = self.segment_index.locate(camera, when)
+            if segment is None:
+                # Next recording lets the page jump over the gap
+                self.send_json_response(404, {
+                    'error': 'No recording at this time',
+                    'next': self.segment_index.next_start(camera, when)
+                })
+                return
+
+            path = os.path.relpath(segment.path, self.base_directory)
+            self.send_json_response(200, {
+                'camera': camera,
+                'time': when,
+                'path': path,
+                'url': '/videos/' + quote(path),
+                'segment_start': segment.start,
+                'duration': segment.duration,
+                'offset': offset,
+                # Constant bitrate estimate, players seek by time
+                'byte_offset': int(segment.size * offset / segment.duration) if segment.duration else None
+            })
+
+        def send_export(self, query):
+            # One clip from consecutive segments, remuxed by ffmpeg and piped out as it is produced
+            params = parse_qs(query)
+            camera = params.get('camera', [''])[0]
+            export_format = params.get('format', ['mp4'])[0]
+            try:
+                start = parse_time(params['start'][0])
+                end = parse_time(params['end'][0])
+            except (KeyError, ValueError):
+                self.send_error(400, "start and end required, unix seconds or ISO 8601")
+                return
+            if export_format not in EXPORT_FORMATS or not 0 < end - start <= MAX_EXPORT_SECONDS:
+                self.send_error(400, "Invalid export format or time range")
+                return
+
+            segments = self.segment_index.range(camera, start, end)
+            if not segments:
+                self.send_error(404, "No recordings in this time range")
+                return
+
+            process = subprocess.Popen(export_command(export_format), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            try:
+                process.stdin.write(concat_list(segments, start, end).encode())
+                process.stdin.close()
+                data = process.stdout.read1(COPY_BUFFER_SIZE)
+                if not data:
+                    process.wait()
+                    self.close_connection = True
+                    self.send_error(500, "Export failed")
+                    return
+
+                stamp = time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(start))
+                file_name = re.sub(r'[^\w.-]', '_', f"{camera}_{stamp}.{export_format}")
+                self.start_chunked(200, EXPORT_FORMATS[export_format][0], {
+                    "Content-Disposition": f'attachment; filename="{file_name}"',
+                    "Cache-Control": "no-store"
+                })
+                while data:
+                    self.write_chunk(data)
+                    data = process.stdout.read1(COPY_BUFFER_SIZE)
+                self.end_chunked()
+                logging.info(f"Export {camera} {stamp} {end - start:.0f} s from {len(segments)} segments")
+            except (BrokenPipeError, ConnectionResetError):
+                # Client went away (or ffmpeg refused the list), stop remuxing
+                self.close_connection = True
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+
+        def send_live(self, camera):
+            # Endless fragmented MP4 from the camera's ring, every viewer shares the recorder's ingest
+            live = self.live.get(camera)
+            if live is None:
+                self.send_error(404, "No live view for this camera")
+                return
+            live.attach()
+            try:
+                cursor, chunks = live.read(None, LIVE_WAIT)
+                if not chunks:
+                    self.send_error(503, "Camera is not streaming")
+                    return
+                self.start_chunked(200, 'video/mp4', {
+                    "Cache-Control": "no-store",
+                    "X-Codec": live.codec or ''
                 })
+                while chunks:
+                    for chunk in chunks:
+                        self.write_chunk(chunk)
+                    self.wfile.flush()
+                    cursor, chunks = live.read(cursor, LIVE_WAIT)
+                    if cursor is None:
+                        # ffmpeg restarted, the player needs the new init segment
+                        break
+                self.end_chunked()
+            except OSError:
+                # Viewer went away or stopped reading
+                self.close_connection = True
+            finally:
+                live.detach()
+
+        def send_metrics(self):
+            if self.metrics is None:
+                self.send_error(404, "Metrics not available")
+                return
+            body = self.metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
 
         def send_json_response(self, code, data):
-            import json
+            body = json.dumps(data).encode()
             self.send_response(code)
             self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
             self.end_headers()
-            self.wfile.write(json.dumps(data).encode())
-
-        def handle_range_request(self, file_path, file_size, mime_type, range_header):
-            try:
-                ranges = range_header.strip().lower().replace('bytes=', '').split('-')
-                start = int(ranges[0]) if ranges[0] else 0
-                end = int(ranges[1]) if ranges[1] else file_size - 1
+            self.wfile.write(body)
+
+        def send_file(self, file_path, mime_type, head_only=False, extra_headers=None):
+            # Conditional and Range aware file response (200, 206, 304, 416)
+            with open(file_path, 'rb') as f:
+                file_stat = os.fstat(f.fileno())
+                file_size = file_stat.st_size
+                etag = make_etag(file_stat)
+                headers = {
+                    "ETag": etag,
+                    "Last-Modified": http_date(file_stat.st_mtime),
+                    "Accept-Ranges": "bytes"
+                }
+                headers.update(extra_headers or {})
 
-                if start >= file_size or start < 0:
-                    self.send_error(416, "Requested Range Not Satisfiable")
+                if is_not_modified(self.headers, etag, file_stat.st_mtime):
+                    self.send_response(304)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
                     return
 
-                if end >= file_size:
-                    end = file_size - 1
+                ranges = None
+                if range_applies(self.headers, etag, file_stat.st_mtime):
+                    ranges = parse_range(self.headers.get('Range'), file_size)
+
+                if ranges is None:
+                    self.send_response(200)
+                    self.send_header("Content-Type", mime_type)
+                    self.send_header("Content-Length", str(file_size))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    if not head_only:
+                        self.send_file_range(f, 0, file_size)
+                elif not ranges:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{file_size}")
+                    self.send_header("Content-Length", "0")
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                else:
+                    self.handle_range_request(f, file_size, mime_type, ranges, headers, head_only)
+
+        def handle_range_request(self, source, file_size, mime_type, ranges, headers, head_only=False):
+            try:
+                if len(ranges) == 1:
+                    start, end = ranges[0]
+                    self.send_response(206)
+                    self.send_header("Content-Type", mime_type)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+                    self.send_header("Content-Length", str(end - start + 1))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    if not head_only:
+                        self.send_file_range(source, start, end - start + 1)
+                    return
 
-                content_length = end - start + 1
+                # multipart/byteranges, part headers are known up front so Content-Length is exact
+                boundary = uuid.uuid4().hex
+                part_headers = [
+                    (f"--{boundary}\r\nContent-Type: {mime_type}\r\n"
+                     f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n").encode()
+                    for start, end in ranges
+                ]
+                closing = f"--{boundary}--\r\n".encode()
+                content_length = len(closing) + sum(
+                    len(part) + (end - start + 1) + 2 for part, (start, end) in zip(part_headers, ranges)
+                )
 
                 self.send_response(206)
-                self.send_header("Content-Type", mime_type)
-                self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+                self.send_header("Content-Type", f"multipart/byteranges; boundary={boundary}")
                 self.send_header("Content-Length", str(content_length))
-                self.send_header("Accept-Ranges", "bytes")
+                for name, value in headers.items():
+                    self.send_header(name, value)
                 self.end_headers()
+                if head_only:
+                    return
 
-                with open(file_path, 'rb') as f:
-                    f.seek(start)
-                    remaining = content_length
-                    while remaining > 0:
-                        chunk_size = min(8192, remaining)
-                        data = f.read(chunk_size)
-                        if not data:
-                            break
-                        self.wfile.write(data)
-                        remaining -= len(data)
+                for part, (start, end) in zip(part_headers, ranges):
+                    self.wfile.write(part)
+                    self.send_file_range(source, start, end - start + 1)
+                    self.wfile.write(b"\r\n")
+                self.wfile.write(closing)
 
             except Exception as e:
+                # Body may be partially written, the connection can't be reused
+                self.close_connection = True
                 logging.info(f"Error handling range request: {e}")
 
         # Download original file
@@ -546,26 +1085,45 @@ class VideoServer:
                     self.send_error(404, "File not found")
                     return
 
-                file_size = os.path.getsize(full_path)
-
-                self.send_response(200)
-                self.send_header("Content-Type", "application/octet-stream")
-                self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(full_path)}"')
-                self.send_header("Content-Length", str(file_size))
-                self.end_headers()
-
-                with open(full_path, 'rb') as f:
-                    self.copyfile(f, self.wfile)
+                self.send_file(full_path, "application/octet-stream", extra_headers={
+                    "Content-Disposition": f'attachment; filename="{os.path.basename(full_path)}"'
+                })
 
             except Exception as e:
+                # Body may be partially written, the connection can't be reused
+                self.close_connection = True
                 logging.info(f"Error sending download: {e}")
 
-        def copyfile(self, source, outputfile):
-            while True:
-                buf = source.read(8192)
-                if not buf:
+        def send_file_range(self, source, offset, count):
+            # Kernel copies page cache straight to the socket, no Python buffers
+            if self.use_sendfile:
+                sent = self.connection.sendfile(source, offset, count)
+            else:
+                sent = self.copy_file_range(source, offset, count)
+
+            if sent < count:
+                # File shrank under us, the promised Content-Length can't be met
+                self.close_connection = True
+            return sent
+
+        @staticmethod
+        def copy_buffer():
+            buffer = getattr(copy_buffers, 'view', None)
+            if buffer is None:
+                buffer = copy_buffers.view = memoryview(bytearray(COPY_BUFFER_SIZE))
+            return buffer
+
+        def copy_file_range(self, source, offset, count):
+            buffer = self.copy_buffer()
+            source.seek(offset)
+            sent = 0
+            while sent < count:
+                n = source.readinto(buffer[:min(COPY_BUFFER_SIZE, count - sent)])
+                if not n:
                     break
-                outputfile.write(buf)
+                self.wfile.write(buffer[:n])
+                sent += n
+            return sent
 
 if __name__ == "__main__":
     print("It's server class")